@@ -3,72 +3,184 @@ import openai
 import os
 from dotenv import load_dotenv
 import pandas as pd
-from utils.faiss_utils import get_embedding
+from utils.faiss_utils import (
+    EmbeddingCheckpoint,
+    add_in_batches,
+    default_nlist,
+    embed_in_batches,
+    load_faiss_index,
+    save_faiss_index,
+    set_search_params,
+    train_faiss_index,
+)
+from utils.index_sync import (
+    build_index_manifest,
+    chunk_hashes,
+    diff_index_manifest,
+    load_index_manifest,
+    save_index_manifest,
+    sync_faiss_index,
+)
+from utils.async_embedding import AsyncEmbeddingRunner
+from utils.embedding_cache import EmbeddingCache, embed_with_cache
+from functools import partial
+from utils.chunking import load_chunk_text_accessor
+from utils.chunk_store import (
+    CHUNK_STORE_PATH,
+    chunk_store_exists,
+    chunk_text_columns,
+    read_chunks,
+)
 from openai import OpenAI
 import faiss
 import numpy as np
 
 
-def load_faiss_index(index_path: str, dim: int) -> faiss.IndexIDMap:
+def embedding_batches(df, chunk_text, embed_batches, cache, model):
     """
-    Load a FAISS index if it exists, else create a new one.
-    Wraps an IndexFlatL2 inside an IndexIDMap for ID-based additions.
-
-    Args:
-        index_path: Path to .index file on disk.
-        dim: Dimension of embedding vectors.
-
-    Returns:
-        An IndexIDMap for adding/querying vectors with IDs.
-    """
-    if os.path.exists(index_path):
-        print(f"Loading existing FAISS index from '{index_path}'...")
-        index = faiss.read_index(index_path)
-    else:
-        print(f"Creating new FAISS index of dimension {dim}...")
-        flat_index = faiss.IndexFlatL2(dim)
-        index = faiss.IndexIDMap(flat_index)
-    return index
-
-
-def save_faiss_index(index: faiss.Index, index_path: str):
-    """
-    Write the FAISS index back to disk.
+    df 행들의 (batch_ids, batch_vectors). cache가 있으면 캐시에 없는 텍스트만 embed_batches로 보냄
     """
-    faiss.write_index(index, index_path)
-    print(f"FAISS index saved to '{index_path}'.")
+    texts = chunk_text.iter_texts(df)
+    if cache is None:
+        return embed_batches(df["global_id"], texts)
+    return embed_with_cache(df["global_id"], texts, cache, embed_batches, model=model)
 
 
 if __name__ == "__main__":
     load_dotenv()
-    csv_file_path = "./data/ustr_chunked.csv"
-    # 파일이 없을 경우에만 다운로드
-    chunked_df = pd.read_csv(csv_file_path, encoding="utf-8", delimiter=",")
+    if not chunk_store_exists(CHUNK_STORE_PATH):
+        print("preprocess.py를 먼저 실행시키세요")
+        exit()
+    # 임베딩에 필요한 컬럼만 읽음
+    chunked_df = read_chunks(CHUNK_STORE_PATH, columns=chunk_text_columns(CHUNK_STORE_PATH))
+    chunk_text = load_chunk_text_accessor(
+        chunked_df, "./data/ustr_2023_press_releases_tailed.csv"
+    )
     client = OpenAI(api_key=os.getenv("TEAM1_OPENAI_API_KEY"))
     VECTOR_DIM = 1536
     INDEX_FILE = "./faiss/idmap.index"
-    BASE_INDEX_FILE = "./faiss/flatl2.index"
-    index = load_faiss_index(INDEX_FILE, dim=VECTOR_DIM)
-    embeddings_list = []
-    ids_list = []
-    for _, row in chunked_df.iterrows():
-        gid = int(row["global_id"])
-        text = row["chunk_text"]
-        vec = get_embedding(text, client=client, model="text-embedding-3-small")
-        embeddings_list.append(vec)
-        ids_list.append(gid)
-        print(f"Processed global_id={gid}")
-
-    # Stack into arrays
-    all_vecs = np.vstack(embeddings_list).astype("float32")  # shape (N, dim)
-    all_ids = np.array(ids_list, dtype="int64")  # shape (N,)
-
-    # Batch add to FAISS
-    index.add_with_ids(all_vecs, all_ids)
-    print(f"Added {len(all_ids)} vectors to index in batch.")
+    # 임베딩 결과를 바로 쓰는 memmap 파일 (+ .ids.npy, .ckpt.json), 재실행 시 이어서 진행
+    VECTORS_FILE = "./faiss/vectors.npy"
+    INDEX_ADD_BATCH = int(os.getenv("INDEX_ADD_BATCH", 50_000))
+    # flat | ivf_flat | ivf_pq | hnsw | fp16 | sq8 | pq (bench_faiss_index.py로 recall/latency 비교 후 선택)
+    # 압축 타입(fp16 / sq8 / pq / ivf_pq)은 vectors.npy로 exact rerank 가능 (ExactReranker)
+    FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat")
+    FAISS_NLIST = int(os.getenv("FAISS_NLIST", 0))  # 0이면 벡터 수로부터 자동 결정
+    FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", 16))
+    FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", 64))
+    FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", 32))
+    FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", 64))
+    # l2 | cosine (cosine이면 vectors.npy에 정규화해서 저장하고 inner product 인덱스 사용)
+    FAISS_METRIC = os.getenv("FAISS_METRIC", "l2")
+    # 1이면 기존 인덱스에 바뀐 청크만 반영 (0이면 항상 전체 재구축)
+    INDEX_SYNC = os.getenv("INDEX_SYNC", "1") == "1"
+    # 한 embeddings 요청에 담을 최대 토큰 수 (tiktoken 기준)
+    EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", 100_000))
+    # 0보다 크면 AsyncEmbeddingRunner로 batch 요청을 동시에 보냄 (동시 요청 수)
+    EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", 0))
+    # (model, text hash) 기준 디스크 임베딩 캐시
+    EMBED_CACHE = os.getenv("EMBED_CACHE", "1") == "1"
+    EMBED_CACHE_DIR = os.getenv("EMBED_CACHE_DIR", "./cache/embeddings")
+    EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", 100_000))
+    EMBED_MODEL = "text-embedding-3-small"
+    # 청크 텍스트 hash: checkpoint에서 텍스트가 바뀐 행을 찾고, 인덱스 manifest와 비교하는 데 씀
+    hashes = chunk_hashes(chunk_text.iter_texts(chunked_df))
+    checkpoint = EmbeddingCheckpoint(
+        VECTORS_FILE,
+        chunked_df["global_id"],
+        dim=VECTOR_DIM,
+        model=EMBED_MODEL,
+        normalize=FAISS_METRIC == "cosine",
+        hashes=hashes,
+    )
+    # 아직 임베딩하지 않은 행만 남김
+    pending_df = chunked_df.iloc[checkpoint.n_done :]
+    runner = None
+    if EMBED_CONCURRENCY > 0:
+        runner = AsyncEmbeddingRunner(
+            openai.AsyncOpenAI(api_key=os.getenv("TEAM1_OPENAI_API_KEY"), max_retries=0),
+            model=EMBED_MODEL,
+            max_in_flight=EMBED_CONCURRENCY,
+            requests_per_minute=int(os.getenv("EMBED_RPM", 3000)),
+            tokens_per_minute=int(os.getenv("EMBED_TPM", 1_000_000)),
+        )
+        embed_batches = partial(
+            runner.embed_in_batches, max_batch_tokens=EMBED_BATCH_TOKENS
+        )
+    else:
+        embed_batches = partial(
+            embed_in_batches,
+            client=client,
+            model=EMBED_MODEL,
+            max_batch_tokens=EMBED_BATCH_TOKENS,
+        )
+    cache = None
+    if EMBED_CACHE:
+        cache = EmbeddingCache(EMBED_CACHE_DIR, dim=VECTOR_DIM, max_entries=EMBED_CACHE_SIZE)
+    batches = embedding_batches(pending_df, chunk_text, embed_batches, cache, EMBED_MODEL)
+    for batch_ids, batch_vecs in batches:
+        checkpoint.write(batch_ids, batch_vecs)
+        print(
+            f"Processed global_id={batch_ids[0]}..{batch_ids[-1]} "
+            f"({checkpoint.n_done}/{len(checkpoint.ids)} chunks)"
+        )
+    # global_id는 그대로인데 텍스트가 바뀐 청크는 다시 임베딩해서 vectors.npy 행을 덮어씀
+    # (그래야 아래 sync가 changed 청크에 새 벡터를 넣음)
+    stale_df = chunked_df.iloc[checkpoint.stale_rows]
+    for batch_ids, batch_vecs in embedding_batches(
+        stale_df, chunk_text, embed_batches, cache, EMBED_MODEL
+    ):
+        checkpoint.write_rows(batch_ids, batch_vecs)
+        print(f"Re-embedded {len(batch_ids)} changed chunks")
+    if runner is not None:
+        print(f"Embedding requests: {runner.stats()}")
+        runner.close()
+    if cache is not None:
+        print(f"Embedding cache: {cache.stats()}")
+        cache.close()
 
-    # Save updated index
-    save_faiss_index(index, INDEX_FILE)
+    # idmap.index.manifest.json (global_id -> text hash, model, index_type)과 비교해
+    # 바뀐 청크만 remove / add. manifest가 없거나 model / index_type이 바뀌면 전체 재구축
+    manifest = load_index_manifest(INDEX_FILE)
+    delta = None
+    if INDEX_SYNC and os.path.exists(INDEX_FILE):
+        delta = diff_index_manifest(
+            manifest, checkpoint.ids, hashes, EMBED_MODEL, FAISS_INDEX_TYPE, FAISS_METRIC
+        )
+    synced = False
+    if delta is not None:
+        index = load_faiss_index(INDEX_FILE, dim=VECTOR_DIM)
+        synced = sync_faiss_index(
+            index,
+            delta,
+            checkpoint.vectors,
+            checkpoint.ids,
+            expected_ntotal=len(manifest["entries"]),
+            batch_size=INDEX_ADD_BATCH,
+        )
+    if not synced:
+        # 인덱스를 memmap에서 새로 만듦 (재실행해도 같은 id가 중복으로 들어가지 않음)
+        if os.path.exists(INDEX_FILE):
+            os.remove(INDEX_FILE)
+        index = load_faiss_index(
+            INDEX_FILE,
+            dim=VECTOR_DIM,
+            index_type=FAISS_INDEX_TYPE,
+            nlist=FAISS_NLIST or default_nlist(len(checkpoint.ids)),
+            pq_m=FAISS_PQ_M,
+            hnsw_m=FAISS_HNSW_M,
+            metric=FAISS_METRIC,
+        )
+        train_faiss_index(index, checkpoint.vectors)
+        add_in_batches(index, checkpoint.vectors, checkpoint.ids, batch_size=INDEX_ADD_BATCH)
+        print(f"Added {index.ntotal} vectors to index in batches of {INDEX_ADD_BATCH}.")
+    set_search_params(index, nprobe=FAISS_NPROBE, efSearch=FAISS_EF_SEARCH)
 
-    base_index = faiss.downcast_index(index.index)
-    save_faiss_index(base_index, BASE_INDEX_FILE)
+    # Save updated index (+ nprobe / efSearch in idmap.index.json), 그 다음 manifest
+    save_faiss_index(index, INDEX_FILE, index_type=FAISS_INDEX_TYPE)
+    save_index_manifest(
+        INDEX_FILE,
+        build_index_manifest(
+            checkpoint.ids, hashes, EMBED_MODEL, FAISS_INDEX_TYPE, FAISS_METRIC
+        ),
+    )
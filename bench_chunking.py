@@ -0,0 +1,55 @@
+import os
+import time
+import argparse
+import pandas as pd
+from utils.chunking import get_chuncked_df, get_chuncked_df_parallel
+
+
+def load_docs(csv_path, repeat=1):
+    """
+    벤치마크용 문서 DataFrame을 읽습니다. repeat로 코퍼스를 복제해 크기를 키울 수 있습니다.
+    """
+    df = pd.read_csv(csv_path, encoding="utf-8", delimiter=",")
+    if "doc_id" not in df.columns:
+        df.insert(0, "doc_id", range(len(df)))
+    if repeat > 1:
+        df = pd.concat([df] * repeat, ignore_index=True)
+        df["doc_id"] = range(len(df))
+    return df
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="get_chuncked_df vs parallel chunker")
+    parser.add_argument("--csv", default="./data/ustr_2023_press_releases_tailed.csv")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument("--batch-docs", type=int, default=64)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.csv):
+        print("preprocess.py를 먼저 실행시키세요")
+        exit()
+    docs = load_docs(args.csv, args.repeat)
+    print(f"documents: {len(docs)}")
+
+    baseline_df, baseline_sec = timed(get_chuncked_df, docs)
+    print(f"[loop]      chunks={len(baseline_df)}  {baseline_sec:.2f}s")
+
+    for workers in sorted(set(args.workers)):
+        chunked_df, sec = timed(
+            get_chuncked_df_parallel,
+            docs,
+            num_workers=workers,
+            batch_docs=args.batch_docs,
+        )
+        same = chunked_df.reset_index(drop=True).equals(baseline_df.reset_index(drop=True))
+        print(
+            f"[parallel {workers:>2}] chunks={len(chunked_df)}  {sec:.2f}s  "
+            f"speedup={baseline_sec / sec:.1f}x  identical={same}"
+        )
@@ -0,0 +1,68 @@
+import time
+import argparse
+import openai
+import numpy as np
+
+from utils.faiss_utils import get_embedding, embed_in_batches
+from utils.async_embedding import AsyncEmbeddingRunner
+from utils.mock_openai import start_mock_server
+
+
+def make_texts(n, words_per_text=350, seed=0):
+    rng = np.random.default_rng(seed)
+    vocab = ["trade", "tariff", "agreement", "USTR", "policy", "market", "access", "dispute"]
+    return [" ".join(rng.choice(vocab, words_per_text)) + f" #{i}" for i in range(n)]
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="serial vs batched vs async embedding (mock endpoint)")
+    parser.add_argument("--n", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--rate-limit-prob", type=float, default=0.05)
+    parser.add_argument("--batch-tokens", type=int, default=20_000)
+    parser.add_argument("--in-flight", type=int, default=16)
+    parser.add_argument("--rpm", type=int, default=3000)
+    parser.add_argument("--tpm", type=int, default=10_000_000)
+    parser.add_argument("--serial-n", type=int, default=200, help="serial은 느려서 앞부분만 측정")
+    args = parser.parse_args()
+
+    server, base_url = start_mock_server(args.latency, args.rate_limit_prob)
+    texts = make_texts(args.n)
+    ids = np.arange(args.n)
+    client = openai.OpenAI(api_key="mock", base_url=base_url, max_retries=10)
+
+    _, sec = timed(lambda: [get_embedding(t, client) for t in texts[: args.serial_n]])
+    serial_rate = args.serial_n / sec
+    print(f"[serial]  {serial_rate:8.1f} chunks/s")
+
+    batches, sec = timed(
+        lambda: list(embed_in_batches(ids, texts, client, max_batch_tokens=args.batch_tokens))
+    )
+    print(f"[batched] {args.n / sec:8.1f} chunks/s  requests={len(batches)}  x{args.n / sec / serial_rate:.1f}")
+
+    runner = AsyncEmbeddingRunner(
+        openai.AsyncOpenAI(api_key="mock", base_url=base_url, max_retries=0),
+        max_in_flight=args.in_flight,
+        requests_per_minute=args.rpm,
+        tokens_per_minute=args.tpm,
+    )
+    async_batches, sec = timed(
+        lambda: list(runner.embed_in_batches(ids, texts, max_batch_tokens=args.batch_tokens))
+    )
+    runner.close()
+    print(
+        f"[async]   {args.n / sec:8.1f} chunks/s  {runner.stats()}  x{args.n / sec / serial_rate:.1f}"
+    )
+
+    same_order = all(
+        np.array_equal(a_ids, b_ids) and np.allclose(a_vecs, b_vecs)
+        for (a_ids, a_vecs), (b_ids, b_vecs) in zip(batches, async_batches)
+    )
+    print(f"identical results: {same_order}")
+    server.shutdown()
@@ -0,0 +1,93 @@
+import time
+import argparse
+import openai
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from utils.to_kg import to_kg_in_chunk
+from utils.async_extraction import AsyncExtractionRunner
+from utils.prompt_compiler import compile_prompt
+from utils.mock_openai import start_mock_server
+from bench_embedding import make_texts, timed
+
+PROMPT_CFG = {
+    "prompt_template": (
+        "Language: {language}\nEntity types: {entity_types}\n{entity_types_reference}\n"
+        "Use {tuple_delimiter} / {record_delimiter} / {completion_delimiter}.\n"
+        "{examples}\n\nText:\n{input_text}"
+    ),
+    "language": "English",
+    "tuple_delimiter": "<|>",
+    "record_delimiter": "##",
+    "completion_delimiter": "<|COMPLETE|>",
+    "entity_types": ["Organization", "Country", "Agreement", "Regulation"],
+    "system_prompt": "You extract entities and relationships.",
+}
+
+
+def run_threads(client, messages, workers, model, max_tokens):
+    def complete(m):
+        response = client.chat.completions.create(
+            model=model, messages=m, temperature=0.0, max_tokens=max_tokens
+        )
+        return response.choices[0].message.content
+
+    outputs = [None] * len(messages)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(complete, m): i for i, m in enumerate(messages)}
+        for future in as_completed(futures):
+            outputs[futures[future]] = future.result()
+    return outputs
+
+
+def run_async(runner, messages):
+    outputs = [None] * len(messages)
+    futures = {runner.submit(m): i for i, m in enumerate(messages)}
+    for future in as_completed(futures):
+        outputs[futures[future]] = future.result()
+    return outputs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ThreadPoolExecutor vs asyncio entity extraction (mock endpoint)")
+    parser.add_argument("--n", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.5, help="mock chat completion latency (s)")
+    parser.add_argument("--rate-limit-prob", type=float, default=0.02)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--in-flight", type=int, default=1024)
+    parser.add_argument("--rpm", type=int, default=100_000)
+    parser.add_argument("--tpm", type=int, default=50_000_000)
+    parser.add_argument("--max-tokens", type=int, default=512)
+    args = parser.parse_args()
+
+    server, base_url = start_mock_server(args.latency, args.rate_limit_prob)
+    compiled = compile_prompt(PROMPT_CFG)
+    messages = [compiled.messages(text) for text in make_texts(args.n, words_per_text=200)]
+
+    client = openai.OpenAI(api_key="mock", base_url=base_url, max_retries=10)
+    thread_outputs, sec = timed(
+        lambda: run_threads(client, messages, args.threads, "mock", args.max_tokens)
+    )
+    thread_rate = args.n / sec
+    print(f"[threads x{args.threads}] {thread_rate:8.1f} chunks/s")
+
+    runner = AsyncExtractionRunner(
+        openai.AsyncOpenAI(api_key="mock", base_url=base_url, max_retries=0),
+        model="mock",
+        temperature=0.0,
+        max_tokens=args.max_tokens,
+        max_in_flight=args.in_flight,
+        requests_per_minute=args.rpm,
+        tokens_per_minute=args.tpm,
+    )
+    async_outputs, sec = timed(lambda: run_async(runner, messages))
+    runner.close()
+    print(
+        f"[async x{args.in_flight}] {args.n / sec:8.1f} chunks/s  {runner.stats()}  x{args.n / sec / thread_rate:.1f}"
+    )
+
+    same_kg = all(
+        to_kg_in_chunk(a, gid) == to_kg_in_chunk(b, gid)
+        for gid, (a, b) in enumerate(zip(thread_outputs, async_outputs))
+    )
+    print(f"identical to_kg_in_chunk results: {same_kg}")
+    server.shutdown()
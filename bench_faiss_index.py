@@ -0,0 +1,161 @@
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+import faiss
+from functools import partial
+
+from utils.faiss_utils import (
+    ExactReranker,
+    add_in_batches,
+    create_faiss_index,
+    default_nlist,
+    is_exact_index,
+    normalize_vectors,
+    to_similarity,
+    set_search_params,
+    train_faiss_index,
+)
+
+
+def load_vectors(path, synthetic, dim, seed=0):
+    """
+    apply_faiss가 남긴 vectors.npy(+ .ids.npy)를 읽고, 없으면 군집이 있는 랜덤 벡터를 만듭니다.
+    """
+    if os.path.exists(path) and not synthetic:
+        return np.load(path, mmap_mode="r"), np.load(path + ".ids.npy")
+    n = synthetic or 20_000
+    print(f"'{path}' 없음 -> synthetic {n} x {dim}")
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, n // 100), dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), n)] + 0.3 * rng.standard_normal(
+        (n, dim)
+    ).astype(np.float32)
+    return vectors, np.arange(n, dtype=np.int64)
+
+
+def query_latencies(index, queries, k, reranker=None):
+    # 1건씩 검색한 latency (ms)
+    latencies = np.empty(len(queries))
+    labels = np.empty((len(queries), k), dtype=np.int64)
+    search = index.search if reranker is None else partial(reranker.search, index)
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        _, labels[i] = search(queries[i : i + 1], k)
+        latencies[i] = (time.perf_counter() - start) * 1000
+    return latencies, labels
+
+
+def metric_parity(vectors, ids, queries, k):
+    """
+    정규화된 벡터에서 l2 flat과 cosine(inner product) flat의 top-k 순서가 같은지 확인합니다.
+
+    Returns:
+        (순서가 완전히 같은 query 비율, |cosine - (1 - l2 / 2)| 최대값)
+    """
+    unit = normalize_vectors(vectors)
+    unit_queries = normalize_vectors(queries)
+    results = {}
+    for metric in ("l2", "cosine"):
+        index = create_faiss_index(unit.shape[1], "flat", metric=metric)
+        add_in_batches(index, unit, ids)
+        results[metric] = index.search(unit_queries, k)
+    (l2_d, l2_i), (ip_d, ip_i) = results["l2"], results["cosine"]
+    same_order = (l2_i == ip_i).all(axis=1).mean()
+    score_gap = np.abs(to_similarity(l2_d, "l2") - to_similarity(ip_d, "cosine")).max()
+    return same_order, score_gap
+
+
+def recall_at_k(labels, ground_truth):
+    k = ground_truth.shape[1]
+    hits = sum(len(np.intersect1d(a, b)) for a, b in zip(labels, ground_truth))
+    return hits / (len(ground_truth) * k)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FAISS index type별 recall@k vs query latency")
+    parser.add_argument("--vectors", default="./faiss/vectors.npy")
+    parser.add_argument("--synthetic", type=int, default=0, help="N개 synthetic 벡터 사용")
+    parser.add_argument("--dim", type=int, default=1536, help="synthetic 벡터 차원")
+    parser.add_argument("--types", default="flat,ivf_flat,ivf_pq,hnsw,fp16,sq8,pq")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--metric", default="l2", help="l2 | cosine")
+    parser.add_argument("--n-queries", type=int, default=500)
+    parser.add_argument("--nlist", type=int, default=0, help="0이면 default_nlist(N)")
+    parser.add_argument("--nprobe", default="1,4,16,64")
+    parser.add_argument("--pq-m", type=int, default=64)
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    parser.add_argument("--ef-search", default="16,32,64,128")
+    parser.add_argument(
+        "--rerank-factor", type=int, default=4, help="압축 인덱스에 exact rerank 행 추가 (0이면 생략)"
+    )
+    args = parser.parse_args()
+
+    vectors, ids = load_vectors(args.vectors, args.synthetic, args.dim)
+    reranker = None
+    if args.rerank_factor:
+        if not isinstance(vectors, np.memmap):
+            # synthetic이면 rerank용 float32 store를 임시로 디스크에 씀
+            args.vectors = os.path.join(tempfile.mkdtemp(), "vectors.npy")
+            np.save(args.vectors, vectors)
+            np.save(args.vectors + ".ids.npy", ids)
+        reranker = ExactReranker(args.vectors, factor=args.rerank_factor)
+    n, dim = vectors.shape
+    rng = np.random.default_rng(1)
+    query_rows = np.sort(rng.choice(n, min(args.n_queries, n), replace=False))
+    queries = np.ascontiguousarray(vectors[query_rows], dtype=np.float32)
+    nlist = args.nlist or default_nlist(n)
+
+    same_order, score_gap = metric_parity(vectors, ids, queries, args.k)
+    print(
+        f"metric parity (unit vectors, l2 vs cosine flat): identical top-{args.k} "
+        f"{same_order:.3f}, max score gap {score_gap:.2e}"
+    )
+    if args.metric == "cosine":
+        vectors, queries = normalize_vectors(vectors), normalize_vectors(queries)
+        if reranker is not None:
+            reranker.vectors = vectors
+            reranker.metric = "cosine"
+
+    exact = create_faiss_index(dim, "flat", metric=args.metric)
+    add_in_batches(exact, vectors, ids)
+    _, ground_truth = exact.search(queries, args.k)
+
+    print(f"N={n} dim={dim} queries={len(queries)} k={args.k} nlist={nlist} metric={args.metric}")
+    print(f"{'index':<10} {'param':<14} {'recall@k':>8} {'p50 ms':>8} {'p99 ms':>8} {'build s':>8} {'MB':>8}")
+    for index_type in args.types.split(","):
+        start = time.perf_counter()
+        index = create_faiss_index(
+            dim,
+            index_type,
+            nlist=nlist,
+            pq_m=args.pq_m,
+            hnsw_m=args.hnsw_m,
+            metric=args.metric,
+        )
+        train_faiss_index(index, vectors)
+        add_in_batches(index, vectors, ids)
+        build_sec = time.perf_counter() - start
+        size_mb = faiss.serialize_index(index).nbytes / 2**20
+
+        if index_type.startswith("ivf"):
+            sweep = [("nprobe", int(v)) for v in args.nprobe.split(",") if int(v) <= nlist]
+        elif index_type == "hnsw":
+            sweep = [("efSearch", int(v)) for v in args.ef_search.split(",")]
+        else:
+            sweep = [(None, None)]
+        for name, value in sweep:
+            if name is not None:
+                set_search_params(index, **{name: value})
+            param = f"{name}={value}" if name else "-"
+            runs = [(index_type, None)]
+            if reranker is not None and not is_exact_index(index):
+                runs.append((index_type + "+rr", reranker))
+            for label, rr in runs:
+                latencies, labels = query_latencies(index, queries, args.k, rr)
+                print(
+                    f"{label:<10} {param:<14} {recall_at_k(labels, ground_truth):8.3f} "
+                    f"{np.percentile(latencies, 50):8.3f} {np.percentile(latencies, 99):8.3f} "
+                    f"{build_sec:8.1f} {size_mb:8.1f}"
+                )
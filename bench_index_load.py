@@ -0,0 +1,63 @@
+import os
+import time
+import argparse
+import resource
+import tempfile
+import multiprocessing as mp
+import numpy as np
+import faiss
+
+from utils.faiss_utils import add_in_batches, create_faiss_index, read_faiss_index
+
+
+def worker_startup(index_path, mmap, queries, k):
+    """
+    worker 한 개의 cold start: 인덱스 로딩 + 첫 query 시간, 최대 RSS
+    """
+    start = time.perf_counter()
+    index = read_faiss_index(index_path, mmap=mmap)
+    loaded = time.perf_counter() - start
+    index.search(queries, k)
+    first_query = time.perf_counter() - start - loaded
+    max_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return loaded, first_query, max_rss_mb
+
+
+def make_synthetic_index(n, dim):
+    path = os.path.join(tempfile.mkdtemp(), "synthetic.index")
+    vectors = np.random.default_rng(0).standard_normal((n, dim)).astype(np.float32)
+    index = create_faiss_index(dim, "flat")
+    add_in_batches(index, vectors, np.arange(n))
+    faiss.write_index(index, path)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FAISS index 로딩 (RAM vs mmap) worker cold start 비교")
+    parser.add_argument("--index", default="./faiss/idmap.index")
+    parser.add_argument("--synthetic", type=int, default=0, help="N x dim flat 인덱스를 만들어 측정")
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    index_path = args.index
+    if args.synthetic or not os.path.exists(index_path):
+        index_path = make_synthetic_index(args.synthetic or 100_000, args.dim)
+    size_mb = os.path.getsize(index_path) / 2**20
+    dim = read_faiss_index(index_path, mmap=True).d
+    queries = np.random.default_rng(1).standard_normal((1, dim)).astype(np.float32)
+
+    print(f"index={index_path} ({size_mb:.0f} MB), workers={args.workers}")
+    ctx = mp.get_context("spawn")
+    for mmap in (False, True):
+        with ctx.Pool(args.workers) as pool:
+            results = pool.starmap(
+                worker_startup, [(index_path, mmap, queries, args.k)] * args.workers
+            )
+        loaded, first_query, rss = np.array(results).T
+        print(
+            f"[{'mmap' if mmap else 'ram':4}] load p50 {np.median(loaded) * 1000:8.1f} ms  "
+            f"max {loaded.max() * 1000:8.1f} ms  first query {np.median(first_query) * 1000:7.1f} ms  "
+            f"peak RSS/worker {np.median(rss):7.0f} MB (mmap pages are shared page cache)"
+        )
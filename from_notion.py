@@ -6,6 +6,10 @@ from dotenv import load_dotenv
 import boto3
 import tiktoken
 import pandas as pd
+from utils.chunking import load_chunk_text_accessor
+from utils.chunk_store import CHUNK_STORE_PATH, chunk_store_exists, read_chunks
+from utils.llm_cache import cached_chat_completion, open_llm_cache, print_llm_cache_stats
+from utils.prompt_compiler import compile_prompt, print_prompt_stats
 from utils.notion_sdk import notion2config
 
 
@@ -18,41 +22,28 @@ def run(cfg: DictConfig):
     global_id = 0
     cfg_dict = OmegaConf.to_container(cfg, resolve=True)
     prompt_cfg = cfg_dict["prompt_entity"]
-    input_text = df["chunk_text"][global_id]
+    input_text = chunk_text(df.iloc[global_id])
 
-    entity_refernce_lines = []
-    entity_descriptions = prompt_cfg.get("entity_types_descriptions", {})
-    examples = "\n\n".join(cfg_dict["prompt_entity"]["examples"])
-    for entity in prompt_cfg["entity_types"]:
-        description = entity_descriptions.get(entity, "")
-        entity_refernce_lines.append(f"• {entity}: {description}")
-    entity_types_reference = "\n".join(entity_refernce_lines)
-
-    prompt = prompt_cfg["prompt_template"].format(
-        language=prompt_cfg["language"],
-        tuple_delimiter=prompt_cfg["tuple_delimiter"],
-        record_delimiter=prompt_cfg["record_delimiter"],
-        completion_delimiter=prompt_cfg["completion_delimiter"],
-        entity_types_reference=entity_types_reference,
-        examples = examples,
-        entity_types=", ".join(prompt_cfg["entity_types"]),
-        input_text=input_text,
-    )
+    compiled = compile_prompt(prompt_cfg)
+    print_prompt_stats(compiled)
     # -----------------------
     # STEP 1: Entity Extraction
     # -----------------------
 
     client = openai.OpenAI(api_key=cfg.model.api_key)
-    entity_response = client.chat.completions.create(
-        model=cfg.model.model_name,
-        messages=[
-            {"role": "system", "content": cfg.prompt_entity.system_prompt},
-            {"role": "user", "content": prompt},
-        ],
-        temperature=cfg.model.temperature,
-        max_tokens=cfg.model.max_tokens,
+    cache = open_llm_cache()
+    entity_output = cached_chat_completion(
+        client,
+        cache,
+        cfg.model.model_name,
+        compiled.messages(input_text),
+        cfg.model.temperature,
+        cfg.model.max_tokens,
     )
-    entity_output = entity_response.choices[0].message.content
+    print_llm_cache_stats(cache)
+    if cache is not None:
+        # put은 모아서 commit 하므로 닫아야 이번 응답이 디스크에 남음
+        cache.close()
     print(" Entity Extraction Output:\n", entity_output)
 
 
@@ -61,9 +52,11 @@ if __name__ == "__main__":
     target = "base_prompt_v1"
     config_path = "./config/base_test.yaml"
     notion2config(target,config_path)
-    csv_file_path = "./data/ustr_chunked.csv"
-    if not os.path.exists(csv_file_path):
+    if not chunk_store_exists(CHUNK_STORE_PATH):
         print("preprocess.py를 먼저 실행시키세요")
         exit()
-    df = pd.read_csv(csv_file_path, encoding="utf-8", delimiter=",")
+    df = read_chunks(CHUNK_STORE_PATH)
+    chunk_text = load_chunk_text_accessor(
+        df, "./data/ustr_2023_press_releases_tailed.csv"
+    )
     run()
@@ -8,6 +8,9 @@ import pandas as pd
 from notion_sdk import config2notion
 from utils import download_csv_from_s3, get_chuncked_df
 from utils.to_kg import to_kg_in_chunk
+from utils.chunking import load_chunk_text_accessor
+from utils.chunk_store import CHUNK_STORE_PATH, chunk_store_exists, read_chunks
+from utils.prompt_compiler import compile_prompt, print_prompt_stats
 from neo4j import GraphDatabase
 from utils.neo4j_utils import (
     insert_entity_relationship,
@@ -29,37 +32,17 @@ from utils.neo4j_utils import (
 )
 def run(cfg: DictConfig):
     cfg_dict = OmegaConf.to_container(cfg, resolve=True)
-    prompt_cfg = cfg_dict["prompt_entity"]
-    examples = "\n\n".join(cfg_dict["prompt_entity"]["examples"])
-    entity_refernce_lines = []
-    entity_descriptions = prompt_cfg.get("entity_types_descriptions", {})
-
-    for entity in prompt_cfg["entity_types"]:
-        description = entity_descriptions.get(entity, "")
-        entity_refernce_lines.append(f"• {entity}: {description}")
-    entity_types_reference = "\n".join(entity_refernce_lines)
+    compiled = compile_prompt(cfg_dict["prompt_entity"])
+    print_prompt_stats(compiled)
     client = openai.OpenAI(api_key=cfg.model.api_key)
 
     for i, row in df.iterrows():
-        input_text = row["chunk_text"]
+        input_text = chunk_text(row)
         doc_id = row["doc_id"]
         chunk_id = row["chunk_id"] + 1 #1부터 indexing됨 2팀 내부 구현인듯 맞춰야함
-        prompt = prompt_cfg["prompt_template"].format(
-            language=prompt_cfg["language"],
-            tuple_delimiter=prompt_cfg["tuple_delimiter"],
-            record_delimiter=prompt_cfg["record_delimiter"],
-            completion_delimiter=prompt_cfg["completion_delimiter"],
-            entity_types_reference=entity_types_reference,
-            examples=examples,
-            entity_types=", ".join(prompt_cfg["entity_types"]),
-            input_text=input_text,
-        )
         entity_response = client.chat.completions.create(
             model=cfg.model.model_name,
-            messages=[
-                {"role": "system", "content": cfg.prompt_entity.system_prompt},
-                {"role": "user", "content": prompt},
-            ],
+            messages=compiled.messages(input_text),
             temperature=cfg.model.temperature,
             max_tokens=cfg.model.max_tokens,
         )
@@ -138,11 +121,12 @@ if __name__ == "__main__":
     '''
     chunk단위를 적재 + kg 삽임
     '''
-    csv_file_path = "./data/ustr_chunked.csv"
-    if not os.path.exists(csv_file_path):
+    if not chunk_store_exists(CHUNK_STORE_PATH):
         print("preprocess.py를 먼저 실행시키세요")
         exit()
-    df = pd.read_csv(csv_file_path, encoding="utf-8", delimiter=",")
+    df = read_chunks(CHUNK_STORE_PATH)
+    # offset 모드 청크는 tailed CSV 원문에서 잘라 씀
+    chunk_text = load_chunk_text_accessor(df, full_csv_path)
     run()
 
 
@@ -3,112 +3,265 @@ from omegaconf import DictConfig, OmegaConf
 from hydra.core.hydra_config import HydraConfig
 import openai
 import os
+import time
 from dotenv import load_dotenv
 import pandas as pd
 from utils.to_kg import to_kg_in_chunk
+from utils.chunking import load_chunk_text_accessor
+from utils.chunk_store import (
+    CHUNK_STORE_PATH,
+    chunk_store_exists,
+    read_chunks,
+    to_csv_compatible,
+)
 from neo4j import GraphDatabase
 from utils.neo4j_utils import (
-    insert_entity_relationship,
-    check_entity_node_count,
-    check_entity_relationship_count,
-    insert_chunk_node,
-    insert_entity_node,
+    insert_chunk_kg,
     delete_all_nodes,
     check_document_node_count,
     insert_document_node,
     convert_date,
 )
 
+from utils.dedup import extraction_targets
+from utils.resources import close_resources, get_resources
+from utils.llm_cache import (
+    cached_chat_completion,
+    llm_cache_key,
+    open_llm_cache,
+    print_llm_cache_stats,
+)
+from utils.batch_api import (
+    BATCH_DIR,
+    LocalBatchBackend,
+    OpenAIBatchBackend,
+    iter_batch_results,
+    render_batch_files,
+    submit_batches,
+    wait_for_batches,
+)
+from utils.async_extraction import AsyncExtractionRunner
+from utils.prompt_compiler import compile_prompt, print_prompt_stats
+
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 
+def insert_extraction(i, row, members, entity_output, resources):
+    with resources.session() as session:
+        # 중복 클러스터 멤버는 대표 청크의 추출 결과를 그대로 자기 청크에 적재
+        for gid, member in [(i, row)] + list(members):
+            tmp_kg = to_kg_in_chunk(entity_output, gid)
+            insert_chunk_kg(session, member["chunk_id"] + 1, member["doc_id"], tmp_kg)
+
+
 # --- Worker function for threading ---
-def process_row(i, row, cfg, prompt_cfg, entity_types_reference, examples,neo4j = False):
-    client = openai.OpenAI(api_key=cfg.model.api_key)
-    input_text = row["chunk_text"]
-    doc_id = row["doc_id"]
-    chunk_id = row["chunk_id"] + 1
-
-
-    prompt = prompt_cfg["prompt_template"].format(
-        language=prompt_cfg["language"],
-        tuple_delimiter=prompt_cfg["tuple_delimiter"],
-        record_delimiter=prompt_cfg["record_delimiter"],
-        completion_delimiter=prompt_cfg["completion_delimiter"],
-        entity_types_reference=entity_types_reference,
-        examples=examples,
-        entity_types=", ".join(prompt_cfg["entity_types"]),
-        input_text=input_text,
-    )
-    response = client.chat.completions.create(
-        model=cfg.model.model_name,
-        messages=[
-            {"role": "system", "content": prompt_cfg["system_prompt"]},
-            {"role": "user", "content": prompt},
-        ],
-        temperature=cfg.model.temperature,
-        max_tokens=cfg.model.max_tokens,
+def process_row(i, row, cfg, compiled, chunk_text, resources, members=(), cache=None, neo4j=False):
+    input_text = chunk_text(row)
+    entity_output = cached_chat_completion(
+        resources.openai_client,
+        cache,
+        cfg.model.model_name,
+        compiled.messages(input_text),
+        cfg.model.temperature,
+        cfg.model.max_tokens,
     )
-    entity_output = response.choices[0].message.content
-    tmp_kg = to_kg_in_chunk(entity_output, i)
     if neo4j:
-        driver = GraphDatabase.driver(
-            os.getenv("NEO4J_URI"),
-            auth=(os.getenv("NEO4J_USERNAME"), os.getenv("NEO4J_PASSWORD")),
-        )
-        with driver.session(database=os.getenv("NEO4J_DATABASE")) as session:
-            session.execute_write(
-                insert_chunk_node,
-                chunk_id,
-                doc_id,
-                tmp_kg["content_keywords"][0]["high_level_keywords"],
-            )
-            for ent in tmp_kg["entities"]:
-                session.execute_write(
-                    insert_entity_node,
-                    chunk_id,
-                    doc_id,
-                    ent["entity_name"],
-                    ent["entity_type"],
-                    ent["description"],
-                )
-            for rel in tmp_kg["relationships"]:
-                session.execute_write(
-                    insert_entity_relationship,
-                    chunk_id,
-                    doc_id,
-                    rel["src_id"],
-                    rel["tgt_id"],
-                    rel["description"],
-                    rel["keywords"],
-                    rel["weight"],
-                )
-            check_entity_node_count(session, doc_id, chunk_id, len(tmp_kg["entities"]))
-            check_entity_relationship_count(
-                session, doc_id, chunk_id, len(tmp_kg["relationships"]),
-            )
-        driver.close()
+        insert_extraction(i, row, members, entity_output, resources)
     return entity_output
 
 # --- ThreadPoolExecutor runner ---
-def run_with_threads(df, cfg, prompt_cfg, entity_types_reference, examples):
+def run_with_threads(df, cfg, compiled, chunk_text):
     max_workers = cfg.thread_workers if hasattr(cfg, 'thread_workers') else 16
     df["output"] = None
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = {executor.submit(
-            process_row, i, row, cfg, prompt_cfg, entity_types_reference, examples): i
-            for i, row in df.iterrows()
+    start = time.perf_counter()
+    rows, targets, members = extraction_targets(
+        df,
+        chunk_text,
+        dedup=os.getenv("DEDUP", "1") == "1",
+        min_similarity=float(os.getenv("DEDUP_MIN_SIMILARITY", 0.97)),
+    )
+    # worker 수만큼 keep-alive HTTP 연결 / Neo4j 연결을 가진 공유 client, driver
+    resources = get_resources(
+        api_key=cfg.model.api_key,
+        max_connections=max_workers,
+        neo4j_pool_size=int(os.getenv("NEO4J_POOL_SIZE", max_workers)),
+    )
+    cache = open_llm_cache()
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(
+                process_row, *rows[pos], cfg, compiled, chunk_text,
+                resources, members.get(pos, []), cache): pos
+                for pos in targets
+            }
+            for future in as_completed(futures):
+                pos = futures[future]
+                idx = rows[pos][0]
+                try:
+                    #future.result()
+                    result_text = future.result()
+                    for member_idx in [idx] + [i for i, _ in members.get(pos, [])]:
+                        df.at[member_idx, "output"] = result_text
+                    print(f"Processed chunk {idx} (+{len(members.get(pos, []))} duplicates)")
+                except Exception as exc:
+                    print(f"Error processing chunk {idx}: {exc}")
+        print(f"Extraction: {len(futures)} LLM calls for {len(rows)} chunks in {time.perf_counter() - start:.1f}s")
+        print(f"Pools: {resources.pool_stats()}")
+        close_resources()
+    finally:
+        # 실패한 실행에서도 이미 받은 응답은 캐시에 남도록 commit
+        print_llm_cache_stats(cache)
+        if cache is not None:
+            cache.close()
+
+
+# --- asyncio runner ---
+def run_with_async(df, cfg, compiled, chunk_text):
+    """
+    LLM 요청을 AsyncExtractionRunner로 한꺼번에 보내고 (semaphore + RPM/TPM 한도)
+    응답이 오는 순서대로 df "output"에 저장합니다.
+    """
+    df["output"] = None
+    start = time.perf_counter()
+    rows, targets, members = extraction_targets(
+        df,
+        chunk_text,
+        dedup=os.getenv("DEDUP", "1") == "1",
+        min_similarity=float(os.getenv("DEDUP_MIN_SIMILARITY", 0.97)),
+    )
+    max_in_flight = int(os.getenv("EXTRACT_CONCURRENCY", 256))
+    resources = get_resources(api_key=cfg.model.api_key, max_connections=max_in_flight)
+    cache = open_llm_cache()
+    try:
+        runner = AsyncExtractionRunner(
+            resources.make_async_openai_client(),
+            model=cfg.model.model_name,
+            temperature=cfg.model.temperature,
+            max_tokens=cfg.model.max_tokens,
+            max_in_flight=max_in_flight,
+            requests_per_minute=int(os.getenv("EXTRACT_RPM", 5000)),
+            tokens_per_minute=int(os.getenv("EXTRACT_TPM", 2_000_000)),
+            cache=cache,
+        )
+        futures = {
+            runner.submit(compiled.messages(chunk_text(rows[pos][1]))): pos
+            for pos in targets
         }
         for future in as_completed(futures):
-            idx = futures[future]
+            pos = futures[future]
+            idx = rows[pos][0]
             try:
-                #future.result()
                 result_text = future.result()
-                df.at[idx, "output"] = result_text
-                print(f"Processed chunk {idx}")
+                for member_idx in [idx] + [i for i, _ in members.get(pos, [])]:
+                    df.at[member_idx, "output"] = result_text
+                print(f"Processed chunk {idx} (+{len(members.get(pos, []))} duplicates)")
             except Exception as exc:
                 print(f"Error processing chunk {idx}: {exc}")
-    
+        runner.close()
+        print(f"Extraction: {len(futures)} LLM calls for {len(rows)} chunks in {time.perf_counter() - start:.1f}s {runner.stats()}")
+        print(f"Pools: {resources.pool_stats()}")
+        close_resources()
+    finally:
+        # 실패한 실행에서도 이미 받은 응답은 캐시에 남도록 commit
+        print_llm_cache_stats(cache)
+        if cache is not None:
+            cache.close()
+
+# --- Batch API runner ---
+def run_with_batch(df, cfg, compiled, chunk_text):
+    """
+    모든 대표 청크의 prompt를 Batch API JSONL(custom_id=global_id)로 렌더링해 제출 / poll 하고,
+    결과를 한 줄씩 읽어 df "output"에 저장합니다 (BATCH_NEO4J=1이면 to_kg_in_chunk 후 Neo4j 적재).
+    BATCH_BACKEND=local이면 LocalBatchBackend로 오프라인 실행.
+    """
+    df["output"] = None
+    start = time.perf_counter()
+    rows, targets, members = extraction_targets(
+        df,
+        chunk_text,
+        dedup=os.getenv("DEDUP", "1") == "1",
+        min_similarity=float(os.getenv("DEDUP_MIN_SIMILARITY", 0.97)),
+    )
+    resources = get_resources(api_key=cfg.model.api_key)
+    if os.getenv("BATCH_BACKEND", "openai") == "local":
+        backend = LocalBatchBackend(BATCH_DIR)
+    else:
+        backend = OpenAIBatchBackend(resources.openai_client)
+    neo4j = os.getenv("BATCH_NEO4J", "0") == "1"
+    n_done = n_failed = 0
+
+    def handle(pos, result_text):
+        for member_idx in [rows[pos][0]] + [i for i, _ in members.get(pos, [])]:
+            df.at[member_idx, "output"] = result_text
+        if neo4j:
+            insert_extraction(*rows[pos], members.get(pos, []), result_text, resources)
+
+    # 캐시에 있는 청크는 batch에 넣지 않고 바로 처리
+    cache = open_llm_cache()
+    try:
+        position_of, key_of = {}, {}
+        pending = []
+        for pos in targets:
+            gid = int(rows[pos][1]["global_id"])
+            messages = compiled.messages(chunk_text(rows[pos][1]))
+            key = llm_cache_key(cfg.model.model_name, cfg.model.temperature, cfg.model.max_tokens, messages)
+            cached = cache.get(key) if cache is not None else None
+            if cached is not None:
+                handle(pos, cached)
+                n_done += 1
+                continue
+            position_of[gid], key_of[gid] = pos, key
+            pending.append((gid, messages))
+
+        paths = render_batch_files(
+            pending,
+            model=cfg.model.model_name,
+            temperature=cfg.model.temperature,
+            max_tokens=cfg.model.max_tokens,
+        )
+        state = submit_batches(backend, paths)
+        result_paths = wait_for_batches(
+            backend, state, poll_interval=float(os.getenv("BATCH_POLL_INTERVAL", 60))
+        )
+
+        for gid, result_text, error, usage, finish_reason in iter_batch_results(result_paths):
+            # 이어받은 state의 결과 중 이번 실행 대상이 아닌 청크 (코퍼스 / 캐시가 바뀐 경우)
+            if gid not in position_of:
+                print(f"Skipping batch result for unknown global_id {gid}")
+                continue
+            pos = position_of[gid]
+            idx = rows[pos][0]
+            if error is not None:
+                n_failed += 1
+                print(f"Error processing chunk {idx}: {error}")
+                continue
+            # max_tokens에서 잘린 응답은 캐시하지 않음
+            if cache is not None and finish_reason == "stop":
+                cache.put(
+                    key_of[gid],
+                    result_text,
+                    usage["prompt_tokens"] if usage else 0,
+                    usage["completion_tokens"] if usage else 0,
+                )
+            try:
+                handle(pos, result_text)
+                n_done += 1
+            except Exception as exc:
+                n_failed += 1
+                print(f"Error processing chunk {idx}: {exc}")
+        print(
+            f"Extraction (batch): {n_done} done, {n_failed} failed, "
+            f"{len(pending)} batch requests for {len(rows)} chunks in {time.perf_counter() - start:.1f}s"
+        )
+        if neo4j:
+            print(f"Pools: {resources.pool_stats()}")
+        close_resources()
+    finally:
+        # 실패한 실행에서도 이미 받은 응답은 캐시에 남도록 commit
+        print_llm_cache_stats(cache)
+        if cache is not None:
+            cache.close()
+
 @hydra.main(
     config_path="config",
     config_name="base_prompt_v1.yaml",
@@ -122,18 +275,19 @@ def run(cfg: DictConfig):
 
     # Prepare prompt config
     cfg_dict = OmegaConf.to_container(cfg, resolve=True)
-    prompt_cfg = cfg_dict["prompt_entity"]
-    examples = "\n\n".join(prompt_cfg["examples"])
-    entity_descriptions = prompt_cfg.get("entity_types_descriptions", {})
-    entity_reference_lines = [
-        f"• {etype}: {entity_descriptions.get(etype, '')}"
-        for etype in prompt_cfg["entity_types"]
-    ]
-    entity_types_reference = "\n".join(entity_reference_lines)
-    # Run threaded processing
-    run_with_threads(df, cfg, prompt_cfg, entity_types_reference, examples)
-
-    df.to_csv(out_fname, index=False)
+    # template의 고정 부분을 한 번만 렌더링 (청크마다 prefix + 텍스트 + suffix)
+    compiled = compile_prompt(cfg_dict["prompt_entity"])
+    print_prompt_stats(compiled)
+    # async: AsyncExtractionRunner (기본), batch: OpenAI Batch API, threads: 예전 ThreadPoolExecutor 방식
+    engine = os.getenv("EXTRACT_ENGINE", "async")
+    if engine == "async":
+        run_with_async(df, cfg, compiled, chunk_text)
+    elif engine == "batch":
+        run_with_batch(df, cfg, compiled, chunk_text)
+    else:
+        run_with_threads(df, cfg, compiled, chunk_text)
+
+    to_csv_compatible(df).to_csv(out_fname, index=False)
     print(f"→ saved results to {out_fname}")
 
     
@@ -168,9 +322,9 @@ if __name__ == "__main__":
     '''
     chunk단위를 적재 + kg 삽임
     '''
-    csv_file_path = "./data/ustr_chunked.csv"
-    if not os.path.exists(csv_file_path):
+    if not chunk_store_exists(CHUNK_STORE_PATH):
         print("preprocess.py를 먼저 실행시키세요")
         exit()
-    df = pd.read_csv(csv_file_path, encoding="utf-8", delimiter=",")
+    df = read_chunks(CHUNK_STORE_PATH)
+    chunk_text = load_chunk_text_accessor(df, full_csv_path)
     run()
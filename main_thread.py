@@ -2,117 +2,176 @@ import hydra
 from omegaconf import DictConfig, OmegaConf
 import openai
 import os
+import time
 from dotenv import load_dotenv
 import pandas as pd
 from utils.to_kg import to_kg_in_chunk
+from utils.chunking import load_chunk_text_accessor
+from utils.chunk_store import (
+    CHUNK_STORE_PATH,
+    chunk_store_exists,
+    read_chunks,
+    to_csv_compatible,
+)
 from neo4j import GraphDatabase
 from utils.neo4j_utils import (
-    insert_entity_relationship,
-    check_entity_node_count,
-    check_entity_relationship_count,
-    insert_chunk_node,
-    insert_entity_node,
+    insert_chunk_kg,
     delete_all_nodes,
     check_document_node_count,
     insert_document_node,
     convert_date,
 )
 
+from utils.dedup import extraction_targets
+from utils.resources import close_resources, get_resources
+from utils.llm_cache import cached_chat_completion, open_llm_cache, print_llm_cache_stats
+from utils.async_extraction import AsyncExtractionRunner
+from utils.prompt_compiler import compile_prompt, print_prompt_stats
+
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from hydra.core.hydra_config import HydraConfig
 
 
-# --- Worker function for threading ---
-def process_row(i, row, cfg, prompt_cfg, entity_types_reference, examples):
-    client = openai.OpenAI(api_key=cfg.model.api_key)
-    input_text = row["chunk_text"]
-    doc_id = row["doc_id"]
-    chunk_id = row["chunk_id"] + 1
+def insert_extraction(i, row, members, entity_output, resources):
+    with resources.session() as session:
+        # 중복 클러스터 멤버는 대표 청크의 추출 결과를 그대로 자기 청크에 적재
+        for gid, member in [(i, row)] + list(members):
+            tmp_kg = to_kg_in_chunk(entity_output, gid)
+            insert_chunk_kg(session, member["chunk_id"] + 1, member["doc_id"], tmp_kg)
 
 
+# --- Worker function for threading ---
+def process_row(i, row, cfg, compiled, chunk_text, resources, members=(), cache=None):
+    input_text = chunk_text(row)
+    entity_output = cached_chat_completion(
+        resources.openai_client,
+        cache,
+        cfg.model.model_name,
+        compiled.messages(input_text),
+        cfg.model.temperature,
+        cfg.model.max_tokens,
+    )
+    insert_extraction(i, row, members, entity_output, resources)
+    return entity_output
 
-    prompt = prompt_cfg["prompt_template"].format(
-        language=prompt_cfg["language"],
-        tuple_delimiter=prompt_cfg["tuple_delimiter"],
-        record_delimiter=prompt_cfg["record_delimiter"],
-        completion_delimiter=prompt_cfg["completion_delimiter"],
-        entity_types_reference=entity_types_reference,
-        examples=examples,
-        entity_types=", ".join(prompt_cfg["entity_types"]),
-        input_text=input_text,
+# --- ThreadPoolExecutor runner ---
+def run_with_threads(df, cfg, compiled, chunk_text,save_as_csv=False):
+    max_workers = cfg.thread_workers if hasattr(cfg, 'thread_workers') else 16
+    start = time.perf_counter()
+    rows, targets, members = extraction_targets(
+        df,
+        chunk_text,
+        dedup=os.getenv("DEDUP", "1") == "1",
+        min_similarity=float(os.getenv("DEDUP_MIN_SIMILARITY", 0.97)),
     )
-    response = client.chat.completions.create(
-        model=cfg.model.model_name,
-        messages=[
-            {"role": "system", "content": prompt_cfg["system_prompt"]},
-            {"role": "user", "content": prompt},
-        ],
-        temperature=cfg.model.temperature,
-        max_tokens=cfg.model.max_tokens,
+    # worker 수만큼 keep-alive HTTP 연결 / Neo4j 연결을 가진 공유 client, driver
+    resources = get_resources(
+        api_key=cfg.model.api_key,
+        max_connections=max_workers,
+        neo4j_pool_size=int(os.getenv("NEO4J_POOL_SIZE", max_workers)),
     )
-    entity_output = response.choices[0].message.content
-    tmp_kg = to_kg_in_chunk(entity_output, i)
+    cache = open_llm_cache()
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(
+                process_row, *rows[pos], cfg, compiled, chunk_text,
+                resources, members.get(pos, []), cache): pos
+                for pos in targets
+            }
+            for future in as_completed(futures):
+                pos = futures[future]
+                idx = rows[pos][0]
+                # try:
+                #     future.result()
+                #     print(f"Processed chunk {idx}")
+                #     for future in as_completed(futures):
+                try:
+                    #future.result()
+                    result_text = future.result()
+                    print(f"Processed chunk {idx} (+{len(members.get(pos, []))} duplicates)")
+                    if save_as_csv:
+                        for member_idx in [idx] + [i for i, _ in members.get(pos, [])]:
+                            df.at[member_idx, "output"] = result_text
+    
+                except Exception as exc:
+                    print(f"Error processing chunk {idx}: {exc}")
+        print(f"Extraction: {len(futures)} LLM calls for {len(rows)} chunks in {time.perf_counter() - start:.1f}s")
+        print(f"Pools: {resources.pool_stats()}")
+        close_resources()
+    finally:
+        # 실패한 실행에서도 이미 받은 응답은 캐시에 남도록 commit
+        print_llm_cache_stats(cache)
+        if cache is not None:
+            cache.close()
 
-    driver = GraphDatabase.driver(
-        os.getenv("NEO4J_URI"),
-        auth=(os.getenv("NEO4J_USERNAME"), os.getenv("NEO4J_PASSWORD")),
-    )
-    with driver.session(database=os.getenv("NEO4J_DATABASE")) as session:
-        session.execute_write(
-            insert_chunk_node,
-            chunk_id,
-            doc_id,
-            tmp_kg["content_keywords"][0]["high_level_keywords"],
-        )
-        for ent in tmp_kg["entities"]:
-            session.execute_write(
-                insert_entity_node,
-                chunk_id,
-                doc_id,
-                ent["entity_name"],
-                ent["entity_type"],
-                ent["description"],
-            )
-        for rel in tmp_kg["relationships"]:
-            session.execute_write(
-                insert_entity_relationship,
-                chunk_id,
-                doc_id,
-                rel["src_id"],
-                rel["tgt_id"],
-                rel["description"],
-                rel["keywords"],
-                rel["weight"],
-            )
-        check_entity_node_count(session, doc_id, chunk_id, len(tmp_kg["entities"]))
-        check_entity_relationship_count(
-            session, doc_id, chunk_id, len(tmp_kg["relationships"]),
-        )
-    driver.close()
 
-# --- ThreadPoolExecutor runner ---
-def run_with_threads(df, cfg, prompt_cfg, entity_types_reference, examples,save_as_csv=False):
+# --- asyncio runner ---
+def run_with_async(df, cfg, compiled, chunk_text,save_as_csv=False):
+    """
+    LLM 요청은 AsyncExtractionRunner로 한꺼번에 보내고 (semaphore + RPM/TPM 한도),
+    응답이 오는 순서대로 to_kg_in_chunk + Neo4j 적재를 thread pool에서 처리합니다.
+    """
     max_workers = cfg.thread_workers if hasattr(cfg, 'thread_workers') else 16
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = {executor.submit(
-            process_row, i, row, cfg, prompt_cfg, entity_types_reference, examples): i
-            for i, row in df.iterrows()
+    start = time.perf_counter()
+    rows, targets, members = extraction_targets(
+        df,
+        chunk_text,
+        dedup=os.getenv("DEDUP", "1") == "1",
+        min_similarity=float(os.getenv("DEDUP_MIN_SIMILARITY", 0.97)),
+    )
+    max_in_flight = int(os.getenv("EXTRACT_CONCURRENCY", 256))
+    resources = get_resources(
+        api_key=cfg.model.api_key,
+        max_connections=max_in_flight,
+        neo4j_pool_size=int(os.getenv("NEO4J_POOL_SIZE", max_workers)),
+    )
+    cache = open_llm_cache()
+    try:
+        runner = AsyncExtractionRunner(
+            resources.make_async_openai_client(),
+            model=cfg.model.model_name,
+            temperature=cfg.model.temperature,
+            max_tokens=cfg.model.max_tokens,
+            max_in_flight=max_in_flight,
+            requests_per_minute=int(os.getenv("EXTRACT_RPM", 5000)),
+            tokens_per_minute=int(os.getenv("EXTRACT_TPM", 2_000_000)),
+            cache=cache,
+        )
+        llm_futures = {
+            runner.submit(compiled.messages(chunk_text(rows[pos][1]))): pos
+            for pos in targets
         }
-        for future in as_completed(futures):
-            idx = futures[future]
-            # try:
-            #     future.result()
-            #     print(f"Processed chunk {idx}")
-            #     for future in as_completed(futures):
-            try:
-                #future.result()
-                result_text = future.result()
-                print(f"Processed chunk {idx}")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            insert_futures = {}
+            for future in as_completed(llm_futures):
+                pos = llm_futures[future]
+                idx = rows[pos][0]
+                try:
+                    result_text = future.result()
+                except Exception as exc:
+                    print(f"Error processing chunk {idx}: {exc}")
+                    continue
                 if save_as_csv:
-                    df.at[idx, "output"] = result_text
-    
-            except Exception as exc:
-                print(f"Error processing chunk {idx}: {exc}")
+                    for member_idx in [idx] + [i for i, _ in members.get(pos, [])]:
+                        df.at[member_idx, "output"] = result_text
+                insert_futures[executor.submit(
+                    insert_extraction, *rows[pos], members.get(pos, []), result_text, resources)] = pos
+            for future in as_completed(insert_futures):
+                idx = rows[insert_futures[future]][0]
+                try:
+                    future.result()
+                    print(f"Processed chunk {idx} (+{len(members.get(insert_futures[future], []))} duplicates)")
+                except Exception as exc:
+                    print(f"Error processing chunk {idx}: {exc}")
+        runner.close()
+        print(f"Extraction: {len(llm_futures)} LLM calls for {len(rows)} chunks in {time.perf_counter() - start:.1f}s {runner.stats()}")
+        print(f"Pools: {resources.pool_stats()}")
+        close_resources()
+    finally:
+        # 실패한 실행에서도 이미 받은 응답은 캐시에 남도록 commit
+        print_llm_cache_stats(cache)
+        if cache is not None:
+            cache.close()
 @hydra.main(
     config_path="config",
     config_name="new.yaml",
@@ -121,22 +180,21 @@ def run_with_threads(df, cfg, prompt_cfg, entity_types_reference, examples,save_
 def run(cfg: DictConfig):
     # Prepare prompt config
     cfg_dict = OmegaConf.to_container(cfg, resolve=True)
-    prompt_cfg = cfg_dict["prompt_entity"]
-    examples = "\n\n".join(prompt_cfg["examples"])
-    entity_descriptions = prompt_cfg.get("entity_types_descriptions", {})
-    entity_reference_lines = [
-        f"• {etype}: {entity_descriptions.get(etype, '')}"
-        for etype in prompt_cfg["entity_types"]
-    ]
-    entity_types_reference = "\n".join(entity_reference_lines)
+    # template의 고정 부분을 한 번만 렌더링 (청크마다 prefix + 텍스트 + suffix)
+    compiled = compile_prompt(cfg_dict["prompt_entity"])
+    print_prompt_stats(compiled)
     
-    run_with_threads(df, cfg, prompt_cfg, entity_types_reference, examples,save_as_csv=save_as_csv)
+    # async: AsyncExtractionRunner (기본), threads: 예전 ThreadPoolExecutor 방식
+    if os.getenv("EXTRACT_ENGINE", "async") == "async":
+        run_with_async(df, cfg, compiled, chunk_text,save_as_csv=save_as_csv)
+    else:
+        run_with_threads(df, cfg, compiled, chunk_text,save_as_csv=save_as_csv)
     if save_as_csv:
         hydra_cfg = HydraConfig.get()
         config_name = hydra_cfg.job.config_name
         base = os.path.splitext(os.path.basename(config_name))[0]
         out_fname = f"./entity_outputs/{base}.csv"
-        df.to_csv(out_fname, index=False)
+        to_csv_compatible(df).to_csv(out_fname, index=False)
         print(f"→ saved results to {out_fname}")
 
 
@@ -172,9 +230,9 @@ if __name__ == "__main__":
     '''
     chunk단위를 적재 + kg 삽임
     '''
-    csv_file_path = "./data/ustr_chunked.csv"
-    if not os.path.exists(csv_file_path):
+    if not chunk_store_exists(CHUNK_STORE_PATH):
         print("preprocess.py를 먼저 실행시키세요")
         exit()
-    df = pd.read_csv(csv_file_path, encoding="utf-8", delimiter=",")
+    df = read_chunks(CHUNK_STORE_PATH)
+    chunk_text = load_chunk_text_accessor(df, full_csv_path)
     run()
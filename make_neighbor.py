@@ -1,27 +1,69 @@
-import pandas as pd
-from utils.faiss_utils import get_doc_neighbor,search_in_subset
+import os
+import time
+import numpy as np
+from utils.faiss_utils import (
+    DocIndex,
+    ExactReranker,
+    build_knn_neighbors,
+    index_metric,
+    is_exact_index,
+    load_faiss_index,
+)
 import faiss
+from utils.chunk_store import CHUNK_STORE_PATH, read_chunks, write_chunks
 
 
 if __name__ == "__main__":
-    df = pd.read_csv("./data/ustr_chunked.csv", encoding="utf-8", delimiter=",")
-    df['intra_doc_neighbor'] = None
-    df['inter_doc_neighbor'] = None
+    df = read_chunks(CHUNK_STORE_PATH)
+    TOP_K = 3
+    # 한 번에 검색할 이웃 수 = TOP_K + 1 + NEIGHBOR_OVERFETCH
+    NEIGHBOR_OVERFETCH = int(os.getenv("NEIGHBOR_OVERFETCH", 32))
+    VECTORS_FILE = "./faiss/vectors.npy"
+    # cosine similarity가 이 값 미만인 이웃은 저장하지 않음 (비우면 top_k 그대로)
+    MIN_SIMILARITY = os.getenv("NEIGHBOR_MIN_SIMILARITY")
 
-    index = faiss.read_index("./faiss/idmap.index")
-    base_index = faiss.downcast_index(index.index)
-    for id in df["global_id"]:
-        indoc_neighbor, outdoc_neighbor = get_doc_neighbor(df, id)
-        query = base_index.reconstruct(id).reshape(1, -1)
-        D, I = search_in_subset(
-            base_index, query_vector=query,query_index=id, index_subset=indoc_neighbor, top_k=3
+    # 검색만 하므로 read-only mmap으로 로딩 (worker 간 page cache 공유)
+    index = load_faiss_index("./faiss/idmap.index", dim=1536, mmap=True)
+    if os.path.exists(VECTORS_FILE):
+        # apply_faiss가 남긴 memmap을 그대로 query로 사용
+        vectors = np.load(VECTORS_FILE, mmap_mode="r")
+        ids = np.load(VECTORS_FILE + ".ids.npy")
+    else:
+        base_index = faiss.downcast_index(index.index)
+        vectors = base_index.reconstruct_n(0, base_index.ntotal)
+        ids = faiss.vector_to_array(index.id_map)
+    # 증분 preprocess 직후처럼 아직 임베딩되지 않은 청크가 있으면 이웃을 계산할 수 없음
+    missing = ~np.isin(df["global_id"].to_numpy(), ids)
+    if missing.any():
+        print(
+            f"벡터가 없는 청크 {int(missing.sum())}개 (global_id {df['global_id'][missing].iloc[0]} 등), "
+            "apply_faiss.py를 먼저 실행시키세요"
         )
-        #print(D,I)
-        df.at[id, 'intra_doc_neighbor'] = I.tolist()
-        D, I = search_in_subset(
-            base_index, query_vector=query,query_index=id, index_subset=outdoc_neighbor, top_k=3
+        exit()
+    doc_index = DocIndex.from_df(df)
+    reranker = None
+    if not is_exact_index(index) and os.path.exists(VECTORS_FILE):
+        # 압축 인덱스면 후보를 float32 원본으로 재정렬
+        reranker = ExactReranker(
+            VECTORS_FILE,
+            factor=int(os.getenv("RERANK_FACTOR", 4)),
+            metric=index_metric(index),
         )
-        #print(D,I)p
-        df.at[id, 'inter_doc_neighbor'] = I.tolist()
-        print(f"{id}처리")
-    df.to_csv("./data/ustr_chunked.csv", index=False)
+
+    start = time.perf_counter()
+    intra, inter = build_knn_neighbors(
+        index,
+        vectors,
+        ids,
+        doc_index,
+        top_k=TOP_K,
+        overfetch=NEIGHBOR_OVERFETCH,
+        reranker=reranker,
+        min_similarity=float(MIN_SIMILARITY) if MIN_SIMILARITY else None,
+    )
+    print(f"{len(ids)}개 청크 이웃 계산: {time.perf_counter() - start:.1f}s")
+
+    position = {gid: i for i, gid in enumerate(ids)}
+    df["intra_doc_neighbor"] = [intra[position[gid]] for gid in df["global_id"]]
+    df["inter_doc_neighbor"] = [inter[position[gid]] for gid in df["global_id"]]
+    write_chunks(df, CHUNK_STORE_PATH)
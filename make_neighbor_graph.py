@@ -0,0 +1,49 @@
+import os
+import time
+import numpy as np
+import faiss
+from utils.faiss_utils import DocIndex, load_faiss_index
+from utils.neighbor_graph import NEIGHBOR_GRAPH_PATH, build_range_graph
+from utils.chunk_store import CHUNK_STORE_PATH, read_chunks
+
+
+if __name__ == "__main__":
+    df = read_chunks(CHUNK_STORE_PATH, columns=["doc_id", "global_id"])
+    # similarity 기준값 / 청크당 최대 이웃 수 / 서로 이웃인 쌍만 남길지
+    MIN_SIMILARITY = float(os.getenv("GRAPH_MIN_SIMILARITY", 0.6))
+    MAX_NEIGHBORS = int(os.getenv("GRAPH_MAX_NEIGHBORS", 10))
+    MUTUAL = os.getenv("GRAPH_MUTUAL", "0") == "1"
+    VECTORS_FILE = "./faiss/vectors.npy"
+
+    index = load_faiss_index("./faiss/idmap.index", dim=1536, mmap=True)
+    if os.path.exists(VECTORS_FILE):
+        vectors = np.load(VECTORS_FILE, mmap_mode="r")
+        ids = np.load(VECTORS_FILE + ".ids.npy")
+    else:
+        base_index = faiss.downcast_index(index.index)
+        vectors = base_index.reconstruct_n(0, base_index.ntotal)
+        ids = faiss.vector_to_array(index.id_map)
+
+    start = time.perf_counter()
+    graph = build_range_graph(
+        index,
+        vectors,
+        ids,
+        min_similarity=MIN_SIMILARITY,
+        max_neighbors=MAX_NEIGHBORS,
+        mutual=MUTUAL,
+    )
+    graph.save(NEIGHBOR_GRAPH_PATH)
+
+    doc_index = DocIndex.from_df(df)
+    inter_pairs, _ = graph.pairs(doc_index, cross_doc=True)
+    intra_pairs, _ = graph.pairs(doc_index, cross_doc=False)
+    degrees = graph.degrees()
+    print(
+        f"{len(ids)}개 청크, edge {graph.n_edges}개 (similarity >= {MIN_SIMILARITY}, "
+        f"cap {MAX_NEIGHBORS}, mutual={MUTUAL}) {time.perf_counter() - start:.1f}s"
+    )
+    print(
+        f"degree 평균 {degrees.mean():.2f}, 이웃 없는 청크 {(degrees == 0).sum()}개, "
+        f"inter-doc 쌍 {len(inter_pairs)}개, intra-doc 쌍 {len(intra_pairs)}개 -> '{NEIGHBOR_GRAPH_PATH}'"
+    )
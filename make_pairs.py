@@ -1,33 +1,9 @@
-import csv
-import ast
+from utils.chunk_store import CHUNK_STORE_PATH, neighbor_pairs
 
 unique_pairs = set()
 
-with open("./data/ustr_chunked.csv", newline="", encoding="utf-8") as f:
-    reader = csv.DictReader(f)
-    for row in reader:
-        a = int(row["global_id"])
-        # 문자열로 된 리스트를 실제 파이썬 리스트로 변환
-        b_list = ast.literal_eval(row["inter_doc_neighbor"])  
-        for b in b_list:
-            if a == b:
-                # 자기 자신과의 링크는 스킵
-                continue
-            # (min, max) 순으로 정렬된 튜플을 키로 사용하면 1-5, 5-1이 같은 쌍으로 취급됩니다.
-            pair = tuple(sorted((a, b)))
-            unique_pairs.add(pair)
-
-with open("./data/ustr_chunked.csv", newline="", encoding="utf-8") as f:
-    reader = csv.DictReader(f)
-    for row in reader:
-        a = int(row["global_id"])
-        # 문자열로 된 리스트를 실제 파이썬 리스트로 변환
-        b_list = ast.literal_eval(row["intra_doc_neighbor"])  
-        for b in b_list:
-            if a == b:
-                # 자기 자신과의 링크는 스킵
-                continue
-            # (min, max) 순으로 정렬된 튜플을 키로 사용하면 1-5, 5-1이 같은 쌍으로 취급됩니다.
-            pair = tuple(sorted((a, b)))
-            unique_pairs.add(pair)
-
+# list<int64> 이웃 컬럼에서 (min, max) 순으로 정렬된 쌍을 바로 뽑습니다.
+# 1-5, 5-1은 같은 쌍으로 취급되고 자기 자신과의 링크는 제외됩니다.
+for column in ("inter_doc_neighbor", "intra_doc_neighbor"):
+    pairs = neighbor_pairs(CHUNK_STORE_PATH, column)
+    unique_pairs.update(map(tuple, pairs.tolist()))
@@ -0,0 +1,39 @@
+import os
+import numpy as np
+from utils.chunk_store import CHUNK_STORE_PATH, read_chunks
+from utils.shards import SHARD_DIR, build_shards
+
+
+if __name__ == "__main__":
+    # month | quarter
+    SHARD_GRANULARITY = os.getenv("SHARD_GRANULARITY", "month")
+    SHARD_INDEX_TYPE = os.getenv("SHARD_INDEX_TYPE", "flat")
+    FAISS_METRIC = os.getenv("FAISS_METRIC", "l2")
+    # 1이면 frozen shard까지 전부 다시 만듦
+    SHARD_REBUILD_ALL = os.getenv("SHARD_REBUILD_ALL", "0") == "1"
+    VECTORS_FILE = "./faiss/vectors.npy"
+
+    if not os.path.exists(VECTORS_FILE):
+        print("apply_faiss.py를 먼저 실행시키세요")
+        exit()
+    vectors = np.load(VECTORS_FILE, mmap_mode="r")
+    ids = np.load(VECTORS_FILE + ".ids.npy")
+    # 행별 텍스트 hash (같은 global_id로 다시 임베딩된 청크가 있는 shard를 frozen에서 제외)
+    hashes = None
+    if os.path.exists(VECTORS_FILE + ".hashes.npy"):
+        hashes = np.load(VECTORS_FILE + ".hashes.npy", mmap_mode="r")
+    df = read_chunks(CHUNK_STORE_PATH, columns=["global_id", "date"])
+    dates = df.set_index("global_id")["date"].reindex(ids)
+
+    manifest = build_shards(
+        vectors,
+        ids,
+        dates,
+        shard_dir=SHARD_DIR,
+        granularity=SHARD_GRANULARITY,
+        index_type=SHARD_INDEX_TYPE,
+        metric=FAISS_METRIC,
+        rebuild_all=SHARD_REBUILD_ALL,
+        hashes=hashes,
+    )
+    print(f"{len(manifest['shards'])}개 shard -> '{SHARD_DIR}'")
@@ -4,7 +4,23 @@ import openai
 import os
 from dotenv import load_dotenv
 import pandas as pd
-from utils.chunking import download_csv_from_s3, get_chuncked_df
+from utils.chunking import (
+    download_csv_from_s3,
+    get_chuncked_df,
+    get_chuncked_df_parallel,
+    stream_chunked_csv,
+    build_chunk_manifest,
+    load_chunk_manifest,
+    save_chunk_manifest,
+    rechunk_incremental,
+)
+from utils.chunk_store import (
+    CHUNK_STORE_PATH,
+    chunk_store_exists,
+    read_chunks,
+    write_chunks,
+)
+import json
 
 # if __name__ == "__main__":
 #     load_dotenv()
@@ -34,11 +50,59 @@ if __name__ == "__main__":
         os.mkdir("./data")
     csv_file_path = "./data/ustr_2023_press_releases.csv"
     tailed_csv_file_path =  "./data/ustr_2023_press_releases_tailed.csv"
-    chunked_csv_file_path = "./data/ustr_chunked.csv"
+    chunk_store_path = CHUNK_STORE_PATH
+    # chunking 프로세스 수 (1이면 단일 프로세스)
+    chunk_workers = int(os.getenv("CHUNK_WORKERS", os.cpu_count() or 1))
+    # "text": chunk_text 저장 / "offset": 원문 기준 char_start, char_end, n_tokens만 저장
+    chunk_mode = os.getenv("CHUNK_MODE", "text")
+    # 1이면 원본 CSV를 batch 단위로 읽고 청크를 파일에 이어쓰는 streaming 모드
+    streaming = os.getenv("PREPROCESS_STREAMING", "0") == "1"
+    batch_rows = int(os.getenv("PREPROCESS_BATCH_ROWS", 1000))
+    # 1이면 manifest의 content hash와 비교해 새로 생기거나 바뀐 문서만 다시 chunking
+    incremental = os.getenv("PREPROCESS_INCREMENTAL", "0") == "1"
+    manifest_path = "./data/chunk_manifest.json"
+    delta_path = "./data/chunk_delta.json"
 
-    # 파일이 없을 경우에만 다운로드
-    if not os.path.exists(csv_file_path):
-        download_csv_from_s3(csv_file_path)
+    # S3 객체가 바뀌었을 때만 다운로드 (ETag/size로 로컬 캐시 검증)
+    download_csv_from_s3(csv_file_path)
+    if incremental and chunk_store_exists(chunk_store_path):
+        df = pd.read_csv(csv_file_path, encoding="utf-8", delimiter=",")
+        df['date'] = pd.to_datetime(df['date'])
+        # doc_id는 rechunk_incremental이 manifest(url 기준)에서 이전 값을 찾아 붙임
+        filtered_df = df[df['date'] <= '2023-08-31'].copy()
+        chunked_df = read_chunks(chunk_store_path)
+        manifest = None
+        if os.path.exists(manifest_path):
+            manifest = load_chunk_manifest(manifest_path)
+        if manifest is None or "next_doc_id" not in manifest:
+            # manifest가 없거나 예전(doc_id key) 형식이면 이전 tailed CSV 기준으로 새로 만듦
+            prev_docs_df = pd.read_csv(tailed_csv_file_path, encoding="utf-8", delimiter=",")
+            manifest = build_chunk_manifest(prev_docs_df, chunked_df)
+        filtered_df, chunked_df, manifest, delta = rechunk_incremental(
+            filtered_df, chunked_df, manifest, num_workers=chunk_workers, mode=chunk_mode
+        )
+        filtered_df.to_csv(tailed_csv_file_path, index=False)
+        write_chunks(chunked_df, chunk_store_path)
+        save_chunk_manifest(manifest, manifest_path)
+        with open(delta_path, "w", encoding="utf-8") as f:
+            json.dump(delta, f)
+        print(
+            f"added={len(delta['added'])} changed={len(delta['changed'])} "
+            f"removed={len(delta['removed'])} -> {delta_path}"
+        )
+        exit()
+    if streaming:
+        if not chunk_store_exists(chunk_store_path):
+            stream_chunked_csv(
+                csv_file_path,
+                tailed_csv_file_path,
+                chunk_store_path,
+                date_cutoff="2023-08-31",
+                batch_rows=batch_rows,
+                num_workers=chunk_workers,
+                mode=chunk_mode,
+            )
+        exit()
     df = pd.read_csv(csv_file_path, encoding="utf-8", delimiter=",")
     if not os.path.exists(tailed_csv_file_path):
         df['date'] = pd.to_datetime(df['date'])
@@ -48,8 +112,11 @@ if __name__ == "__main__":
         filtered_df.insert(0, "doc_id", range(len(filtered_df)))
         filtered_df.to_csv(tailed_csv_file_path, index=False)
     else : 
-        filtered_df = pd.read_csv(tailed_csv_file_path, encoding="utf-8", delimiter=",",index_col=0)
-    if not os.path.exists(chunked_csv_file_path):
-        chunked_df = get_chuncked_df(filtered_df)
+        filtered_df = pd.read_csv(tailed_csv_file_path, encoding="utf-8", delimiter=",")
+    if not chunk_store_exists(chunk_store_path):
+        chunked_df = get_chuncked_df_parallel(
+            filtered_df, num_workers=chunk_workers, mode=chunk_mode
+        )
         chunked_df.insert(0, "global_id", range(len(chunked_df)))
-        chunked_df.to_csv(chunked_csv_file_path, index=False)
\ No newline at end of file
+        write_chunks(chunked_df, chunk_store_path)
+        save_chunk_manifest(build_chunk_manifest(filtered_df, chunked_df), manifest_path)
\ No newline at end of file
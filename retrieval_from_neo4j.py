@@ -10,6 +10,8 @@ import os
 from dotenv import load_dotenv
 from utils.to_kg import to_kg_inter_chunk
 from utils.neo4j_utils import insert_inter_relationship, fetch_chunk_entities
+from utils.chunk_store import CHUNK_STORE_PATH, NEIGHBOR_GRAPH_PATH, read_chunks
+import numpy as np
 
 
 
@@ -23,13 +25,13 @@ def get_unique_pairs(
     Returns:
         (inter_pairs, intra_pairs)
     """
-    def parse_neighbors(cell: Union[str, List[int]]) -> List[int]:
+    def parse_neighbors(cell: Union[str, List[int], np.ndarray]) -> List[int]:
         if isinstance(cell, str):
             try:
                 return ast.literal_eval(cell)
             except (ValueError, SyntaxError):
                 return []
-        elif isinstance(cell, list):
+        elif isinstance(cell, (list, np.ndarray)):
             return cell
         else:
             return []
@@ -135,8 +137,18 @@ def run(cfg: DictConfig):
 # 사용 예시
 if __name__ == "__main__":
     load_dotenv()
-    df = pd.read_csv("./data/ustr_chunked.csv", encoding="utf-8",delimiter=",")
+    df = read_chunks(CHUNK_STORE_PATH)
     inter_pairs, intra_pairs = get_unique_pairs(df)
+    if os.path.exists(NEIGHBOR_GRAPH_PATH):
+        # make_neighbor_graph.py 결과가 있으면 similarity 기준을 넘는 다른 문서 쌍만 LLM으로 보냄
+        # (faiss는 optional이라 그래프가 있을 때만 import)
+        from utils.faiss_utils import DocIndex
+        from utils.neighbor_graph import NeighborGraph
+
+        graph = NeighborGraph.load(NEIGHBOR_GRAPH_PATH)
+        pairs, _ = graph.pairs(DocIndex.from_df(df), cross_doc=True)
+        print(f"inter pairs: top-k {len(inter_pairs)}개 -> graph {len(pairs)}개")
+        inter_pairs = set(map(tuple, pairs.tolist()))
 
     driver = GraphDatabase.driver(
             os.getenv("NEO4J_URI"),
@@ -0,0 +1,121 @@
+import asyncio
+import threading
+from collections import deque
+import numpy as np
+import openai
+import tiktoken
+
+from utils.faiss_utils import iter_token_batches
+from utils.rate_limit import AsyncRateLimiter, backoff_delay, retry_after_seconds
+
+
+class AsyncEmbeddingRunner:
+    """
+    openai.AsyncOpenAI로 embeddings 요청을 동시에 여러 개 보내는 runner.
+
+    - max_in_flight: 동시에 진행 중인 요청 수 상한 (semaphore)
+    - requests_per_minute / tokens_per_minute: AsyncRateLimiter 한도
+    - 429(RateLimitError)를 받으면 jitter backoff 후 max_retries번까지 재시도.
+      SDK 자체 재시도가 겹치면 limiter 계산이 틀어지므로 client는 max_retries=0으로 바꿔 씁니다
+
+    이벤트 루프를 별도 스레드에서 돌리므로 동기 코드에서 get_embedding / get_embeddings /
+    embed_in_batches를 faiss_utils와 같은 방식으로 호출할 수 있습니다.
+    """
+
+    def __init__(
+        self,
+        client: openai.AsyncOpenAI,
+        model="text-embedding-3-small",
+        max_in_flight=16,
+        requests_per_minute=3000,
+        tokens_per_minute=1_000_000,
+        max_retries=6,
+        encoding_name="cl100k_base",
+    ):
+        self.client = client.with_options(max_retries=0)
+        self.model = model
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.encoding_name = encoding_name
+        self.tokenizer = tiktoken.get_encoding(encoding_name)
+        self.limiter = AsyncRateLimiter(requests_per_minute, tokens_per_minute)
+        self.semaphore = asyncio.Semaphore(max_in_flight)
+        self.n_requests = 0
+        self.n_rate_limited = 0
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    async def _embed(self, texts, n_tokens):
+        texts = [text.replace("\n", " ") for text in texts]
+        async with self.semaphore:
+            for attempt in range(self.max_retries + 1):
+                await self.limiter.acquire(n_tokens)
+                try:
+                    self.n_requests += 1
+                    response = await self.client.embeddings.create(
+                        input=texts, model=self.model
+                    )
+                    data = sorted(response.data, key=lambda d: d.index)
+                    return np.array([d.embedding for d in data], dtype=np.float32)
+                except openai.RateLimitError as e:
+                    self.n_rate_limited += 1
+                    if attempt == self.max_retries:
+                        raise
+                    await asyncio.sleep(
+                        backoff_delay(attempt, retry_after=retry_after_seconds(e))
+                    )
+
+    def count_tokens(self, texts):
+        return sum(
+            len(tokens) for tokens in self.tokenizer.encode_batch(texts, disallowed_special=())
+        )
+
+    def _submit(self, texts, n_tokens=None):
+        # TPM 차감용 토큰 수는 이벤트 루프가 막히지 않도록 호출 스레드에서 계산
+        if n_tokens is None:
+            n_tokens = self.count_tokens(texts)
+        return asyncio.run_coroutine_threadsafe(self._embed(texts, n_tokens), self.loop)
+
+    def get_embedding(self, text):
+        return self._submit([text]).result()[0]
+
+    def get_embeddings(self, texts):
+        return self._submit(list(texts)).result()
+
+    def embed_in_batches(
+        self, ids, texts, max_batch_tokens=100_000, max_batch_size=2048
+    ):
+        """
+        faiss_utils.embed_in_batches와 같은 (batch_ids, batch_vectors)를 입력 순서대로 yield 하지만,
+        batch 요청은 최대 max_in_flight개까지 동시에 보냅니다.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        texts = list(texts)
+        # 메모리가 무한정 쌓이지 않도록 대기 중인 batch 수를 제한
+        max_pending = self.max_in_flight * 2
+        pending = deque()
+        for batch, n_tokens in iter_token_batches(
+            texts, max_batch_tokens, max_batch_size, self.encoding_name
+        ):
+            pending.append(
+                (ids[batch], self._submit([texts[i] for i in batch], n_tokens))
+            )
+            if len(pending) >= max_pending:
+                batch_ids, future = pending.popleft()
+                yield batch_ids, future.result()
+        while pending:
+            batch_ids, future = pending.popleft()
+            yield batch_ids, future.result()
+
+    def stats(self):
+        return {
+            "requests": self.n_requests,
+            "rate_limited": self.n_rate_limited,
+        }
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self.client.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
@@ -0,0 +1,139 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+import openai
+import tiktoken
+
+from utils.rate_limit import AsyncRateLimiter, backoff_delay, retry_after_seconds
+from utils.llm_cache import llm_cache_key
+
+
+class AsyncExtractionRunner:
+    """
+    openai.AsyncOpenAI로 chat completion 요청을 동시에 여러 개 보내는 entity 추출 runner.
+
+    - max_in_flight: 동시에 진행 중인 요청 수 상한 (semaphore, 수천 개 가능)
+    - requests_per_minute / tokens_per_minute: AsyncRateLimiter 한도.
+      TPM은 prompt 토큰 + max_tokens(최대 completion)로 미리 차감합니다
+    - 429(RateLimitError)를 받으면 jitter backoff 후 max_retries번까지 재시도.
+      SDK 자체 재시도가 겹치면 limiter 계산이 틀어지므로 client는 max_retries=0으로 바꿔 씁니다
+    - cache (LLMCache)가 있으면 요청 전에 조회해 hit이면 보내지 않고, finish_reason이 "stop"인 응답은
+      저장합니다 (SQLite 쓰기는 이벤트 루프를 막지 않도록 executor 스레드에서)
+
+    AsyncEmbeddingRunner처럼 이벤트 루프를 별도 스레드에서 돌리므로 동기 코드에서 submit()으로
+    요청을 넣고 concurrent.futures.as_completed로 결과를 받아 to_kg_in_chunk / Neo4j 적재를 합니다.
+    """
+
+    def __init__(
+        self,
+        client: openai.AsyncOpenAI,
+        model="gpt-4o-mini",
+        temperature=0.3,
+        max_tokens=2048,
+        max_in_flight=256,
+        requests_per_minute=5000,
+        tokens_per_minute=2_000_000,
+        max_retries=6,
+        encoding_name="cl100k_base",
+        cache=None,
+    ):
+        self.client = client.with_options(max_retries=0)
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.cache = cache
+        self.tokenizer = tiktoken.get_encoding(encoding_name)
+        self.limiter = AsyncRateLimiter(requests_per_minute, tokens_per_minute)
+        self.semaphore = asyncio.Semaphore(max_in_flight)
+        self.n_requests = 0
+        self.n_rate_limited = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        # provider prompt caching으로 처리된 prompt 토큰 (usage.prompt_tokens_details.cached_tokens)
+        self.cached_prompt_tokens = 0
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def count_tokens(self, messages):
+        return sum(
+            len(self.tokenizer.encode(m["content"], disallowed_special=())) for m in messages
+        )
+
+    async def _complete(self, messages, n_tokens, key):
+        async with self.semaphore:
+            for attempt in range(self.max_retries + 1):
+                await self.limiter.acquire(n_tokens)
+                try:
+                    self.n_requests += 1
+                    response = await self.client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        temperature=self.temperature,
+                        max_tokens=self.max_tokens,
+                    )
+                    usage = response.usage
+                    if usage is not None:
+                        self.prompt_tokens += usage.prompt_tokens
+                        self.completion_tokens += usage.completion_tokens
+                        details = getattr(usage, "prompt_tokens_details", None)
+                        self.cached_prompt_tokens += getattr(details, "cached_tokens", 0) or 0
+                    choice = response.choices[0]
+                    content = choice.message.content
+                    if self.cache is not None and content is not None and choice.finish_reason == "stop":
+                        await self.loop.run_in_executor(
+                            None,
+                            self.cache.put,
+                            key,
+                            content,
+                            usage.prompt_tokens if usage else 0,
+                            usage.completion_tokens if usage else 0,
+                        )
+                    return content
+                except openai.RateLimitError as e:
+                    self.n_rate_limited += 1
+                    if attempt == self.max_retries:
+                        raise
+                    await asyncio.sleep(
+                        backoff_delay(attempt, retry_after=retry_after_seconds(e))
+                    )
+
+    def submit(self, messages):
+        """
+        Returns:
+            concurrent.futures.Future - 결과는 completion 텍스트 (process_row의 entity_output)
+
+        Args:
+            messages: CompiledPrompt.messages(청크 텍스트)
+        """
+        key = llm_cache_key(self.model, self.temperature, self.max_tokens, messages)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                future = Future()
+                future.set_result(cached)
+                return future
+        # 토큰 계산은 이벤트 루프가 막히지 않도록 호출 스레드에서
+        n_tokens = self.count_tokens(messages) + self.max_tokens
+        return asyncio.run_coroutine_threadsafe(
+            self._complete(messages, n_tokens, key), self.loop
+        )
+
+    def stats(self):
+        return {
+            "requests": self.n_requests,
+            "rate_limited": self.n_rate_limited,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_prompt_tokens": self.cached_prompt_tokens,
+        }
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self.client.close(), self.loop).result()
+        # cache.put에 쓰던 executor 스레드 정리
+        asyncio.run_coroutine_threadsafe(self.loop.shutdown_default_executor(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
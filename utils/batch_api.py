@@ -0,0 +1,308 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+
+BATCH_DIR = "./batch"
+BATCH_ENDPOINT = "/v1/chat/completions"
+# Batch API 한도: 파일당 요청 50,000개, 200MB
+MAX_BATCH_REQUESTS = 50_000
+MAX_BATCH_BYTES = 200 * 1024 * 1024
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def render_batch_files(
+    items,
+    model,
+    temperature,
+    max_tokens,
+    batch_dir=BATCH_DIR,
+    name="extraction",
+    max_requests=MAX_BATCH_REQUESTS,
+    max_bytes=MAX_BATCH_BYTES,
+):
+    """
+    (custom_id, messages)를 Batch API 입력 JSONL로 씁니다. 한도를 넘으면 여러 파일로 나눕니다.
+
+    Args:
+        items: (global_id, chat messages) iterable
+
+    Returns:
+        JSONL 파일 경로 리스트 (<batch_dir>/<name>.<part>.jsonl)
+    """
+    os.makedirs(batch_dir, exist_ok=True)
+    paths = []
+    f = None
+    n_requests = n_bytes = 0
+    for custom_id, messages in items:
+        line = json.dumps(
+            {
+                "custom_id": str(custom_id),
+                "method": "POST",
+                "url": BATCH_ENDPOINT,
+                "body": {
+                    "model": model,
+                    "messages": messages,
+                    "temperature": temperature,
+                    "max_tokens": max_tokens,
+                },
+            },
+            ensure_ascii=False,
+        ).encode("utf-8") + b"\n"
+        if f is None or n_requests >= max_requests or n_bytes + len(line) > max_bytes:
+            if f is not None:
+                f.close()
+            paths.append(os.path.join(batch_dir, f"{name}.{len(paths):03d}.jsonl"))
+            f = open(paths[-1], "wb")
+            n_requests = n_bytes = 0
+        f.write(line)
+        n_requests += 1
+        n_bytes += len(line)
+    if f is not None:
+        f.close()
+    return paths
+
+
+class OpenAIBatchBackend:
+    """
+    OpenAI Batch API (files.create -> batches.create -> batches.retrieve -> files.content)
+    """
+
+    def __init__(self, client, completion_window="24h"):
+        self.client = client
+        self.completion_window = completion_window
+
+    def submit(self, path):
+        with open(path, "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=self.completion_window,
+        )
+        return batch.id
+
+    def status(self, batch_id):
+        batch = self.client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        return {
+            "status": batch.status,
+            "output_file_id": batch.output_file_id,
+            "error_file_id": batch.error_file_id,
+            "completed": counts.completed if counts else 0,
+            "failed": counts.failed if counts else 0,
+            "total": counts.total if counts else 0,
+        }
+
+    def download(self, file_id, path):
+        # 결과 파일을 메모리에 올리지 않고 바로 디스크로
+        with self.client.files.with_streaming_response.content(file_id) as response:
+            response.stream_to_file(path)
+
+
+class LocalBatchBackend:
+    """
+    오프라인 테스트용 file 기반 Batch API stand-in.
+
+    submit하면 입력 JSONL을 <batch_dir>/local/<batch_id>/input.jsonl로 복사하고, 첫 status 호출에서
+    complete(body) -> 응답 body로 전부 처리해 Batch API와 같은 형식의 output.jsonl을 만듭니다.
+    complete 기본값은 mock_openai.mock_chat_completion.
+    """
+
+    def __init__(self, batch_dir=BATCH_DIR, complete=None):
+        if complete is None:
+            from utils.mock_openai import mock_chat_completion
+
+            complete = mock_chat_completion
+        self.root = os.path.join(batch_dir, "local")
+        self.complete = complete
+
+    def _dir(self, batch_id):
+        return os.path.join(self.root, batch_id)
+
+    def submit(self, path):
+        batch_id = f"batch_local_{uuid.uuid4().hex[:12]}"
+        os.makedirs(self._dir(batch_id))
+        with open(path, "rb") as src, open(os.path.join(self._dir(batch_id), "input.jsonl"), "wb") as dst:
+            for line in src:
+                dst.write(line)
+        return batch_id
+
+    def _run(self, batch_id):
+        completed = failed = 0
+        with open(os.path.join(self._dir(batch_id), "input.jsonl"), "r", encoding="utf-8") as src, open(
+            os.path.join(self._dir(batch_id), "output.jsonl"), "w", encoding="utf-8"
+        ) as dst:
+            for line in src:
+                request = json.loads(line)
+                try:
+                    response = {"status_code": 200, "body": self.complete(request["body"])}
+                    error = None
+                    completed += 1
+                except Exception as e:
+                    response = None
+                    error = {"code": type(e).__name__, "message": str(e)}
+                    failed += 1
+                dst.write(
+                    json.dumps(
+                        {
+                            "id": f"batch_req_{uuid.uuid4().hex[:12]}",
+                            "custom_id": request["custom_id"],
+                            "response": response,
+                            "error": error,
+                        },
+                        ensure_ascii=False,
+                    )
+                    + "\n"
+                )
+        return completed, failed
+
+    def status(self, batch_id):
+        state_path = os.path.join(self._dir(batch_id), "state.json")
+        if not os.path.exists(state_path):
+            completed, failed = self._run(batch_id)
+            with open(state_path, "w", encoding="utf-8") as f:
+                json.dump({"completed": completed, "failed": failed}, f)
+        with open(state_path, "r", encoding="utf-8") as f:
+            counts = json.load(f)
+        return {
+            "status": "completed",
+            "output_file_id": os.path.join(self._dir(batch_id), "output.jsonl"),
+            "error_file_id": None,
+            "completed": counts["completed"],
+            "failed": counts["failed"],
+            "total": counts["completed"] + counts["failed"],
+        }
+
+    def download(self, file_id, path):
+        with open(file_id, "rb") as src, open(path, "wb") as dst:
+            for line in src:
+                dst.write(line)
+
+
+def _state_path(batch_dir, name):
+    return os.path.join(batch_dir, f"{name}.state.json")
+
+
+def load_batch_state(batch_dir=BATCH_DIR, name="extraction"):
+    path = _state_path(batch_dir, name)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_batch_state(state, batch_dir=BATCH_DIR, name="extraction"):
+    path = _state_path(batch_dir, name)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def submit_batches(backend, paths, batch_dir=BATCH_DIR, name="extraction"):
+    """
+    입력 파일마다 batch를 제출하고 batch id를 <name>.state.json에 기록합니다.
+    내용(sha256)이 같은 파일은 다시 제출하지 않으므로 중간에 끊겨도 이어서 poll 할 수 있습니다.
+    단 이전 batch가 failed / expired / cancelled로 끝났으면(resubmit) 내용이 같아도 다시 제출합니다.
+    """
+    old = (load_batch_state(batch_dir, name) or {}).get("batches", {})
+    state = {"batches": {}}
+    for path in paths:
+        sha256 = _file_sha256(path)
+        if path in old and old[path]["sha256"] == sha256 and not old[path].get("resubmit"):
+            state["batches"][path] = old[path]
+            continue
+        state["batches"][path] = {
+            "batch_id": backend.submit(path),
+            "sha256": sha256,
+            "result": None,
+            "errors": None,
+        }
+        save_batch_state(state, batch_dir, name)
+        print(f"Submitted {path} -> {state['batches'][path]['batch_id']}")
+    save_batch_state(state, batch_dir, name)
+    return state
+
+
+def wait_for_batches(backend, state, batch_dir=BATCH_DIR, name="extraction", poll_interval=60):
+    """
+    모든 batch가 끝날 때까지 poll 하고, 끝난 batch의 결과 파일을 <input>.out.jsonl로 내려받습니다.
+
+    completed가 아닌 상태(failed / expired / cancelled)로 끝난 batch는 예외를 내지 않고 resubmit으로
+    표시해 다음 실행에서 다시 제출합니다. expired는 끝난 요청만 담긴 부분 결과를 그대로 내려받습니다.
+
+    Returns:
+        결과 JSONL 경로 리스트 (실패한 요청이 담긴 error 파일 포함)
+    """
+    pending = {
+        path
+        for path, entry in state["batches"].items()
+        if entry["result"] is None and entry.get("status") not in TERMINAL_STATUSES
+    }
+    while pending:
+        for path in sorted(pending):
+            entry = state["batches"][path]
+            status = backend.status(entry["batch_id"])
+            print(
+                f"[{entry['batch_id']}] {status['status']} "
+                f"{status['completed']}/{status['total']} (failed {status['failed']})"
+            )
+            if status["status"] not in TERMINAL_STATUSES:
+                continue
+            entry["status"] = status["status"]
+            if status["status"] != "completed":
+                entry["resubmit"] = True
+                print(
+                    f"⚠️ batch {entry['batch_id']} for {path} ended with {status['status']}, "
+                    "resubmitting on the next run"
+                )
+            # 요청이 전부 실패하면 output_file_id가 None
+            if status["output_file_id"]:
+                entry["result"] = path.replace(".jsonl", ".out.jsonl")
+                backend.download(status["output_file_id"], entry["result"])
+            if status["error_file_id"]:
+                entry["errors"] = path.replace(".jsonl", ".err.jsonl")
+                backend.download(status["error_file_id"], entry["errors"])
+            save_batch_state(state, batch_dir, name)
+            pending.discard(path)
+        if pending:
+            time.sleep(poll_interval)
+    return [
+        path
+        for entry in state["batches"].values()
+        for path in (entry["result"], entry["errors"])
+        if path is not None
+    ]
+
+
+def iter_batch_results(result_paths):
+    """
+    결과 JSONL을 한 줄씩 읽어 (global_id, completion 텍스트 or None, error, usage, finish_reason) yield
+    """
+    for path in result_paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                response = record.get("response")
+                if record.get("error") is None and response and response["status_code"] == 200:
+                    body = response["body"]
+                    choice = body["choices"][0]
+                    yield (
+                        int(record["custom_id"]),
+                        choice["message"]["content"],
+                        None,
+                        body.get("usage"),
+                        choice.get("finish_reason"),
+                    )
+                else:
+                    yield int(record["custom_id"]), None, record.get("error") or response, None, None
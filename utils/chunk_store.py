@@ -0,0 +1,185 @@
+import os
+import ast
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# 청크 저장소 경로 (ustr_chunked.csv를 대체)
+CHUNK_STORE_PATH = "./data/ustr_chunked.parquet"
+LEGACY_CSV_PATH = "./data/ustr_chunked.csv"
+# make_neighbor_graph.py 결과 (faiss 없이도 경로를 import 할 수 있도록 여기에 둠)
+NEIGHBOR_GRAPH_PATH = "./data/neighbor_graph.npz"
+
+# list<int64>로 저장하는 이웃 컬럼
+NEIGHBOR_COLUMNS = ["intra_doc_neighbor", "inter_doc_neighbor"]
+NEIGHBOR_TYPE = pa.list_(pa.int64())
+
+
+def _to_id_list(cell):
+    """
+    이웃 셀 하나를 int 리스트로 변환합니다.
+    예전 CSV의 "[1, 2, 3]" 문자열, list, numpy array, 빈 값(None/NaN)을 모두 처리합니다.
+    """
+    if cell is None:
+        return []
+    if isinstance(cell, str):
+        try:
+            cell = ast.literal_eval(cell)
+        except (ValueError, SyntaxError):
+            return []
+    if isinstance(cell, (list, tuple, np.ndarray)):
+        return [int(x) for x in cell]
+    return []
+
+
+def _to_table(df, schema=None):
+    # date는 항상 timestamp로 저장 (예전 CSV에서 읽은 문자열과 preprocess의 Timestamp가 섞이지 않도록)
+    if "date" in df.columns and not pd.api.types.is_datetime64_any_dtype(df["date"]):
+        df = df.assign(date=pd.to_datetime(df["date"]))
+    neighbor_cols = [col for col in NEIGHBOR_COLUMNS if col in df.columns]
+    table = pa.Table.from_pandas(df.drop(columns=neighbor_cols), preserve_index=False)
+    for col in neighbor_cols:
+        values = pa.array([_to_id_list(c) for c in df[col]], type=NEIGHBOR_TYPE)
+        table = table.append_column(pa.field(col, NEIGHBOR_TYPE), values)
+    if schema is not None:
+        table = table.select(schema.names).cast(schema)
+    return table
+
+
+def write_chunks(df, path=CHUNK_STORE_PATH):
+    """
+    청크 DataFrame을 Parquet으로 저장합니다. 이웃 컬럼은 list<int64>로 저장됩니다.
+    """
+    tmp_path = path + ".tmp"
+    pq.write_table(_to_table(df), tmp_path)
+    os.replace(tmp_path, path)
+
+
+def read_chunk_table(path=CHUNK_STORE_PATH, columns=None, memory_map=True):
+    """
+    청크 저장소를 pyarrow Table로 읽습니다. 필요한 컬럼만 memory-map으로 읽을 수 있습니다.
+    """
+    return pq.read_table(path, columns=columns, memory_map=memory_map)
+
+
+def read_chunks(path=CHUNK_STORE_PATH, columns=None, memory_map=True):
+    """
+    청크 저장소를 DataFrame으로 읽습니다.
+
+    Args:
+        path: .parquet 경로 (.csv를 주면 예전 형식으로 읽고 이웃 컬럼을 한 번만 파싱)
+        columns: 읽을 컬럼 목록 (None이면 전체)
+        memory_map: Parquet 파일을 memory-map으로 열지 여부
+
+    Returns:
+        DataFrame (이웃 컬럼은 int64 numpy array 셀)
+    """
+    if path.endswith(".csv"):
+        df = pd.read_csv(path, encoding="utf-8", delimiter=",", usecols=columns)
+        for col in NEIGHBOR_COLUMNS:
+            if col in df.columns:
+                df[col] = [
+                    np.array(_to_id_list(c), dtype=np.int64) for c in df[col]
+                ]
+        return df
+    return read_chunk_table(path, columns, memory_map).to_pandas()
+
+
+def chunk_store_columns(path=CHUNK_STORE_PATH):
+    return pq.read_schema(path).names
+
+
+def chunk_text_columns(path=CHUNK_STORE_PATH):
+    """
+    ChunkTextAccessor에 필요한 컬럼 목록 (text 모드 / offset 모드 자동 판별)
+    """
+    if "chunk_text" in chunk_store_columns(path):
+        return ["global_id", "doc_id", "chunk_id", "chunk_text"]
+    return ["global_id", "doc_id", "chunk_id", "char_start", "char_end"]
+
+
+def migrate_csv_to_store(csv_path=LEGACY_CSV_PATH, path=CHUNK_STORE_PATH):
+    """
+    예전 ustr_chunked.csv를 Parquet 저장소로 한 번 변환합니다.
+    """
+    write_chunks(read_chunks(csv_path), path)
+    print(f"Migrated '{csv_path}' -> '{path}'")
+
+
+def chunk_store_exists(path=CHUNK_STORE_PATH, legacy_csv_path=LEGACY_CSV_PATH):
+    """
+    저장소가 있으면 True. 저장소는 없고 예전 CSV만 있으면 변환 후 True를 반환합니다.
+    """
+    if os.path.exists(path):
+        return True
+    if os.path.exists(legacy_csv_path):
+        migrate_csv_to_store(legacy_csv_path, path)
+        return True
+    return False
+
+
+class ChunkStoreWriter:
+    """
+    청크 batch를 하나의 Parquet 파일에 row group 단위로 이어쓰는 writer.
+    첫 batch의 schema를 기준으로 이후 batch를 cast 합니다.
+    """
+
+    def __init__(self, path=CHUNK_STORE_PATH):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.writer = None
+
+    def write(self, df):
+        if self.writer is None:
+            table = _to_table(df)
+            self.writer = pq.ParquetWriter(self.tmp_path, table.schema)
+        else:
+            table = _to_table(df, self.writer.schema)
+        self.writer.write_table(table)
+
+    def close(self, commit=True):
+        if self.writer is None:
+            return
+        self.writer.close()
+        self.writer = None
+        if commit:
+            os.replace(self.tmp_path, self.path)
+        else:
+            os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(commit=exc_type is None)
+
+
+def neighbor_pairs(path=CHUNK_STORE_PATH, column="inter_doc_neighbor"):
+    """
+    이웃 컬럼에서 (min, max)로 정렬된 고유한 (global_id, global_id) 쌍을 뽑습니다.
+    list<int64> 컬럼의 offsets/values를 그대로 써서 row 단위 파싱 없이 계산합니다.
+
+    Returns:
+        shape (P, 2) int64 numpy array
+    """
+    table = read_chunk_table(path, columns=["global_id", column])
+    gids = table.column("global_id").to_numpy()
+    lists = table.column(column).combine_chunks()
+    lengths = lists.value_lengths().fill_null(0).to_numpy()
+    values = lists.flatten().to_numpy()
+    src = np.repeat(gids, lengths)
+    keep = src != values  # 자기 자신과의 링크는 스킵
+    pairs = np.sort(np.stack([src[keep], values[keep]], axis=1), axis=1)
+    return np.unique(pairs, axis=0)
+
+
+def to_csv_compatible(df):
+    """
+    이웃 컬럼의 numpy array 셀을 python list로 바꾼 복사본 (CSV로 내보낼 때 "[1, 2]" 형식 유지)
+    """
+    df = df.copy()
+    for col in NEIGHBOR_COLUMNS:
+        if col in df.columns:
+            df[col] = [_to_id_list(c) for c in df[col]]
+    return df
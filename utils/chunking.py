@@ -1,36 +1,100 @@
 import os
-import boto3
+import json
+import hashlib
 import tiktoken
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from utils.chunk_store import ChunkStoreWriter
+from utils.s3_fetch import DEFAULT_BUCKET, DEFAULT_KEY, S3Fetcher
+
+
+def _token_windows(n_tokens, chunk_size=500, overlap=100):
+    """
+    토큰 길이 n_tokens에 대해 (start, end) 윈도우를 순서대로 생성합니다.
+    chunk_text_with_overlap과 같은 규칙(마지막 청크에서 종료)을 따릅니다.
+    """
+    start = 0
+    while start < n_tokens:
+        end = min(start + chunk_size, n_tokens)
+        yield start, end
+        if end == n_tokens:  # 마지막 청크 처리
+            break
+        start += chunk_size - overlap
 
 
 def chunk_text_with_overlap(tokenizer, text, chunk_size=500, overlap=100):
     tokens = tokenizer.encode(text)
     chunks = []
-    start = 0
-    while start < len(tokens):
-        end = min(start + chunk_size, len(tokens))
+    for start, end in _token_windows(len(tokens), chunk_size, overlap):
         chunk_tokens = tokens[start:end]
         chunk_text = tokenizer.decode(chunk_tokens)
         chunks.append(chunk_text)
-        if end == len(tokens):  # 마지막 청크 처리
-            break
-        start += chunk_size - overlap
     return chunks
 
 
-def download_csv_from_s3(csv_file_path):
-    s3 = boto3.client(
-        "s3",
-        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-        region_name="ap-northeast-2",
+def chunk_offsets_with_overlap(tokenizer, text, chunk_size=500, overlap=100):
+    """
+    chunk_text_with_overlap과 같은 윈도우로 자르되, 텍스트 대신
+    원문 text 기준 (char_start, char_end, n_tokens)만 반환합니다.
+    청크 텍스트는 text[char_start:char_end]로 필요할 때 잘라 씁니다.
+    """
+    tokens = tokenizer.encode(text)
+    return _offsets_from_tokens(tokenizer, tokens, len(text), chunk_size, overlap)
+
+
+def _offsets_from_tokens(tokenizer, tokens, text_len, chunk_size=500, overlap=100):
+    # 토큰별 시작 문자 위치 (문서 전체를 한 번만 decode)
+    _, token_starts = tokenizer.decode_with_offsets(tokens)
+    spans = []
+    for start, end in _token_windows(len(tokens), chunk_size, overlap):
+        char_start = token_starts[start]
+        char_end = token_starts[end] if end < len(tokens) else text_len
+        spans.append((char_start, char_end, end - start))
+    return spans
+
+
+class ChunkTextAccessor:
+    """
+    청크 row에서 chunk_text를 꺼내는 accessor.
+    offset 모드 청크는 원문 content에서 [char_start:char_end]를 호출 시점에 잘라 반환하고,
+    text 모드 청크(chunk_text 컬럼이 있는 경우)는 그대로 반환합니다.
+    """
+
+    def __init__(self, docs_df=None):
+        self.contents = (
+            None
+            if docs_df is None
+            else dict(zip(docs_df["doc_id"], docs_df["content"]))
+        )
+
+    def __call__(self, row):
+        if self.contents is None:
+            return row["chunk_text"]
+        content = self.contents[row["doc_id"]]
+        return content[int(row["char_start"]) : int(row["char_end"])]
+
+    def iter_texts(self, chunked_df):
+        for _, row in chunked_df.iterrows():
+            yield self(row)
+
+
+def load_chunk_text_accessor(chunked_df, docs_csv_path):
+    """
+    chunked_df 형식에 맞는 ChunkTextAccessor를 만듭니다.
+    offset 모드 청크일 때만 원문 CSV(doc_id, content)를 읽습니다.
+    """
+    if "chunk_text" in chunked_df.columns:
+        return ChunkTextAccessor()
+    docs_df = pd.read_csv(
+        docs_csv_path, encoding="utf-8", delimiter=",", usecols=["doc_id", "content"]
     )
-    bucket_name = "ossca"
-    key = "USTRGraph/ustr_2023_press_releases.csv"
-    local_file_path = csv_file_path
-    # S3에서 파일 다운로드
-    s3.download_file(bucket_name, key, local_file_path)
+    return ChunkTextAccessor(docs_df)
+
+
+def download_csv_from_s3(csv_file_path, bucket_name=DEFAULT_BUCKET, key=DEFAULT_KEY):
+    # S3에서 파일 다운로드 (ETag/size가 같으면 로컬 캐시 사용, 중단된 다운로드는 이어받기)
+    return S3Fetcher().fetch(bucket_name, key, csv_file_path)
 
 
 def get_chuncked_df(df, chunk_size=500, chunk_overlap=100):
@@ -57,3 +121,460 @@ def get_chuncked_df(df, chunk_size=500, chunk_overlap=100):
             )
     chunked_df = pd.DataFrame(chunked_data)
     return chunked_df
+
+
+#######################
+# Parallel chunking   #
+#######################
+# chunk mode별 출력 컬럼
+CHUNK_COLUMNS = {
+    "text": ["doc_id", "chunk_id", "title", "date", "url", "chunk_text"],
+    "offset": [
+        "doc_id",
+        "chunk_id",
+        "title",
+        "date",
+        "url",
+        "char_start",
+        "char_end",
+        "n_tokens",
+    ],
+}
+
+# 워커 프로세스마다 한 번만 만드는 tokenizer
+_worker_tokenizer = None
+
+
+def _init_chunk_worker(encoding_name):
+    global _worker_tokenizer
+    _worker_tokenizer = tiktoken.get_encoding(encoding_name)
+
+
+def _chunk_batch(
+    records, chunk_size=500, chunk_overlap=100, num_threads=1, mode="text"
+):
+    """
+    문서 묶음(records)을 한 번에 tokenize/decode 해서 청크 dict 리스트를 반환합니다.
+
+    Args:
+        records: (doc_id, title, date, url, content) 튜플 리스트
+        num_threads: tiktoken batch encode/decode에 사용할 스레드 수
+        mode: "text"면 chunk_text를, "offset"이면 char_start/char_end/n_tokens를 저장
+
+    Returns:
+        get_chuncked_df와 같은 key를 가진 dict 리스트 (입력 순서 유지)
+    """
+    tokenizer = _worker_tokenizer
+    token_lists = tokenizer.encode_batch(
+        [r[4] for r in records], num_threads=num_threads
+    )
+    if mode == "offset":
+        chunked_data = []
+        for (doc_id, title, date, url, content), tokens in zip(records, token_lists):
+            spans = _offsets_from_tokens(
+                tokenizer, tokens, len(content), chunk_size, chunk_overlap
+            )
+            for i, (char_start, char_end, n_tokens) in enumerate(spans):
+                chunked_data.append(
+                    {
+                        "doc_id": doc_id,
+                        "chunk_id": i,
+                        "title": title,
+                        "date": date,
+                        "url": url,
+                        "char_start": char_start,
+                        "char_end": char_end,
+                        "n_tokens": n_tokens,
+                    }
+                )
+        return chunked_data
+
+    windows = []
+    slices = []
+    for doc_idx, tokens in enumerate(token_lists):
+        for i, (start, end) in enumerate(
+            _token_windows(len(tokens), chunk_size, chunk_overlap)
+        ):
+            windows.append((doc_idx, i))
+            slices.append(tokens[start:end])
+    texts = tokenizer.decode_batch(slices, num_threads=num_threads)
+
+    chunked_data = []
+    for (doc_idx, i), chunk in zip(windows, texts):
+        doc_id, title, date, url, _ = records[doc_idx]
+        chunked_data.append(
+            {
+                "doc_id": doc_id,
+                "chunk_id": i,
+                "title": title,
+                "date": date,
+                "url": url,
+                "chunk_text": chunk,
+            }
+        )
+    return chunked_data
+
+
+def get_chuncked_df_parallel(
+    df,
+    chunk_size=500,
+    chunk_overlap=100,
+    num_workers=None,
+    batch_docs=64,
+    encoding_name="cl100k_base",
+    mode="text",
+):
+    """
+    get_chuncked_df의 병렬 버전.
+    문서를 batch_docs개씩 묶어 tiktoken batch encoding으로 처리하고,
+    묶음들을 ProcessPool에 나눠서 돌립니다. 결과 순서와 컬럼은 get_chuncked_df와 동일합니다.
+
+    Args:
+        df: doc_id, title, date, url, content 컬럼을 가진 DataFrame
+        num_workers: 프로세스 수 (None이면 os.cpu_count(), 1이면 현재 프로세스에서 실행)
+        batch_docs: 한 번에 tokenize할 문서 수
+        mode: "text" 또는 "offset" (offset이면 텍스트 대신 원문 기준 위치만 저장)
+
+    Returns:
+        doc_id, chunk_id, title, date, url 과
+        chunk_text (text 모드) 또는 char_start, char_end, n_tokens (offset 모드) 컬럼의 DataFrame
+    """
+    if mode not in CHUNK_COLUMNS:
+        raise ValueError(f"지원하지 않는 chunk mode입니다: {mode}")
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+    records = list(
+        zip(df["doc_id"], df["title"], df["date"], df["url"], df["content"])
+    )
+    batches = [
+        records[i : i + batch_docs] for i in range(0, len(records), batch_docs)
+    ]
+
+    chunked_data = []
+    if num_workers <= 1:
+        _init_chunk_worker(encoding_name)
+        worker = partial(
+            _chunk_batch,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            num_threads=8,
+            mode=mode,
+        )
+        for batch in batches:
+            chunked_data.extend(worker(batch))
+    else:
+        worker = partial(
+            _chunk_batch,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            mode=mode,
+        )
+        with ProcessPoolExecutor(
+            max_workers=num_workers,
+            initializer=_init_chunk_worker,
+            initargs=(encoding_name,),
+        ) as executor:
+            # map은 입력 순서대로 결과를 돌려주므로 global_id 순서가 유지됨
+            for batch_result in executor.map(worker, batches):
+                chunked_data.extend(batch_result)
+
+    return pd.DataFrame(chunked_data, columns=CHUNK_COLUMNS[mode])
+
+
+#######################
+# Streaming chunking  #
+#######################
+def iter_chunked_batches(
+    csv_file_path,
+    date_cutoff="2023-08-31",
+    batch_rows=1000,
+    chunk_size=500,
+    chunk_overlap=100,
+    num_workers=None,
+    batch_docs=64,
+    encoding_name="cl100k_base",
+    mode="text",
+):
+    """
+    원본 press CSV를 batch_rows 행씩 읽어서 (문서 batch, 청크 batch)를 차례로 yield 합니다.
+    date_cutoff 이후 문서는 버리고, doc_id / global_id는 batch를 넘어 이어서 부여하므로
+    전체를 한 번에 처리한 결과와 같은 id가 나옵니다.
+
+    Yields:
+        (docs_df, chunked_df) - doc_id가 붙은 문서 batch와 global_id가 붙은 청크 batch
+    """
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+    worker = partial(
+        _chunk_batch, chunk_size=chunk_size, chunk_overlap=chunk_overlap, mode=mode
+    )
+    executor = None
+    if num_workers > 1:
+        executor = ProcessPoolExecutor(
+            max_workers=num_workers,
+            initializer=_init_chunk_worker,
+            initargs=(encoding_name,),
+        )
+    else:
+        _init_chunk_worker(encoding_name)
+        worker = partial(worker, num_threads=8)
+
+    next_doc_id = 0
+    next_global_id = 0
+    try:
+        reader = pd.read_csv(
+            csv_file_path, encoding="utf-8", delimiter=",", chunksize=batch_rows
+        )
+        for batch_df in reader:
+            batch_df["date"] = pd.to_datetime(batch_df["date"])
+            docs_df = batch_df[batch_df["date"] <= date_cutoff].copy()
+            if docs_df.empty:
+                continue
+            docs_df.insert(
+                0, "doc_id", range(next_doc_id, next_doc_id + len(docs_df))
+            )
+            next_doc_id += len(docs_df)
+
+            records = list(
+                zip(
+                    docs_df["doc_id"],
+                    docs_df["title"],
+                    docs_df["date"],
+                    docs_df["url"],
+                    docs_df["content"],
+                )
+            )
+            sub_batches = [
+                records[i : i + batch_docs]
+                for i in range(0, len(records), batch_docs)
+            ]
+            if executor is not None:
+                results = executor.map(worker, sub_batches)
+            else:
+                results = map(worker, sub_batches)
+            chunked_data = [chunk for result in results for chunk in result]
+            chunked_df = pd.DataFrame(chunked_data, columns=CHUNK_COLUMNS[mode])
+            chunked_df.insert(
+                0,
+                "global_id",
+                range(next_global_id, next_global_id + len(chunked_df)),
+            )
+            next_global_id += len(chunked_df)
+            yield docs_df, chunked_df
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+def stream_chunked_csv(
+    csv_file_path, tailed_csv_file_path, chunked_csv_file_path, **kwargs
+):
+    """
+    iter_chunked_batches 결과를 tailed CSV / chunked CSV에 batch 단위로 이어씁니다.
+    메모리에는 한 batch만 올라가므로 코퍼스 크기와 무관하게 사용량이 일정합니다.
+    중간에 실패해도 반쯤 쓰인 파일이 남지 않도록 .tmp에 쓰고 마지막에 교체합니다.
+
+    Args:
+        kwargs: iter_chunked_batches 인자 (date_cutoff, batch_rows, mode 등)
+
+    Returns:
+        (문서 수, 청크 수)
+    """
+    tmp_tailed = tailed_csv_file_path + ".tmp"
+    tmp_chunked = chunked_csv_file_path + ".tmp"
+    # .parquet이면 청크 저장소에 row group으로, 아니면 CSV에 이어씀
+    store_writer = None
+    if chunked_csv_file_path.endswith(".parquet"):
+        store_writer = ChunkStoreWriter(chunked_csv_file_path)
+    n_docs = n_chunks = 0
+    committed = False
+    try:
+        for docs_df, chunked_df in iter_chunked_batches(csv_file_path, **kwargs):
+            first = n_docs == 0
+            docs_df.to_csv(tmp_tailed, mode="w" if first else "a", header=first, index=False)
+            if store_writer is not None:
+                store_writer.write(chunked_df)
+            else:
+                chunked_df.to_csv(tmp_chunked, mode="w" if first else "a", header=first, index=False)
+            n_docs += len(docs_df)
+            n_chunks += len(chunked_df)
+            print(f"streamed docs={n_docs} chunks={n_chunks}")
+        if n_docs == 0:
+            print("조건에 맞는 문서가 없습니다")
+            return n_docs, n_chunks
+        if store_writer is not None:
+            store_writer.close()
+        else:
+            os.replace(tmp_chunked, chunked_csv_file_path)
+        os.replace(tmp_tailed, tailed_csv_file_path)
+        committed = True
+    finally:
+        # batch 처리 중 예외가 나면 열린 writer를 닫고 .tmp 파일을 지움
+        if not committed:
+            if store_writer is not None:
+                store_writer.close(commit=False)
+            for path in (tmp_tailed, tmp_chunked):
+                if os.path.exists(path):
+                    os.remove(path)
+    return n_docs, n_chunks
+
+
+#########################
+# Incremental chunking  #
+#########################
+def content_hash(text):
+    return hashlib.sha256(str(text).encode("utf-8")).hexdigest()
+
+
+def document_keys(docs_df):
+    """
+    문서마다 위치와 상관없는 식별자를 만듭니다 (manifest key).
+    url을 쓰고, url이 없으면 title + date를 씁니다. 같은 key가 여러 번 나오면 "#n"을 붙입니다.
+    doc_id는 CSV 안의 순서라 중간에 문서가 끼거나 빠지면 뒤 문서가 전부 밀리므로 key로 쓰지 않습니다.
+    """
+    keys = []
+    seen = {}
+    for _, row in docs_df.iterrows():
+        url = row.get("url")
+        if isinstance(url, str) and url.strip():
+            key = url.strip()
+        else:
+            key = f"{row.get('title', '')}|{row.get('date', '')}"
+        n = seen.get(key, 0)
+        seen[key] = n + 1
+        keys.append(key if n == 0 else f"{key}#{n}")
+    return keys
+
+
+def build_chunk_manifest(docs_df, chunked_df):
+    """
+    현재 문서/청크 상태로 manifest를 만듭니다.
+
+    manifest 형식:
+        {"next_global_id": int, "next_doc_id": int,
+         "docs": {"<document_key>": {"doc_id": int, "hash": sha256(content), "global_ids": [...]}}}
+    """
+    gids_by_doc = chunked_df.sort_values(["doc_id", "chunk_id"]).groupby("doc_id")[
+        "global_id"
+    ]
+    gids_by_doc = {doc_id: [int(g) for g in gids] for doc_id, gids in gids_by_doc}
+    docs = {}
+    for key, doc_id, content in zip(
+        document_keys(docs_df), docs_df["doc_id"], docs_df["content"]
+    ):
+        docs[key] = {
+            "doc_id": int(doc_id),
+            "hash": content_hash(content),
+            "global_ids": gids_by_doc.get(doc_id, []),
+        }
+    next_global_id = int(chunked_df["global_id"].max()) + 1 if len(chunked_df) else 0
+    next_doc_id = int(docs_df["doc_id"].max()) + 1 if len(docs_df) else 0
+    return {"next_global_id": next_global_id, "next_doc_id": next_doc_id, "docs": docs}
+
+
+def assign_doc_ids(docs_df, manifest):
+    """
+    manifest에 있는 문서(document_keys 기준)는 이전 doc_id를 그대로, 새 문서는 next_doc_id부터
+    새 doc_id를 붙인 docs_df를 반환합니다. 문서가 중간에 추가/삭제돼도 나머지 doc_id는 바뀌지 않습니다.
+    """
+    old_docs = manifest["docs"]
+    next_doc_id = manifest["next_doc_id"]
+    doc_ids = []
+    for key in document_keys(docs_df):
+        if key in old_docs:
+            doc_ids.append(old_docs[key]["doc_id"])
+        else:
+            doc_ids.append(next_doc_id)
+            next_doc_id += 1
+    docs_df = docs_df.drop(columns=["doc_id"], errors="ignore")
+    docs_df.insert(0, "doc_id", doc_ids)
+    return docs_df
+
+
+def load_chunk_manifest(manifest_path):
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_chunk_manifest(manifest, manifest_path):
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+
+
+def rechunk_incremental(docs_df, chunked_df, manifest, **chunk_kwargs):
+    """
+    manifest의 content hash와 비교해서 새로 생기거나 바뀐 문서만 다시 chunking 합니다.
+
+    - 새 문서: 청크마다 새 global_id를 받습니다 (added)
+    - 바뀐 문서: 기존 global_id를 chunk_id 순서대로 재사용하고 (changed),
+      청크가 늘어나면 새 id를 받고 (added), 줄어들면 남는 id는 제거됩니다 (removed)
+    - 사라진 문서: 모든 global_id가 제거됩니다 (removed)
+    global_id는 다시 쓰이지 않도록 manifest의 next_global_id부터 새로 부여합니다.
+    문서는 doc_id(위치)가 아니라 document_keys(url)로 비교하고, doc_id는 assign_doc_ids로 이전 값을 유지합니다.
+
+    Args:
+        docs_df: title, date, url, content 컬럼을 가진 현재 문서 DataFrame (doc_id는 assign_doc_ids로 다시 붙임)
+        chunked_df: 이전 실행에서 만든 청크 DataFrame (global_id 포함)
+        manifest: load_chunk_manifest / build_chunk_manifest 결과
+        chunk_kwargs: get_chuncked_df_parallel 인자 (num_workers, mode 등)
+
+    Returns:
+        (new_docs_df, new_chunked_df, new_manifest, delta)
+        new_docs_df = assign_doc_ids로 doc_id를 다시 붙인 docs_df
+        delta = {"added": [...], "removed": [...], "changed": [...]} (global_id 목록)
+    """
+    old_docs = manifest["docs"]
+    next_global_id = manifest["next_global_id"]
+    docs_df = assign_doc_ids(docs_df, manifest)
+    keys = document_keys(docs_df)
+    hashes = {key: content_hash(content) for key, content in zip(keys, docs_df["content"])}
+    doc_id_of = dict(zip(keys, docs_df["doc_id"]))
+    key_of = {doc_id: key for key, doc_id in doc_id_of.items()}
+
+    dirty = [k for k, h in hashes.items() if k not in old_docs or old_docs[k]["hash"] != h]
+    gone = [k for k in old_docs if k not in hashes]
+
+    delta = {"added": [], "removed": [], "changed": []}
+    new_docs = {k: v for k, v in old_docs.items() if k in hashes}
+    for k in gone:
+        delta["removed"].extend(old_docs[k]["global_ids"])
+
+    dirty_df = docs_df[docs_df["doc_id"].isin([doc_id_of[k] for k in dirty])]
+    new_chunks = get_chuncked_df_parallel(dirty_df, **chunk_kwargs)
+    global_ids = []
+    chunked_keys = set()
+    for doc_id, n_chunks in new_chunks.groupby("doc_id", sort=False).size().items():
+        k = key_of[doc_id]
+        chunked_keys.add(k)
+        old_gids = old_docs[k]["global_ids"] if k in old_docs else []
+        reused = old_gids[:n_chunks]
+        fresh = list(range(next_global_id, next_global_id + n_chunks - len(reused)))
+        next_global_id += len(fresh)
+        delta["changed"].extend(reused)
+        delta["added"].extend(fresh)
+        delta["removed"].extend(old_gids[n_chunks:])
+        global_ids.extend(reused + fresh)
+        new_docs[k] = {"doc_id": int(doc_id), "hash": hashes[k], "global_ids": reused + fresh}
+    # content가 비어 청크가 하나도 나오지 않은 문서
+    for k in dirty:
+        if k not in chunked_keys:
+            delta["removed"].extend(old_docs.get(k, {}).get("global_ids", []))
+            new_docs[k] = {"doc_id": int(doc_id_of[k]), "hash": hashes[k], "global_ids": []}
+    new_chunks.insert(0, "global_id", global_ids)
+
+    # 이전 청크는 global_id로 지움 (doc_id는 사라진 문서의 것이 새 문서에 다시 쓰이지 않음)
+    stale = {g for k in set(dirty) | set(gone) for g in old_docs.get(k, {}).get("global_ids", [])}
+    kept = chunked_df[~chunked_df["global_id"].isin(stale)]
+    new_chunked_df = (
+        pd.concat([kept, new_chunks], ignore_index=True)
+        .sort_values("global_id")
+        .reset_index(drop=True)
+    )
+    delta = {key: sorted(int(g) for g in gids) for key, gids in delta.items()}
+    next_doc_id = int(docs_df["doc_id"].max()) + 1 if len(docs_df) else 0
+    new_manifest = {
+        "next_global_id": next_global_id,
+        "next_doc_id": max(manifest["next_doc_id"], next_doc_id),
+        "docs": new_docs,
+    }
+    return docs_df, new_chunked_df, new_manifest, delta
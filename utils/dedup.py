@@ -0,0 +1,188 @@
+import os
+import re
+import hashlib
+import numpy as np
+
+
+def dedup_key(text):
+    # 대소문자 / 공백 차이만 있는 boilerplate는 같은 텍스트로 취급
+    return hashlib.sha256(re.sub(r"\s+", " ", text).strip().lower().encode("utf-8")).hexdigest()
+
+
+class UnionFind:
+    def __init__(self, n):
+        self.parent = np.arange(n)
+
+    def find(self, x):
+        root = x
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[x] != root:
+            self.parent[x], x = root, self.parent[x]
+        return root
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            # 작은 위치가 대표가 되도록
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+
+class DedupPlan:
+    """
+    청크 중복 클러스터. representative[i]는 위치 i 청크 대신 LLM 추출을 돌릴 대표 청크의 위치.
+    대표 청크의 추출 결과를 같은 클러스터 멤버 전체에 그대로 씁니다.
+    """
+
+    def __init__(self, global_ids, representative, n_exact_pairs=0, n_near_pairs=0):
+        self.global_ids = np.asarray(global_ids, dtype=np.int64)
+        self.representative = np.asarray(representative, dtype=np.int64)
+        self.n_exact_pairs = n_exact_pairs
+        self.n_near_pairs = n_near_pairs
+
+    def is_representative(self, pos):
+        return self.representative[pos] == pos
+
+    def members(self):
+        """
+        Returns:
+            {대표 위치: [멤버 위치 (대표 제외)]}
+        """
+        groups = {}
+        for pos, rep in enumerate(self.representative.tolist()):
+            if pos != rep:
+                groups.setdefault(rep, []).append(pos)
+        return groups
+
+    def stats(self):
+        n_chunks = len(self.representative)
+        n_clusters = int((self.representative == np.arange(n_chunks)).sum())
+        return {
+            "chunks": n_chunks,
+            "llm_calls": n_clusters,
+            "saved_calls": n_chunks - n_clusters,
+            "duplication_rate": (n_chunks - n_clusters) / n_chunks if n_chunks else 0.0,
+            "exact_links": self.n_exact_pairs,
+            "near_links": self.n_near_pairs,
+        }
+
+
+def plan_dedup(
+    global_ids,
+    texts,
+    index=None,
+    vectors_path=None,
+    min_similarity=0.97,
+    k=10,
+    batch_size=4096,
+):
+    """
+    정규화 텍스트 hash가 같은 청크와, (index / vectors_path가 있으면) 임베딩 similarity가
+    min_similarity 이상인 청크를 union-find로 묶습니다.
+
+    Args:
+        global_ids / texts: 추출 대상 청크 (같은 순서)
+        index: global_id label 인덱스 (load_faiss_index). vectors_path: apply_faiss의 vectors.npy
+
+    Returns:
+        DedupPlan
+    """
+    global_ids = np.asarray(global_ids, dtype=np.int64)
+    uf = UnionFind(len(global_ids))
+
+    n_exact = 0
+    first_of = {}
+    for pos, text in enumerate(texts):
+        key = dedup_key(text)
+        if key in first_of:
+            uf.union(first_of[key], pos)
+            n_exact += 1
+        else:
+            first_of[key] = pos
+
+    n_near = 0
+    if index is not None and vectors_path is not None and os.path.exists(vectors_path):
+        # faiss는 optional이라 near-dup 단계에서만 import
+        from utils.faiss_utils import index_metric, prepare_queries, to_similarity
+
+        vectors = np.load(vectors_path, mmap_mode="r")
+        vector_ids = np.load(vectors_path + ".ids.npy")
+        order = np.argsort(vector_ids, kind="stable")
+        rows = order[np.minimum(np.searchsorted(vector_ids[order], global_ids), len(order) - 1)]
+        found = vector_ids[rows] == global_ids
+        sorted_gids = np.sort(global_ids)
+        position_of = np.argsort(global_ids, kind="stable")
+        metric = index_metric(index)
+        query_pos = np.flatnonzero(found)
+        for start in range(0, len(query_pos), batch_size):
+            batch = query_pos[start : start + batch_size]
+            query = prepare_queries(index, vectors[np.sort(rows[batch])])
+            batch = batch[np.argsort(rows[batch], kind="stable")]
+            distances, labels = index.search(query, k + 1)
+            sims = to_similarity(distances, metric)
+            for row, pos in enumerate(batch):
+                for label, sim in zip(labels[row], sims[row]):
+                    if label < 0 or label == global_ids[pos] or sim < min_similarity:
+                        continue
+                    # 이번 추출 대상에 있는 청크끼리만 묶음
+                    j = np.searchsorted(sorted_gids, label)
+                    if j < len(sorted_gids) and sorted_gids[j] == label:
+                        other = position_of[j]
+                        if uf.find(pos) != uf.find(other):
+                            n_near += 1
+                        uf.union(pos, other)
+
+    representative = np.array([uf.find(pos) for pos in range(len(global_ids))], dtype=np.int64)
+    return DedupPlan(global_ids, representative, n_exact, n_near)
+
+
+def plan_dedup_for_chunks(
+    df,
+    chunk_text,
+    index_path="./faiss/idmap.index",
+    vectors_path="./faiss/vectors.npy",
+    min_similarity=0.97,
+    near=True,
+):
+    """
+    main_thread / main_csv용: df 청크의 정확 중복 + (인덱스가 있으면) near-duplicate 클러스터.
+    """
+    index = None
+    if near and os.path.exists(index_path) and os.path.exists(vectors_path):
+        from utils.faiss_utils import load_faiss_index
+
+        index = load_faiss_index(index_path, dim=0, mmap=True)
+    texts = [chunk_text(row) for _, row in df.iterrows()]
+    return plan_dedup(
+        df["global_id"].to_numpy(),
+        texts,
+        index=index,
+        vectors_path=vectors_path,
+        min_similarity=min_similarity,
+    )
+
+
+def print_dedup_stats(stats):
+    print(
+        f"Dedup: {stats['chunks']}개 청크 -> LLM 호출 {stats['llm_calls']}회 "
+        f"({stats['saved_calls']}회 절약, 중복률 {stats['duplication_rate']:.1%}, "
+        f"exact {stats['exact_links']} / near {stats['near_links']})"
+    )
+
+
+def extraction_targets(df, chunk_text, dedup=True, min_similarity=0.97):
+    """
+    Returns:
+        (rows, targets, members)
+        - rows: list(df.iterrows())
+        - targets: LLM 추출을 돌릴 rows 위치 (클러스터 대표)
+        - members: {대표 위치: [대표 결과를 그대로 쓸 (index, row)]}
+    """
+    rows = list(df.iterrows())
+    if not dedup:
+        return rows, list(range(len(rows))), {}
+    plan = plan_dedup_for_chunks(df, chunk_text, min_similarity=min_similarity)
+    print_dedup_stats(plan.stats())
+    members = {rep: [rows[pos] for pos in group] for rep, group in plan.members().items()}
+    targets = [pos for pos in range(len(rows)) if plan.is_representative(pos)]
+    return rows, targets, members
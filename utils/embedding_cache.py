@@ -0,0 +1,203 @@
+import os
+import hashlib
+import sqlite3
+import numpy as np
+from utils.faiss_utils import get_embedding
+
+
+def normalize_text(text):
+    # get_embedding이 실제로 보내는 텍스트와 같은 정규화
+    return text.replace("\n", " ").strip()
+
+
+def text_hash(text):
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    (model, 정규화된 텍스트 hash)를 key로 하는 디스크 임베딩 캐시.
+
+    - index.sqlite: key -> slot, last_used (LRU 순서용 카운터)
+    - vectors_<dim>.npy: shape (max_entries, dim) float32 memory-mapped 행렬, slot번째 행이 벡터
+    max_entries가 다 차면 가장 오래 안 쓴 항목의 slot을 재사용합니다 (LRU eviction).
+    """
+
+    def __init__(self, cache_dir="./cache/embeddings", dim=1536, max_entries=100_000):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.dim = dim
+        self.db = sqlite3.connect(os.path.join(cache_dir, "index.sqlite"))
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                slot INTEGER NOT NULL UNIQUE,
+                last_used INTEGER NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+            """
+        )
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)"
+        )
+        self.db.commit()
+
+        vectors_path = os.path.join(cache_dir, f"vectors_{dim}.npy")
+        if os.path.exists(vectors_path):
+            self.vectors = np.load(vectors_path, mmap_mode="r+")
+        else:
+            self.vectors = np.lib.format.open_memmap(
+                vectors_path, mode="w+", dtype=np.float32, shape=(max_entries, dim)
+            )
+        # 이미 만들어진 파일이면 파일 크기가 상한
+        self.max_entries = self.vectors.shape[0]
+
+        row = self.db.execute(
+            "SELECT COALESCE(MAX(last_used), 0), COUNT(*) FROM entries"
+        ).fetchone()
+        self.clock, self.n_entries = row
+        # index에 없는 slot이 빈 slot (commit 전에 죽었어도 index 기준이라 항상 맞음)
+        used = {slot for (slot,) in self.db.execute("SELECT slot FROM entries")}
+        self.free_slots = [slot for slot in range(self.max_entries - 1, -1, -1) if slot not in used]
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _lookup(self, model, hashes, batch_size=500):
+        """
+        Returns:
+            {text_hash: slot} - index에 있는 것만 (IN (...) 쿼리를 batch_size개씩)
+        """
+        found = {}
+        for start in range(0, len(hashes), batch_size):
+            batch = hashes[start : start + batch_size]
+            rows = self.db.execute(
+                "SELECT text_hash, slot FROM entries WHERE model = ? AND text_hash IN "
+                f"({', '.join('?' * len(batch))})",
+                (model, *batch),
+            )
+            found.update(rows)
+        return found
+
+    def get_many(self, model, texts):
+        """
+        Returns:
+            (vectors, missing) - shape (len(texts), dim) float32 (miss인 행은 0),
+            캐시에 없는 텍스트의 인덱스 리스트
+        """
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        hashes = [text_hash(text) for text in texts]
+        slot_of = self._lookup(model, list(set(hashes)))
+        missing = []
+        hits = []
+        for i, h in enumerate(hashes):
+            slot = slot_of.get(h)
+            if slot is None:
+                missing.append(i)
+            else:
+                vectors[i] = self.vectors[slot]
+                hits.append(slot)
+        if hits:
+            self.clock += 1
+            self.db.executemany(
+                "UPDATE entries SET last_used = ? WHERE slot = ?",
+                [(self.clock, slot) for slot in set(hits)],
+            )
+            self.db.commit()
+        self.hits += len(hits)
+        self.misses += len(missing)
+        return vectors, missing
+
+    def _take_slots(self, k):
+        slots = [self.free_slots.pop() for _ in range(min(k, len(self.free_slots)))]
+        self.n_entries += len(slots)
+        if len(slots) < k:
+            victims = self.db.execute(
+                "SELECT slot FROM entries ORDER BY last_used LIMIT ?",
+                (k - len(slots),),
+            ).fetchall()
+            self.db.executemany(
+                "DELETE FROM entries WHERE slot = ?", victims
+            )
+            self.evictions += len(victims)
+            slots.extend(slot for (slot,) in victims)
+        # slot을 덮어쓰기 전에 eviction을 commit: 여기서 죽어도 옛 key가 다른 벡터를 가리키지 않음
+        self.db.commit()
+        return slots
+
+    def put_many(self, model, texts, vectors):
+        keys = {}
+        for text, vec in zip(texts, vectors):
+            keys[text_hash(text)] = vec
+        existing = self._lookup(model, list(keys))
+        new_keys = [h for h in keys if h not in existing][: self.max_entries]
+        if not new_keys:
+            return
+        slots = self._take_slots(len(new_keys))
+        for h, slot in zip(new_keys, slots):
+            self.vectors[slot] = keys[h]
+        # 벡터를 먼저 디스크에 쓴 뒤 index를 commit
+        self.vectors.flush()
+        self.clock += 1
+        self.db.executemany(
+            "INSERT INTO entries (model, text_hash, slot, last_used) VALUES (?, ?, ?, ?)",
+            [(model, h, slot, self.clock) for h, slot in zip(new_keys, slots)],
+        )
+        self.db.commit()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "entries": self.n_entries,
+            "max_entries": self.max_entries,
+        }
+
+    def close(self):
+        self.vectors.flush()
+        self.db.close()
+
+
+def get_embedding_cached(text, client, cache, model="text-embedding-3-small"):
+    """
+    faiss_utils.get_embedding 앞에 캐시를 둔 버전.
+    """
+    vectors, missing = cache.get_many(model, [text])
+    if not missing:
+        return vectors[0]
+    vec = get_embedding(text, client=client, model=model)
+    cache.put_many(model, [text], vec[None, :])
+    return vec
+
+
+def embed_with_cache(ids, texts, cache, embed_batches, model="text-embedding-3-small", window=4096):
+    """
+    window개씩 캐시를 조회하고, 없는 텍스트만 embed_batches로 임베딩한 뒤 캐시에 넣습니다.
+
+    Args:
+        embed_batches: (ids, texts) -> (batch_ids, batch_vectors) iterator 를 만드는 함수
+            (faiss_utils.embed_in_batches 또는 AsyncEmbeddingRunner.embed_in_batches에 인자를 묶은 것)
+
+    Yields:
+        (window_ids, window_vectors) - 입력 순서 유지
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    texts = list(texts)
+    for start in range(0, len(texts), window):
+        window_ids = ids[start : start + window]
+        window_texts = texts[start : start + window]
+        vectors, missing = cache.get_many(model, window_texts)
+        if missing:
+            missing = np.asarray(missing)
+            row_of = {gid: row for row, gid in zip(missing, window_ids[missing])}
+            for batch_ids, batch_vecs in embed_batches(
+                window_ids[missing], [window_texts[i] for i in missing]
+            ):
+                rows = [row_of[gid] for gid in batch_ids]
+                vectors[rows] = batch_vecs
+                cache.put_many(model, [window_texts[r] for r in rows], batch_vecs)
+        yield window_ids, vectors
@@ -1,6 +1,9 @@
 import numpy as np
 import faiss
 import os
+import json
+import time
+import tiktoken
 
 
 def get_embedding(text, client, model="text-embedding-3-small"):
@@ -9,50 +12,567 @@ def get_embedding(text, client, model="text-embedding-3-small"):
     return np.array(emb, dtype=np.float32)
 
 
-def load_faiss_index(index_path: str, dim: int) -> faiss.IndexIDMap:
+def get_embeddings(texts, client, model="text-embedding-3-small"):
+    """
+    여러 텍스트를 한 번의 embeddings 요청으로 임베딩합니다.
+
+    Returns:
+        shape (len(texts), dim) float32 array (입력 순서 유지)
+    """
+    texts = [text.replace("\n", " ") for text in texts]
+    data = client.embeddings.create(input=texts, model=model).data
+    data = sorted(data, key=lambda d: d.index)
+    return np.array([d.embedding for d in data], dtype=np.float32)
+
+
+def iter_token_batches(
+    texts, max_batch_tokens=100_000, max_batch_size=2048, encoding_name="cl100k_base"
+):
+    """
+    텍스트를 tiktoken 토큰 수 기준으로 묶어 (batch 인덱스 리스트, batch 토큰 수)를 yield 합니다.
+    한 batch는 max_batch_tokens 토큰, max_batch_size개를 넘지 않습니다
+    (토큰 수가 max_batch_tokens보다 큰 텍스트 하나는 단독 batch).
+    """
+    tokenizer = tiktoken.get_encoding(encoding_name)
+    token_counts = [
+        len(tokens)
+        for tokens in tokenizer.encode_batch(list(texts), disallowed_special=())
+    ]
+    batch, batch_tokens = [], 0
+    for i, n_tokens in enumerate(token_counts):
+        if batch and (
+            batch_tokens + n_tokens > max_batch_tokens or len(batch) >= max_batch_size
+        ):
+            yield batch, batch_tokens
+            batch, batch_tokens = [], 0
+        batch.append(i)
+        batch_tokens += n_tokens
+    if batch:
+        yield batch, batch_tokens
+
+
+def embed_in_batches(
+    ids,
+    texts,
+    client,
+    model="text-embedding-3-small",
+    max_batch_tokens=100_000,
+    max_batch_size=2048,
+):
+    """
+    (id, text)들을 토큰 한도에 맞춰 묶어 batch 단위로 임베딩합니다.
+
+    Args:
+        ids: global_id 목록 (texts와 같은 순서)
+        texts: 임베딩할 텍스트 목록
+
+    Yields:
+        (batch_ids, batch_vectors) - int64 array, float32 array (입력 순서 유지)
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    texts = list(texts)
+    for batch, _ in iter_token_batches(texts, max_batch_tokens, max_batch_size):
+        vecs = get_embeddings([texts[i] for i in batch], client, model=model)
+        yield ids[batch], vecs
+
+
+class EmbeddingCheckpoint:
+    """
+    임베딩 결과를 미리 할당한 memory-mapped .npy에 바로 쓰고 진행 상황을 checkpoint로 남깁니다.
+
+    - <vectors_path>: shape (len(ids), dim) float32, i번째 행이 ids[i]의 벡터
+    - <vectors_path>.ids.npy: 행 순서의 global_id
+    - <vectors_path>.hashes.npy: 행마다 그 벡터를 만든 텍스트의 hash (hashes를 준 경우)
+    - <vectors_path>.ckpt.json: 앞에서부터 완료된 행 수(n_done)와 마지막 global_id
+
+    ids / dim / model / normalize가 이전 실행과 같으면 n_done부터 이어서 진행하고, 다르면 처음부터 다시 씁니다.
+    global_id는 같은데 텍스트가 바뀐 행은 stale_rows에 모아 두고, 호출 측이 다시 임베딩해 write_rows로 덮어씁니다.
+    normalize=True면 벡터를 L2 정규화해서 저장합니다 (cosine metric 인덱스용, 한 번만 정규화).
+    """
+
+    def __init__(
+        self, vectors_path, ids, dim, model="text-embedding-3-small", normalize=False, hashes=None
+    ):
+        self.vectors_path = vectors_path
+        self.ids_path = vectors_path + ".ids.npy"
+        self.hashes_path = vectors_path + ".hashes.npy"
+        self.ckpt_path = vectors_path + ".ckpt.json"
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.current_hashes = None if hashes is None else np.asarray(hashes, dtype="S64")
+        self.hashes = None
+        self.dim = dim
+        self.model = model
+        self.normalize = normalize
+        os.makedirs(os.path.dirname(vectors_path) or ".", exist_ok=True)
+
+        ckpt = self._load_checkpoint()
+        if ckpt is not None:
+            self.vectors = np.load(vectors_path, mmap_mode="r+")
+            if self.current_hashes is not None:
+                self.hashes = np.load(self.hashes_path, mmap_mode="r+")
+            self.n_done = ckpt["n_done"]
+            print(
+                f"Resuming embeddings from checkpoint: {self.n_done}/{len(self.ids)} "
+                f"(last global_id={ckpt['last_global_id']})"
+            )
+        else:
+            self.vectors = np.lib.format.open_memmap(
+                vectors_path, mode="w+", dtype=np.float32, shape=(len(self.ids), dim)
+            )
+            np.save(self.ids_path, self.ids)
+            if self.current_hashes is not None:
+                self.hashes = np.lib.format.open_memmap(
+                    self.hashes_path, mode="w+", dtype="S64", shape=(len(self.ids),)
+                )
+            self.n_done = 0
+            self._save_checkpoint()
+        # 이미 임베딩한 행 중 텍스트가 바뀐 행 (global_id는 그대로)
+        self.stale_rows = np.zeros(0, dtype=np.int64)
+        if self.hashes is not None:
+            done = slice(0, self.n_done)
+            self.stale_rows = np.flatnonzero(self.hashes[done] != self.current_hashes[done])
+            if len(self.stale_rows):
+                print(f"{len(self.stale_rows)} embedded chunks changed text, re-embedding them")
+
+    def _load_checkpoint(self):
+        if not all(
+            os.path.exists(p) for p in (self.vectors_path, self.ids_path, self.ckpt_path)
+        ):
+            return None
+        with open(self.ckpt_path, "r", encoding="utf-8") as f:
+            ckpt = json.load(f)
+        if (
+            ckpt.get("dim") != self.dim
+            or ckpt.get("model") != self.model
+            or ckpt.get("normalize", False) != self.normalize
+        ):
+            return None
+        if not np.array_equal(np.load(self.ids_path), self.ids):
+            print("Chunk ids changed since the last run, re-embedding from scratch")
+            return None
+        if self.current_hashes is not None and not os.path.exists(self.hashes_path):
+            # 행별 텍스트 hash가 없는 예전 checkpoint는 바뀐 행을 알 수 없음
+            print("Checkpoint has no text hashes, re-embedding from scratch")
+            return None
+        return ckpt
+
+    def _save_checkpoint(self):
+        ckpt = {
+            "n_done": self.n_done,
+            "n_total": len(self.ids),
+            "last_global_id": int(self.ids[self.n_done - 1]) if self.n_done else None,
+            "dim": self.dim,
+            "model": self.model,
+            "normalize": self.normalize,
+        }
+        tmp_path = self.ckpt_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(ckpt, f)
+        os.replace(tmp_path, self.ckpt_path)
+
+    @property
+    def done(self):
+        return self.n_done == len(self.ids)
+
+    def write(self, batch_ids, batch_vecs):
+        """
+        다음 행들에 batch를 씁니다. batch는 ids 순서대로 이어져야 합니다.
+        벡터를 flush한 뒤 checkpoint를 갱신하므로 중간에 죽어도 n_done까지는 유효합니다.
+        """
+        end = self.n_done + len(batch_ids)
+        if not np.array_equal(self.ids[self.n_done : end], batch_ids):
+            raise ValueError(
+                f"batch out of order: expected global_id {self.ids[self.n_done]}, "
+                f"got {batch_ids[0]}"
+            )
+        if self.normalize:
+            batch_vecs = normalize_vectors(batch_vecs)
+        self.vectors[self.n_done : end] = batch_vecs
+        self.vectors.flush()
+        self._write_hashes(np.arange(self.n_done, end))
+        self.n_done = end
+        self._save_checkpoint()
+
+    def _write_hashes(self, rows):
+        # 벡터를 flush한 다음에 hash를 갱신: 중간에 죽으면 다음 실행에서 stale로 다시 임베딩
+        if self.hashes is None:
+            return
+        self.hashes[rows] = self.current_hashes[rows]
+        self.hashes.flush()
+
+    def write_rows(self, batch_ids, batch_vecs):
+        """
+        이미 임베딩한 행(stale_rows)을 global_id로 찾아 새 벡터로 덮어씁니다.
+        """
+        order = np.argsort(self.ids, kind="stable")
+        pos = np.searchsorted(self.ids[order], batch_ids)
+        rows = order[np.minimum(pos, len(self.ids) - 1)]
+        if not np.array_equal(self.ids[rows], batch_ids) or np.any(rows >= self.n_done):
+            raise ValueError("write_rows only rewrites rows that are already embedded")
+        if self.normalize:
+            batch_vecs = normalize_vectors(batch_vecs)
+        self.vectors[rows] = batch_vecs
+        self.vectors.flush()
+        self._write_hashes(rows)
+
+
+# metric -> faiss metric_type. cosine은 정규화된 벡터 + inner product (값이 곧 cosine similarity)
+METRICS = {"l2": faiss.METRIC_L2, "cosine": faiss.METRIC_INNER_PRODUCT}
+
+
+def normalize_vectors(vectors):
+    vectors = np.array(vectors, dtype=np.float32, copy=True).reshape(-1, np.shape(vectors)[-1])
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def index_metric(index):
+    return "cosine" if index.metric_type == faiss.METRIC_INNER_PRODUCT else "l2"
+
+
+def prepare_queries(index, queries):
+    """
+    query를 (n, d) float32로 맞추고, cosine 인덱스면 L2 정규화합니다.
+    """
+    queries = np.ascontiguousarray(queries, dtype=np.float32).reshape(-1, index.d)
+    if index_metric(index) == "cosine":
+        queries = normalize_vectors(queries)
+    return queries
+
+
+def to_similarity(distances, metric):
+    """
+    검색 결과 거리 -> cosine similarity. cosine 인덱스는 그대로,
+    l2는 단위 벡터 가정에서 ||a - b||^2 = 2 - 2cos 이므로 1 - d / 2.
+    """
+    distances = np.asarray(distances, dtype=np.float32)
+    if metric == "cosine":
+        return distances
+    return 1 - distances / 2
+
+
+def add_in_batches(index, vectors, ids, batch_size=50_000):
+    """
+    memory-mapped 벡터를 batch_size행씩 읽어 index.add_with_ids 합니다
+    (전체 행렬을 한 번에 메모리에 올리지 않음).
+    """
+    for start in range(0, len(ids), batch_size):
+        end = start + batch_size
+        index.add_with_ids(
+            np.ascontiguousarray(vectors[start:end], dtype=np.float32),
+            np.ascontiguousarray(ids[start:end], dtype=np.int64),
+        )
+
+
+# index_type -> faiss.index_factory 문자열 (항상 IDMap으로 감싸 global_id를 label로 유지)
+INDEX_FACTORY = {
+    "flat": "IDMap,Flat",
+    "ivf_flat": "IDMap,IVF{nlist},Flat",
+    "ivf_pq": "IDMap,IVF{nlist},PQ{pq_m}x8",
+    "hnsw": "IDMap,HNSW{hnsw_m}",
+    # 압축 저장 (1536차원 float32 6KB 대비): fp16 2배, sq8 4배, pq PQ{pq_m}x8이면 6KB / pq_m 배
+    "fp16": "IDMap,SQfp16",
+    "sq8": "IDMap,SQ8",
+    "pq": "IDMap,PQ{pq_m}x8",
+}
+
+
+def default_nlist(n_vectors):
+    # IVF 리스트 수: 대략 4 * sqrt(N), 리스트당 학습 점이 충분하도록 N / 39 이하
+    return int(max(1, min(4 * np.sqrt(n_vectors), n_vectors // 39)))
+
+
+def create_faiss_index(
+    dim, index_type="flat", nlist=1024, pq_m=64, hnsw_m=32, ef_construction=200, metric="l2"
+):
+    """
+    index_type에 맞는 IDMap 인덱스를 만듭니다. ivf_* / sq8 / pq 는 add 전에 train_faiss_index가 필요합니다.
+
+    Args:
+        index_type: flat | ivf_flat | ivf_pq | hnsw | fp16 | sq8 | pq
+        nlist: IVF 리스트 수
+        pq_m: PQ sub-quantizer 수 (dim의 약수)
+        hnsw_m: HNSW 노드당 링크 수
+        metric: l2 | cosine (cosine이면 inner product 인덱스, 벡터는 정규화해서 넣어야 함)
+    """
+    if metric not in METRICS:
+        raise ValueError(f"unknown metric {metric!r}, expected one of {list(METRICS)}")
+    if index_type not in INDEX_FACTORY:
+        raise ValueError(f"unknown index_type {index_type!r}, expected one of {list(INDEX_FACTORY)}")
+    factory = INDEX_FACTORY[index_type].format(nlist=nlist, pq_m=pq_m, hnsw_m=hnsw_m)
+    index = faiss.index_factory(dim, factory, METRICS[metric])
+    inner = faiss.downcast_index(index.index)
+    if isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efConstruction = ef_construction
+    return index
+
+
+def train_faiss_index(index, vectors, max_train_points=100_000, seed=0):
+    """
+    학습이 필요한 인덱스(IVF/SQ/PQ)를 vectors에서 최대 max_train_points개를 뽑아 학습합니다.
+    """
+    if index.is_trained:
+        return
+    n = len(vectors)
+    rows = np.arange(n)
+    if n > max_train_points:
+        rows = np.sort(np.random.default_rng(seed).choice(n, max_train_points, replace=False))
+    print(f"Training {type(faiss.downcast_index(index.index)).__name__} on {len(rows)} vectors...")
+    index.train(np.ascontiguousarray(vectors[rows], dtype=np.float32))
+
+
+def _inner_index(index):
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.downcast_index(index.index)
+    return faiss.downcast_index(index)
+
+
+def get_search_params(index):
+    inner = _inner_index(index)
+    if isinstance(inner, faiss.IndexIVF):
+        return {"nprobe": inner.nprobe}
+    if isinstance(inner, faiss.IndexHNSW):
+        return {"efSearch": inner.hnsw.efSearch}
+    return {}
+
+
+def set_search_params(index, nprobe=None, efSearch=None):
+    inner = _inner_index(index)
+    if nprobe is not None and isinstance(inner, faiss.IndexIVF):
+        inner.nprobe = int(nprobe)
+    if efSearch is not None and isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = int(efSearch)
+
+
+def make_search_params(index, selector=None):
+    """
+    인덱스 타입에 맞는 SearchParameters를 만듭니다 (IVF 인덱스에 기본 SearchParameters를 주면 에러).
+    nprobe / efSearch는 인덱스에 현재 설정된 값을 그대로 씁니다.
+    """
+    inner = _inner_index(index)
+    if isinstance(inner, faiss.IndexIVF):
+        params = faiss.SearchParametersIVF()
+        params.nprobe = inner.nprobe
+    elif isinstance(inner, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = inner.hnsw.efSearch
+    else:
+        params = faiss.SearchParameters()
+    if selector is not None:
+        params.sel = selector
+    return params
+
+
+def _params_path(index_path):
+    return index_path + ".json"
+
+
+def read_faiss_index(index_path, mmap=False):
+    """
+    faiss.read_index + 로딩 시간 출력.
+
+    mmap=True면 IO_FLAG_MMAP_IFC | IO_FLAG_READ_ONLY로 읽어 flat 계열 코드(flat / fp16 / sq8 / pq,
+    HNSW storage)를 파일에서 바로 참조합니다. 여러 worker 프로세스가 같은 page cache를 공유하고
+    시작이 거의 즉시 끝나지만, 읽기 전용이라 add / remove는 할 수 없습니다.
+    mmap을 지원하지 않으면 일반 로딩으로 넘어갑니다.
+    """
+    start = time.perf_counter()
+    index, mode = None, "ram"
+    if mmap:
+        flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+        try:
+            index, mode = faiss.read_index(index_path, flags), "mmap"
+        except RuntimeError as e:
+            print(f"mmap load failed for '{index_path}', reading into memory: {e}")
+    if index is None:
+        index = faiss.read_index(index_path)
+    print(
+        f"Loaded FAISS index '{index_path}' ({mode}, {index.ntotal} vectors) "
+        f"in {(time.perf_counter() - start) * 1000:.1f} ms"
+    )
+    return index
+
+
+def load_faiss_index(
+    index_path: str, dim: int, index_type="flat", mmap=False, **index_kwargs
+) -> faiss.IndexIDMap:
     """
     Load a FAISS index if it exists, else create a new one.
-    Wraps an IndexFlatL2 inside an IndexIDMap for ID-based additions.
+    New indexes come from create_faiss_index (IndexIDMap around flat / IVF / HNSW).
+    Saved search parameters (nprobe / efSearch) in '<index_path>.json' are applied on load.
 
     Args:
         index_path: Path to .index file on disk.
         dim: Dimension of embedding vectors.
+        index_type: flat | ivf_flat | ivf_pq | hnsw | fp16 | sq8 | pq (only used when creating).
+        mmap: Memory-map the index read-only (search-only callers, see read_faiss_index).
 
     Returns:
         An IndexIDMap for adding/querying vectors with IDs.
     """
     if os.path.exists(index_path):
-        print(f"Loading existing FAISS index from '{index_path}'...")
-        index = faiss.read_index(index_path)
+        index = read_faiss_index(index_path, mmap=mmap)
+        if os.path.exists(_params_path(index_path)):
+            with open(_params_path(index_path), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            set_search_params(index, **meta.get("search_params", {}))
     else:
-        print(f"Creating new FAISS index of dimension {dim}...")
-        flat_index = faiss.IndexFlatL2(dim)
-        index = faiss.IndexIDMap(flat_index)
+        print(f"Creating new {index_type} FAISS index of dimension {dim}...")
+        index = create_faiss_index(dim, index_type, **index_kwargs)
     return index
 
 
-def save_faiss_index(index: faiss.Index, index_path: str):
+def save_faiss_index(index: faiss.Index, index_path: str, index_type=None):
     """
-    Write the FAISS index back to disk.
+    Write the FAISS index back to disk, with its search parameters in '<index_path>.json'.
     """
     faiss.write_index(index, index_path)
+    meta = {"search_params": get_search_params(index), "metric": index_metric(index)}
+    if index_type is not None:
+        meta["index_type"] = index_type
+    with open(_params_path(index_path), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
     print(f"FAISS index saved to '{index_path}'.")
 
 
-def get_doc_neighbor(df, gid):
-    doc_id = df.loc[df["global_id"] == gid, "doc_id"].iloc[0]
-    # Get the document ID for the given global ID
-    doc_id = df.loc[df["global_id"] == gid, "doc_id"].iloc[0]
+def is_exact_index(index):
+    # 원본 float32 벡터를 그대로 들고 있는 인덱스인지 (아니면 거리가 근사값)
+    inner = _inner_index(index)
+    return isinstance(inner, (faiss.IndexFlat, faiss.IndexHNSWFlat, faiss.IndexIVFFlat))
+
+
+class ExactReranker:
+    """
+    압축 인덱스(fp16 / sq8 / pq / ivf_pq)가 돌려준 후보를 디스크의 float32 벡터(vectors.npy memmap)로
+    정확한 L2 거리를 다시 계산해 재정렬합니다. 인덱스 RAM은 압축된 크기로 유지하고
+    후보 행만 디스크에서 읽습니다.
+
+    factor: 인덱스에서 k * factor개 후보를 가져와 재정렬
+    metric: l2면 L2 거리 오름차순, cosine이면 inner product 내림차순 (vectors.npy가 정규화되어 있어야 함)
+    """
+
+    def __init__(self, vectors_path, factor=4, metric="l2"):
+        self.vectors = np.load(vectors_path, mmap_mode="r")
+        ids = np.load(vectors_path + ".ids.npy")
+        self.order = np.argsort(ids, kind="stable")
+        self.sorted_ids = ids[self.order]
+        self.factor = factor
+        self.metric = metric
+
+    def rows_of(self, gids):
+        pos = np.clip(np.searchsorted(self.sorted_ids, gids), 0, len(self.sorted_ids) - 1)
+        return self.order[pos]
+
+    def rerank(self, queries, labels):
+        """
+        Returns:
+            (distances, labels) - labels와 같은 shape, 행마다 가까운 순 (-1은 맨 뒤)
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(len(labels), -1)
+        # cosine은 큰 값이 가까우므로 부호를 뒤집어 같은 오름차순 정렬을 씀
+        sign = -1.0 if self.metric == "cosine" else 1.0
+        distances = np.full(labels.shape, np.inf, dtype=np.float32)
+        valid = labels >= 0
+        rows = self.rows_of(labels[valid])
+        # memmap은 정렬된 행 순서로 읽는 편이 빠름
+        unique_rows, inverse = np.unique(rows, return_inverse=True)
+        candidates = np.asarray(self.vectors[unique_rows], dtype=np.float32)[inverse]
+        query_of = np.repeat(np.arange(len(labels)), valid.sum(axis=1))
+        if self.metric == "cosine":
+            distances[valid] = sign * (candidates * queries[query_of]).sum(axis=1)
+        else:
+            distances[valid] = ((candidates - queries[query_of]) ** 2).sum(axis=1)
+        order = np.argsort(distances, axis=1, kind="stable")
+        return (
+            sign * np.take_along_axis(distances, order, axis=1),
+            np.take_along_axis(labels, order, axis=1),
+        )
+
+    def search(self, index, queries, k, params=None):
+        queries = prepare_queries(index, queries)
+        _, labels = index.search(queries, k * self.factor, params=params)
+        distances, labels = self.rerank(queries, labels)
+        return distances[:, :k], labels[:, :k]
+
 
-    # Get all global IDs from the same document (including the input gid)
-    indoc_global_ids = df.loc[df["doc_id"] == doc_id, "global_id"]
+class DocIndex:
+    """
+    doc_id <-> global_id 조회용 CSR 형태 인덱스.
+
+    - gids: doc_id 순으로 묶고 문서 안에서는 global_id 순으로 정렬한 배열
+    - offsets: doc slot i의 global_id는 gids[offsets[i]:offsets[i + 1]]
+    - sorted_gids / sorted_docs: global_id -> doc_id (searchsorted)
+
+    문서의 global_id가 연속이면 (preprocess 전체 실행 결과는 항상 연속) in/out-of-doc selector를
+    id 목록 대신 IDSelectorRange로 만듭니다.
+    """
+
+    def __init__(self, doc_ids, global_ids):
+        doc_ids = np.asarray(doc_ids)
+        global_ids = np.asarray(global_ids, dtype=np.int64)
+        order = np.lexsort((global_ids, doc_ids))
+        self.gids = global_ids[order]
+        doc_keys, starts = np.unique(doc_ids[order], return_index=True)
+        self.offsets = np.append(starts, len(self.gids)).astype(np.int64)
+        self.slot = {doc_id: i for i, doc_id in enumerate(doc_keys.tolist())}
+        self.sizes = np.diff(self.offsets)
+        # 첫/마지막 global_id 차이가 (개수 - 1)이면 연속 구간
+        first = self.gids[self.offsets[:-1]]
+        last = self.gids[self.offsets[1:] - 1]
+        self.contiguous = last - first == self.sizes - 1
+
+        g_order = np.argsort(global_ids, kind="stable")
+        self.sorted_gids = global_ids[g_order]
+        self.sorted_docs = doc_ids[g_order]
+
+    @classmethod
+    def from_df(cls, df):
+        return cls(df["doc_id"].to_numpy(), df["global_id"].to_numpy())
+
+    def doc_of(self, gids):
+        """
+        global_id (스칼라 또는 배열) -> doc_id. 없는 global_id(-1 등)는 결과가 의미 없으므로 호출 측에서 거릅니다.
+        """
+        pos = np.searchsorted(self.sorted_gids, gids)
+        return self.sorted_docs[np.clip(pos, 0, len(self.sorted_gids) - 1)]
 
-    # Get all global IDs from different documents
-    outdoc_global_ids = df.loc[df["doc_id"] != doc_id, "global_id"]
-    return indoc_global_ids, outdoc_global_ids
+    def doc_global_ids(self, doc_id):
+        i = self.slot[doc_id]
+        return self.gids[self.offsets[i] : self.offsets[i + 1]]
+
+    def doc_size(self, doc_id):
+        return int(self.sizes[self.slot[doc_id]])
+
+    def in_doc_selector(self, doc_id):
+        i = self.slot[doc_id]
+        if self.contiguous[i]:
+            lo = int(self.gids[self.offsets[i]])
+            return faiss.IDSelectorRange(lo, lo + int(self.sizes[i]))
+        gids = np.ascontiguousarray(self.doc_global_ids(doc_id))
+        return faiss.IDSelectorBatch(len(gids), faiss.swig_ptr(gids))
+
+    def out_doc_selector(self, doc_id):
+        """
+        doc_id를 제외한 나머지 문서 전체 (IDSelectorNot(in_doc_selector))
+        """
+        inner = self.in_doc_selector(doc_id)
+        selector = faiss.IDSelectorNot(inner)
+        # IDSelectorNot은 inner를 참조만 하므로 같이 살아 있도록 붙잡아 둠
+        selector.referenced_objects = [inner]
+        return selector
+
+
+def get_doc_neighbor(doc_index, gid):
+    """
+    Returns:
+        (indoc_global_ids, outdoc_selector) - 같은 문서 global_id 배열 (gid 포함),
+        다른 문서 전체를 나타내는 faiss.IDSelector (search_in_subset의 index_subset으로 사용)
+    """
+    doc_id = doc_index.doc_of(gid)
+    return doc_index.doc_global_ids(doc_id), doc_index.out_doc_selector(doc_id)
 
 
-def search_in_subset(index, query_vector,query_index, index_subset, top_k=5):
+def search_in_subset(index, query_vector,query_index, index_subset, top_k=5, reranker=None):
     """
     불연속적인 인덱스 집합에서 유사도 검색을 수행하는 함수
 
@@ -62,37 +582,46 @@ def search_in_subset(index, query_vector,query_index, index_subset, top_k=5):
         이미 생성되고 벡터가 추가된 FAISS 인덱스 객체
     query_vector : numpy.ndarray
         쿼리 벡터 (shape: [1, d] 또는 [d,])
-    index_subset : list or numpy.ndarray
-        검색할 인덱스들의 집합 (불연속적인 인덱스도 가능)
+    index_subset : list, numpy.ndarray or faiss.IDSelector
+        검색할 인덱스들의 집합 (불연속적인 인덱스도 가능) 또는 미리 만든 selector
     top_k : int
         반환할 가장 유사한 벡터의 개수
+    reranker : ExactReranker, optional
+        주면 후보를 더 많이 가져와 float32 원본 벡터로 재정렬 (압축 인덱스용)
 
     Returns:
     --------
     tuple
         (distances, indices) - 유사도 거리와 해당 인덱스
     """
-    # 선택된 인덱스 집합 생성 (IDSelectorBatch 사용)
-    # 인덱스는 int64 타입이어야 함
-    subset_indices = np.array(index_subset, dtype=np.int64)
-    selector = faiss.IDSelectorBatch(
-        len(subset_indices), faiss.swig_ptr(subset_indices)
-    )
+    if isinstance(index_subset, faiss.IDSelector):
+        # DocIndex.out_doc_selector 등 미리 만든 selector
+        selector = index_subset
+        subset_size = index.ntotal
+    else:
+        # 선택된 인덱스 집합 생성 (IDSelectorBatch 사용)
+        # 인덱스는 int64 타입이어야 함
+        subset_indices = np.array(index_subset, dtype=np.int64)
+        selector = faiss.IDSelectorBatch(
+            len(subset_indices), faiss.swig_ptr(subset_indices)
+        )
+        subset_size = len(subset_indices)
 
-    # 검색 파라미터 설정
-    params = faiss.SearchParameters()
-    params.sel = selector
+    # 검색 파라미터 설정 (IVF / HNSW는 타입에 맞는 SearchParameters 필요)
+    params = make_search_params(index, selector)
 
-    # 쿼리 벡터가 2D 배열인지 확인
-    if len(query_vector.shape) == 1:
-        query_vector = query_vector.reshape(1, -1)
+    # 쿼리 벡터를 2D float32로 (cosine 인덱스면 정규화)
+    query_vector = prepare_queries(index, query_vector)
 
     # 검색 수행 (제한된 인덱스 집합에서만)
-    k = min( top_k + 1, len(subset_indices))  # 요청한 k와 실제 서브셋 크기 중 작은 값 사용
-    distances, indices = index.search(query_vector.astype("float32"), k, params=params)
+    k = min( top_k + 1, subset_size)  # 요청한 k와 실제 서브셋 크기 중 작은 값 사용
+    if reranker is not None:
+        distances, indices = reranker.search(index, query_vector, k, params=params)
+    else:
+        distances, indices = index.search(query_vector, k, params=params)
     dists = distances[0]
     inds  = indices[0]
-    filtered = [(d, i) for d, i in zip(dists, inds) if i != query_index]
+    filtered = [(d, i) for d, i in zip(dists, inds) if i != query_index and i >= 0]
 
     # 5) 앞에서 top_k개만 잘라서 리턴
     filtered = filtered[:top_k]
@@ -102,20 +631,109 @@ def search_in_subset(index, query_vector,query_index, index_subset, top_k=5):
     return np.array(d_out), np.array(i_out)
 
 
+
+def build_knn_neighbors(
+    index,
+    vectors,
+    ids,
+    doc_index,
+    top_k=3,
+    overfetch=32,
+    batch_size=4096,
+    reranker=None,
+    min_similarity=None,
+):
+    """
+    모든 청크에 대해 같은 문서(intra) / 다른 문서(inter) top_k 이웃을 한 번의 batch kNN으로 구합니다.
+
+    top_k + 1 + overfetch개를 한 번에 검색해 doc_id 마스크로 intra/inter를 나누고,
+    어느 한 쪽이 top_k개를 못 채운 행만 해당 subset으로 다시 검색합니다.
+
+    Args:
+        index: global_id를 label로 돌려주는 인덱스 (IndexIDMap)
+        vectors: ids 순서의 벡터 (memmap 가능, batch_size행씩 읽음)
+        ids: vectors 행 순서의 global_id
+        doc_index: DocIndex
+        reranker: ExactReranker (압축 인덱스일 때 후보를 float32 벡터로 재정렬)
+        min_similarity: 주면 cosine similarity가 이 값 미만인 이웃은 버림 (to_similarity 기준)
+
+    Returns:
+        (intra, inter) - ids 순서의 global_id 리스트의 리스트 (가까운 순)
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    doc_ids = doc_index.doc_of(ids)
+    metric = index_metric(index)
+
+    def keep(distances, labels):
+        if min_similarity is None:
+            return labels
+        return labels[to_similarity(distances, metric) >= min_similarity]
+
+    k = min(top_k + 1 + overfetch, len(ids))
+    intra, inter = [], []
+    for start in range(0, len(ids), batch_size):
+        end = min(start + batch_size, len(ids))
+        query = prepare_queries(index, vectors[start:end])
+        if reranker is not None:
+            distances, labels = reranker.search(index, query, k)
+        else:
+            distances, labels = index.search(query, k)
+
+        valid = (labels >= 0) & (labels != ids[start:end, None])
+        same_doc = doc_index.doc_of(labels) == doc_ids[start:end, None]
+        intra_mask = valid & same_doc
+        inter_mask = valid & ~same_doc
+        # 검색된 마지막 후보까지 similarity 기준 미달이면 더 먼 후보를 찾을 필요가 없음
+        exhausted = np.zeros(end - start, dtype=bool)
+        if min_similarity is not None:
+            exhausted = to_similarity(distances[:, -1], metric) < min_similarity
+
+        for row in range(end - start):
+            i = start + row
+            intra_d = distances[row][intra_mask[row]][:top_k]
+            intra_ids = labels[row][intra_mask[row]][:top_k]
+            inter_d = distances[row][inter_mask[row]][:top_k]
+            inter_ids = labels[row][inter_mask[row]][:top_k]
+            doc_size = doc_index.doc_size(doc_ids[i])
+            # 같은 문서 청크가 over-fetch 범위 밖에 있으면 그 문서 안에서만 다시 검색
+            if not exhausted[row] and len(intra_ids) < min(top_k, doc_size - 1):
+                intra_d, intra_ids = search_in_subset(
+                    index,
+                    query[row],
+                    query_index=ids[i],
+                    index_subset=doc_index.doc_global_ids(doc_ids[i]),
+                    top_k=top_k,
+                    reranker=reranker,
+                )
+            # 가까운 이웃이 모두 같은 문서면 그 문서를 제외하고 다시 검색
+            if not exhausted[row] and len(inter_ids) < min(top_k, len(ids) - doc_size):
+                inter_d, inter_ids = search_in_subset(
+                    index,
+                    query[row],
+                    query_index=ids[i],
+                    index_subset=doc_index.out_doc_selector(doc_ids[i]),
+                    top_k=top_k,
+                    reranker=reranker,
+                )
+            intra.append([int(x) for x in keep(intra_d, intra_ids)])
+            inter.append([int(x) for x in keep(inter_d, inter_ids)])
+    return intra, inter
+
 if __name__ == "__main__":
-    import pandas as pd
+    from utils.chunk_store import CHUNK_STORE_PATH, read_chunks
 
-    chunked_df = pd.read_csv("chunked_df.csv", encoding="utf-8", delimiter=",")
-    indoc_neighbor, outdoc_neighbor = get_doc_neighbor(chunked_df, 0)
-    index = faiss.read_index("./faiss/idmap.index")
+    chunked_df = read_chunks(CHUNK_STORE_PATH, columns=["doc_id", "global_id"])
+    doc_index = DocIndex.from_df(chunked_df)
+    indoc_neighbor, outdoc_neighbor = get_doc_neighbor(doc_index, 0)
+    index = load_faiss_index("./faiss/idmap.index", dim=1536, mmap=True)
     base_index = faiss.downcast_index(index.index)
     query = base_index.reconstruct(0).reshape(1, -1)
-    D, I = base_index.search(query, 3)
+    D, I = index.search(query, 3)
     D, I = search_in_subset(
-        base_index, query_vector=query, index_subset=indoc_neighbor, top_k=3
+        index, query_vector=query, query_index=0, index_subset=indoc_neighbor, top_k=3
     )
     D, I = search_in_subset(
-        base_index, query_vector=query, index_subset=outdoc_neighbor, top_k=3
+        index, query_vector=query, query_index=0, index_subset=outdoc_neighbor, top_k=3
     )
     print(D)
     print(I)
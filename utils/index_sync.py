@@ -0,0 +1,109 @@
+import os
+import json
+import numpy as np
+import faiss
+
+from utils.embedding_cache import text_hash
+
+
+def manifest_path(index_path):
+    return index_path + ".manifest.json"
+
+
+def build_index_manifest(ids, hashes, model, index_type, metric="l2"):
+    """
+    인덱스에 들어 있는 벡터의 (global_id -> 텍스트 hash)와 임베딩 모델 / index_type / metric 기록.
+    """
+    return {
+        "model": model,
+        "index_type": index_type,
+        "metric": metric,
+        "entries": {str(int(gid)): h for gid, h in zip(ids, hashes)},
+    }
+
+
+def load_index_manifest(index_path):
+    path = manifest_path(index_path)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_index_manifest(index_path, manifest):
+    path = manifest_path(index_path)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+
+
+def chunk_hashes(texts):
+    return [text_hash(text) for text in texts]
+
+
+def diff_index_manifest(manifest, ids, hashes, model, index_type, metric="l2"):
+    """
+    현재 청크 집합과 인덱스 manifest를 비교합니다.
+
+    Returns:
+        {"added", "removed", "changed"} global_id int64 배열,
+        manifest가 없거나 model / index_type / metric이 바뀌었으면 None (전체 재구축 필요)
+    """
+    if (
+        manifest is None
+        or manifest.get("model") != model
+        or manifest.get("index_type") != index_type
+        or manifest.get("metric", "l2") != metric
+    ):
+        return None
+    old = manifest["entries"]
+    current = {str(int(gid)): h for gid, h in zip(ids, hashes)}
+    added = [int(gid) for gid in current if gid not in old]
+    removed = [int(gid) for gid in old if gid not in current]
+    changed = [int(gid) for gid, h in current.items() if gid in old and old[gid] != h]
+    return {
+        "added": np.array(added, dtype=np.int64),
+        "removed": np.array(removed, dtype=np.int64),
+        "changed": np.array(changed, dtype=np.int64),
+    }
+
+
+def sync_faiss_index(index, delta, vectors, ids, expected_ntotal, batch_size=50_000):
+    """
+    delta만큼만 인덱스를 갱신합니다: removed + changed는 remove_ids, added + changed는
+    vectors(ids 순서의 memmap)에서 해당 행만 읽어 add_with_ids.
+
+    Args:
+        expected_ntotal: manifest 기준 인덱스 벡터 수 (다르면 인덱스와 manifest가 어긋난 것)
+
+    Returns:
+        성공하면 True. 인덱스가 manifest와 어긋나 있거나 remove_ids를 지원하지 않는
+        타입(HNSW)이면 False를 돌려주고, 호출 측에서 전체 재구축합니다.
+    """
+    if index.ntotal != expected_ntotal:
+        print(f"Index has {index.ntotal} vectors but manifest has {expected_ntotal}")
+        return False
+    stale = np.concatenate([delta["removed"], delta["changed"]])
+    if len(stale):
+        try:
+            n_removed = index.remove_ids(faiss.IDSelectorBatch(len(stale), faiss.swig_ptr(stale)))
+        except RuntimeError as e:
+            print(f"remove_ids not supported by this index: {e}")
+            return False
+        print(f"Removed {n_removed} vectors from index")
+
+    fresh = np.sort(np.concatenate([delta["added"], delta["changed"]]))
+    order = np.argsort(ids, kind="stable")
+    rows = np.sort(order[np.searchsorted(ids[order], fresh)])
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start : start + batch_size]
+        index.add_with_ids(
+            np.ascontiguousarray(vectors[batch], dtype=np.float32),
+            np.ascontiguousarray(ids[batch], dtype=np.int64),
+        )
+    print(
+        f"Index sync: +{len(delta['added'])} added, -{len(delta['removed'])} removed, "
+        f"~{len(delta['changed'])} changed"
+    )
+    return True
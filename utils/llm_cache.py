@@ -0,0 +1,218 @@
+import os
+import json
+import hashlib
+import sqlite3
+import threading
+
+
+def llm_cache_key(model, temperature, max_tokens, messages):
+    """
+    (model, temperature, max_tokens, system prompt, 렌더링된 user prompt) -> sha256
+    """
+    payload = json.dumps(
+        [model, temperature, max_tokens, [[m["role"], m["content"]] for m in messages]],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    렌더링된 prompt hash를 key로 하는 chat completion 응답 디스크 캐시 (SQLite 하나).
+
+    - entries: key -> 응답 텍스트, prompt / completion 토큰 수, 크기(bytes), last_used (LRU 카운터)
+    응답 텍스트 합계가 max_bytes를 넘으면 가장 오래 안 쓴 항목부터 지웁니다 (LRU eviction).
+    ThreadPoolExecutor worker / AsyncExtractionRunner 스레드에서 같이 쓰므로 lock으로 감쌉니다.
+    hit마다 fsync하지 않도록 WAL 모드로 열고, last_used 갱신과 commit은 commit_every번마다 모아서 합니다
+    (close()에서 남은 것을 commit, 비정상 종료 시 마지막 몇 개 항목만 잃음).
+    """
+
+    def __init__(self, cache_dir="./cache/llm", max_bytes=1 << 30, commit_every=64):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.commit_every = commit_every
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(
+            os.path.join(cache_dir, "responses.sqlite"), check_same_thread=False
+        )
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                prompt_tokens INTEGER NOT NULL,
+                completion_tokens INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                last_used INTEGER NOT NULL
+            )
+            """
+        )
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)"
+        )
+        self.db.commit()
+
+        row = self.db.execute(
+            "SELECT COALESCE(MAX(last_used), 0), COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()
+        self.clock, self.n_entries, self.total_bytes = row
+        # 아직 DB에 쓰지 않은 last_used 갱신 (key -> clock)과 commit 안 된 put 수
+        self.touched = {}
+        self.n_uncommitted = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.saved_prompt_tokens = 0
+        self.saved_completion_tokens = 0
+
+    def get(self, key):
+        """
+        Returns:
+            캐시된 응답 텍스트, 없으면 None
+        """
+        with self.lock:
+            row = self.db.execute(
+                "SELECT response, prompt_tokens, completion_tokens FROM entries WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.clock += 1
+            self.touched[key] = self.clock
+            if len(self.touched) >= self.commit_every:
+                self._flush()
+            self.hits += 1
+            self.saved_prompt_tokens += row[1]
+            self.saved_completion_tokens += row[2]
+            return row[0]
+
+    def _write_touched(self):
+        # lock을 잡은 상태에서 호출
+        if self.touched:
+            self.db.executemany(
+                "UPDATE entries SET last_used = ? WHERE key = ?",
+                [(clock, key) for key, clock in self.touched.items()],
+            )
+            self.touched = {}
+
+    def _flush(self):
+        self._write_touched()
+        self.db.commit()
+        self.n_uncommitted = 0
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _evict(self):
+        # 최근에 hit한 항목이 지워지지 않도록 last_used부터 반영
+        self._write_touched()
+        while self.total_bytes > self.max_bytes and self.n_entries > 0:
+            victims = self.db.execute(
+                "SELECT key, size FROM entries ORDER BY last_used LIMIT 64"
+            ).fetchall()
+            for key, size in victims:
+                if self.total_bytes <= self.max_bytes:
+                    break
+                self.db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.total_bytes -= size
+                self.n_entries -= 1
+                self.evictions += 1
+
+    def put(self, key, response, prompt_tokens=0, completion_tokens=0):
+        size = len(response.encode("utf-8"))
+        with self.lock:
+            old = self.db.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            if old is not None:
+                self.total_bytes -= old[0]
+                self.n_entries -= 1
+            self.clock += 1
+            self.touched.pop(key, None)
+            self.db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                (key, response, prompt_tokens, completion_tokens, size, self.clock),
+            )
+            self.total_bytes += size
+            self.n_entries += 1
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+            self.n_uncommitted += 1
+            if self.n_uncommitted >= self.commit_every:
+                self._flush()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "saved_prompt_tokens": self.saved_prompt_tokens,
+            "saved_completion_tokens": self.saved_completion_tokens,
+            "evictions": self.evictions,
+            "entries": self.n_entries,
+            "mb": self.total_bytes / (1 << 20),
+        }
+
+    def close(self):
+        with self.lock:
+            self._flush()
+            self.db.close()
+
+
+def open_llm_cache():
+    """
+    LLM_CACHE=1 (기본)이면 LLM_CACHE_DIR / LLM_CACHE_MB 설정으로 연 LLMCache, 아니면 None
+    """
+    if os.getenv("LLM_CACHE", "1") != "1":
+        return None
+    return LLMCache(
+        os.getenv("LLM_CACHE_DIR", "./cache/llm"),
+        max_bytes=int(float(os.getenv("LLM_CACHE_MB", 1024)) * (1 << 20)),
+    )
+
+
+def cached_chat_completion(client, cache, model, messages, temperature, max_tokens):
+    """
+    client.chat.completions.create 앞에 캐시를 둔 버전. cache가 None이면 그냥 호출.
+
+    finish_reason이 "stop"인 응답만 캐시합니다 (max_tokens에서 잘린 응답은 다음 실행에서 다시 요청).
+
+    Returns:
+        응답 텍스트 (response.choices[0].message.content)
+    """
+    key = llm_cache_key(model, temperature, max_tokens, messages)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+    response = client.chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        max_tokens=max_tokens,
+    )
+    choice = response.choices[0]
+    content = choice.message.content
+    if cache is not None and content is not None and choice.finish_reason == "stop":
+        usage = response.usage
+        cache.put(
+            key,
+            content,
+            usage.prompt_tokens if usage else 0,
+            usage.completion_tokens if usage else 0,
+        )
+    return content
+
+
+def print_llm_cache_stats(cache):
+    if cache is None:
+        return
+    stats = cache.stats()
+    print(
+        f"LLM cache: hit {stats['hits']} / miss {stats['misses']} ({stats['hit_rate']:.1%}), "
+        f"saved tokens prompt {stats['saved_prompt_tokens']} + completion {stats['saved_completion_tokens']}, "
+        f"{stats['entries']} entries {stats['mb']:.1f}MB (evicted {stats['evictions']})"
+    )
@@ -0,0 +1,147 @@
+import json
+import hashlib
+import time
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+
+def mock_chat_completion(request):
+    """
+    chat completion 요청 body -> 응답 body. 마지막 메시지로 정해지는 LightRAG 형식 entity 추출 결과
+    (LocalBatchBackend에서도 사용)
+    """
+    prompt = request["messages"][-1]["content"]
+    # 실행마다 같은 결과가 나오도록 hash()대신 sha256으로 seed
+    rng = np.random.default_rng(int(hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8], 16))
+    names = ["USTR", "Japan", "European Union", "Mexico", "WTO", "Section 301", "USMCA"]
+    types = ["Organization", "Country", "Agreement", "Regulation"]
+    picked = rng.choice(names, 3, replace=False)
+    records = [
+        f'("entity"<|>{name}<|>{rng.choice(types)}<|>{name} mentioned in the press release.)'
+        for name in picked
+    ]
+    records.append(
+        f'("relationship"<|>{picked[0]}<|>{picked[1]}<|>{picked[0]} negotiates with {picked[1]}.'
+        f"<|>trade negotiation<|>{rng.integers(1, 10)})"
+    )
+    records.append('("content_keywords"<|>trade policy,tariff,market access)')
+    content = "##\n".join(records)
+    prompt_tokens = sum(len(m["content"].split()) for m in request["messages"])
+    completion_tokens = len(content.split())
+    return {
+        "id": f"chatcmpl-mock-{rng.integers(1 << 30)}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request.get("model", "mock"),
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    """
+    벤치마크용 OpenAI 호환 mock 엔드포인트.
+    /v1/embeddings 요청에 latency만큼 기다린 뒤 입력 텍스트로 seed한 랜덤 벡터를 돌려주고,
+    /v1/chat/completions 요청에는 입력으로 정해지는 LightRAG 형식 entity 추출 결과를 돌려줍니다.
+    rate_limit_prob 확률로 429 + Retry-After를 돌려줍니다.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        with server.lock:
+            server.n_requests += 1
+
+        if random.random() < server.rate_limit_prob:
+            with server.lock:
+                server.n_rate_limited += 1
+            self._send_json(
+                429,
+                {"error": {"message": "Rate limit reached", "type": "requests"}},
+                {"Retry-After": "0.05"},
+            )
+            return
+
+        if self.path.endswith("/embeddings"):
+            time.sleep(server.latency)
+            self._send_json(200, self._embeddings(request))
+        elif self.path.endswith("/chat/completions"):
+            time.sleep(server.latency)
+            self._send_json(200, mock_chat_completion(request))
+        else:
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+
+    def _embeddings(self, request):
+        inputs = request["input"]
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        data = []
+        for i, text in enumerate(inputs):
+            rng = np.random.default_rng(abs(hash(text)) % (2**32))
+            data.append(
+                {
+                    "object": "embedding",
+                    "index": i,
+                    "embedding": rng.standard_normal(self.server.dim).tolist(),
+                }
+            )
+        n_tokens = sum(len(text.split()) for text in inputs)
+        return {
+            "object": "list",
+            "data": data,
+            "model": request.get("model", "mock"),
+            "usage": {"prompt_tokens": n_tokens, "total_tokens": n_tokens},
+        }
+
+
+class MockOpenAIServer(ThreadingHTTPServer):
+    # 동시 연결 수천 개를 받을 수 있도록 listen backlog를 늘림
+    request_queue_size = 4096
+
+
+def start_mock_server(latency=0.05, rate_limit_prob=0.0, dim=1536, port=0):
+    """
+    mock 서버를 백그라운드 스레드로 띄웁니다.
+
+    Returns:
+        (server, base_url) - server.shutdown()으로 종료, base_url은 OpenAI(base_url=...)에 사용
+    """
+    server = MockOpenAIServer(("127.0.0.1", port), MockOpenAIHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.rate_limit_prob = rate_limit_prob
+    server.dim = dim
+    server.lock = threading.Lock()
+    server.n_requests = 0
+    server.n_rate_limited = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
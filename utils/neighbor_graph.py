@@ -0,0 +1,179 @@
+import os
+import numpy as np
+
+from utils.chunk_store import NEIGHBOR_GRAPH_PATH
+from utils.faiss_utils import index_metric, prepare_queries, to_similarity
+
+
+def similarity_radius(min_similarity, metric):
+    """
+    cosine similarity 기준값 -> range_search radius.
+    cosine(inner product) 인덱스는 score > radius, l2 인덱스는 거리 < radius (단위 벡터면 2 - 2s).
+    """
+    if metric == "cosine":
+        return float(min_similarity)
+    return float(2 - 2 * min_similarity)
+
+
+class NeighborGraph:
+    """
+    청크 유사도 그래프 (CSR). 행/열 번호는 ids 배열의 위치이고, data는 cosine similarity.
+
+    - ids: 위치 -> global_id
+    - indptr, indices, data: 위치 i의 이웃은 indices[indptr[i]:indptr[i + 1]] (similarity 내림차순)
+    """
+
+    def __init__(self, ids, indptr, indices, data, min_similarity=None, max_neighbors=None, mutual=False):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.data = np.asarray(data, dtype=np.float32)
+        self.min_similarity = min_similarity
+        self.max_neighbors = max_neighbors
+        self.mutual = mutual
+        self._order = np.argsort(self.ids, kind="stable")
+
+    @property
+    def n_edges(self):
+        return len(self.indices)
+
+    def degrees(self):
+        return np.diff(self.indptr)
+
+    def position(self, gid):
+        pos = self._order[np.searchsorted(self.ids[self._order], gid)]
+        if self.ids[pos] != gid:
+            raise KeyError(gid)
+        return pos
+
+    def neighbors(self, gid):
+        """
+        Returns:
+            (global_ids, similarities) - similarity 내림차순
+        """
+        i = self.position(gid)
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return self.ids[self.indices[start:end]], self.data[start:end]
+
+    def pairs(self, doc_index=None, cross_doc=None):
+        """
+        (min, max)로 정렬된 고유 global_id 쌍과 similarity.
+
+        Args:
+            doc_index: DocIndex (cross_doc을 쓸 때 필요)
+            cross_doc: True면 다른 문서끼리, False면 같은 문서끼리, None이면 전부
+
+        Returns:
+            (pairs, similarities) - shape (P, 2) int64, (P,) float32
+        """
+        src = self.ids[np.repeat(np.arange(len(self.ids)), self.degrees())]
+        dst = self.ids[self.indices]
+        pairs = np.sort(np.stack([src, dst], axis=1), axis=1)
+        sims = self.data
+        if cross_doc is not None:
+            different = doc_index.doc_of(pairs[:, 0]) != doc_index.doc_of(pairs[:, 1])
+            keep = different if cross_doc else ~different
+            pairs, sims = pairs[keep], sims[keep]
+        pairs, first = np.unique(pairs, axis=0, return_index=True)
+        return pairs, sims[first]
+
+    def save(self, path=NEIGHBOR_GRAPH_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            ids=self.ids,
+            indptr=self.indptr,
+            indices=self.indices,
+            data=self.data,
+            min_similarity=np.float32(
+                np.nan if self.min_similarity is None else self.min_similarity
+            ),
+            max_neighbors=np.int64(-1 if self.max_neighbors is None else self.max_neighbors),
+            mutual=np.bool_(self.mutual),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=NEIGHBOR_GRAPH_PATH):
+        with np.load(path) as f:
+            min_similarity = float(f["min_similarity"])
+            max_neighbors = int(f["max_neighbors"])
+            return cls(
+                f["ids"],
+                f["indptr"],
+                f["indices"],
+                f["data"],
+                min_similarity=None if np.isnan(min_similarity) else min_similarity,
+                max_neighbors=None if max_neighbors < 0 else max_neighbors,
+                mutual=bool(f["mutual"]),
+            )
+
+
+def _mutual_filter(indptr, indices, data):
+    # i -> j와 j -> i가 둘 다 있는 edge만 남김
+    n = len(indptr) - 1
+    src = np.repeat(np.arange(n), np.diff(indptr))
+    codes = src * n + indices
+    reverse = indices * n + src
+    keep = np.isin(reverse, codes)
+    new_indptr = np.concatenate([[0], np.cumsum(np.bincount(src[keep], minlength=n))])
+    return new_indptr, indices[keep], data[keep]
+
+
+def build_range_graph(
+    index,
+    vectors,
+    ids,
+    min_similarity=0.6,
+    max_neighbors=10,
+    mutual=False,
+    batch_size=1024,
+):
+    """
+    FAISS range_search로 similarity가 min_similarity 이상인 청크끼리 잇는 그래프를 만듭니다.
+
+    고정 top_k 대신 기준값을 넘는 이웃만 남기므로 관련 없는 쌍은 빠지고, 밀집한 군집은
+    max_neighbors까지 이웃을 가집니다. mutual=True면 서로의 이웃 목록에 있는 쌍만 남깁니다
+    (max_neighbors로 자른 뒤 적용).
+
+    Args:
+        index: global_id를 label로 돌려주는 인덱스 (IndexIDMap, l2면 단위 벡터 가정)
+        vectors: ids 순서의 벡터 (memmap 가능)
+        ids: vectors 행 순서의 global_id
+
+    Returns:
+        NeighborGraph
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    order = np.argsort(ids, kind="stable")
+    sorted_ids = ids[order]
+    metric = index_metric(index)
+    radius = similarity_radius(min_similarity, metric)
+
+    counts = np.zeros(len(ids), dtype=np.int64)
+    indices_parts, data_parts = [], []
+    for start in range(0, len(ids), batch_size):
+        end = min(start + batch_size, len(ids))
+        query = prepare_queries(index, vectors[start:end])
+        lims, distances, labels = index.range_search(query, radius)
+        sims = to_similarity(distances, metric)
+        for row in range(end - start):
+            lo, hi = lims[row], lims[row + 1]
+            row_labels, row_sims = labels[lo:hi], sims[lo:hi]
+            keep = (row_labels != ids[start + row]) & (row_sims >= min_similarity)
+            row_labels, row_sims = row_labels[keep], row_sims[keep]
+            # range_search 결과는 정렬되어 있지 않으므로 similarity 내림차순으로 정렬 후 cap
+            top = np.argsort(-row_sims, kind="stable")[:max_neighbors]
+            indices_parts.append(order[np.searchsorted(sorted_ids, row_labels[top])])
+            data_parts.append(row_sims[top])
+            counts[start + row] = len(top)
+
+    indptr = np.concatenate([[0], np.cumsum(counts)])
+    indices = np.concatenate(indices_parts) if indices_parts else np.empty(0, dtype=np.int64)
+    data = np.concatenate(data_parts) if data_parts else np.empty(0, dtype=np.float32)
+    if mutual:
+        indptr, indices, data = _mutual_filter(indptr, indices, data)
+    return NeighborGraph(
+        ids, indptr, indices, data, min_similarity, max_neighbors, mutual
+    )
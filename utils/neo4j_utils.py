@@ -273,6 +273,42 @@ def insert_ustr_document(doc_id, row):
     )
 
 
+def insert_chunk_kg(session, chunk_number, doc_id, tmp_kg):
+    """
+    to_kg_in_chunk 결과(tmp_kg)를 청크 노드 / entity / relationship으로 적재하고 개수 확인
+    """
+    session.execute_write(
+        insert_chunk_node,
+        chunk_number,
+        doc_id,
+        tmp_kg["content_keywords"][0]["high_level_keywords"],
+    )
+    for ent in tmp_kg["entities"]:
+        session.execute_write(
+            insert_entity_node,
+            chunk_number,
+            doc_id,
+            ent["entity_name"],
+            ent["entity_type"],
+            ent["description"],
+        )
+    for rel in tmp_kg["relationships"]:
+        session.execute_write(
+            insert_entity_relationship,
+            chunk_number,
+            doc_id,
+            rel["src_id"],
+            rel["tgt_id"],
+            rel["description"],
+            rel["keywords"],
+            rel["weight"],
+        )
+    check_entity_node_count(session, doc_id, chunk_number, len(tmp_kg["entities"]))
+    check_entity_relationship_count(
+        session, doc_id, chunk_number, len(tmp_kg["relationships"]),
+    )
+
+
 
 
 if __name__ == "__main__":
@@ -0,0 +1,123 @@
+import json
+import hashlib
+import threading
+import tiktoken
+
+INPUT_SLOT = "input_text"
+# prompt_template 안에 나올 일이 없는 placeholder
+_SLOT_MARKER = "\x00__INPUT_TEXT__\x00"
+# OpenAI prompt caching: 1024 토큰 이상인 prefix를 128 토큰 단위로 캐시
+PROVIDER_CACHE_MIN_TOKENS = 1024
+PROVIDER_CACHE_INCREMENT = 128
+# AsyncExtractionRunner(TPM 계산)와 같은 tokenizer
+TOKEN_ENCODING = "cl100k_base"
+
+
+def build_entity_types_reference(prompt_cfg):
+    descriptions = prompt_cfg.get("entity_types_descriptions") or {}
+    return "\n".join(
+        f"• {etype}: {descriptions.get(etype, '')}" for etype in prompt_cfg["entity_types"]
+    )
+
+
+def prompt_config_hash(prompt_cfg):
+    """
+    prompt_entity config 전체(template, examples, entity types, system prompt 등)의 sha256
+    """
+    payload = json.dumps(prompt_cfg, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CompiledPrompt:
+    """
+    config마다 한 번만 렌더링한 entity 추출 prompt.
+
+    system prompt와 user prompt의 input_text 앞부분(prefix)은 청크와 상관없이 고정이라,
+    청크마다 prompt_template.format(...)을 다시 돌리지 않고 prefix + 청크 텍스트 + suffix로 이어 붙입니다.
+    결과는 prompt_template.format(..., input_text=청크 텍스트)와 글자 단위로 같습니다.
+    messages는 [system, user] 순서라 고정 부분이 항상 요청 앞쪽에 와서 provider prompt caching이 걸립니다.
+    """
+
+    def __init__(self, config_hash, system_prompt, prefix, suffix):
+        self.config_hash = config_hash
+        self.system_prompt = system_prompt
+        self.prefix = prefix
+        self.suffix = suffix
+        self._token_counts = {}
+
+    def render(self, input_text):
+        return self.prefix + input_text + self.suffix
+
+    def messages(self, input_text):
+        return [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": self.prefix + input_text + self.suffix},
+        ]
+
+    def static_prefix_tokens(self, encoding_name=TOKEN_ENCODING):
+        """
+        청크마다 같은 앞부분(system prompt + user prefix) 토큰 수
+        """
+        if encoding_name not in self._token_counts:
+            tokenizer = tiktoken.get_encoding(encoding_name)
+            self._token_counts[encoding_name] = sum(
+                len(tokenizer.encode(text, disallowed_special=()))
+                for text in (self.system_prompt, self.prefix)
+            )
+        return self._token_counts[encoding_name]
+
+    def cacheable_prefix_tokens(self, encoding_name=TOKEN_ENCODING):
+        """
+        provider가 요청마다 캐시로 처리할 수 있는 prefix 토큰 수 (1024 미만이면 0, 128 단위 내림)
+        """
+        n = self.static_prefix_tokens(encoding_name)
+        if n < PROVIDER_CACHE_MIN_TOKENS:
+            return 0
+        return n - (n - PROVIDER_CACHE_MIN_TOKENS) % PROVIDER_CACHE_INCREMENT
+
+
+_compiled = {}
+_compiled_lock = threading.Lock()
+
+
+def compile_prompt(prompt_cfg):
+    """
+    prompt_entity config -> CompiledPrompt. config hash 기준으로 프로세스 안에서 캐시합니다.
+    """
+    config_hash = prompt_config_hash(prompt_cfg)
+    with _compiled_lock:
+        if config_hash in _compiled:
+            return _compiled[config_hash]
+    rendered = prompt_cfg["prompt_template"].format(
+        language=prompt_cfg["language"],
+        tuple_delimiter=prompt_cfg["tuple_delimiter"],
+        record_delimiter=prompt_cfg["record_delimiter"],
+        completion_delimiter=prompt_cfg["completion_delimiter"],
+        entity_types_reference=build_entity_types_reference(prompt_cfg),
+        examples="\n\n".join(prompt_cfg.get("examples") or []),
+        entity_types=", ".join(prompt_cfg["entity_types"]),
+        input_text=_SLOT_MARKER,
+    )
+    if rendered.count(_SLOT_MARKER) != 1:
+        raise ValueError(
+            f"prompt_template must contain {{{INPUT_SLOT}}} exactly once, "
+            f"found {rendered.count(_SLOT_MARKER)}"
+        )
+    prefix, suffix = rendered.split(_SLOT_MARKER)
+    compiled = CompiledPrompt(config_hash, prompt_cfg["system_prompt"], prefix, suffix)
+    with _compiled_lock:
+        return _compiled.setdefault(config_hash, compiled)
+
+
+def print_prompt_stats(compiled, encoding_name=TOKEN_ENCODING):
+    try:
+        static = compiled.static_prefix_tokens(encoding_name)
+        cacheable = compiled.cacheable_prefix_tokens(encoding_name)
+    except Exception as e:
+        # tiktoken encoding을 내려받지 못하는 오프라인 환경 등: 통계 때문에 실행을 멈추지 않음
+        print(f"Prompt {compiled.config_hash[:12]}: skipped token stats ({type(e).__name__}: {e})")
+        return
+    print(
+        f"Prompt {compiled.config_hash[:12]}: static prefix {static} tokens "
+        f"(system + template, {len(compiled.prefix)} chars), provider-cacheable {cacheable} tokens/request"
+    )
@@ -0,0 +1,83 @@
+import time
+import random
+import asyncio
+
+
+class AsyncRateLimiter:
+    """
+    requests-per-minute / tokens-per-minute 두 개의 token bucket으로 요청 속도를 제한합니다.
+    한도를 None으로 주면 해당 bucket은 제한하지 않습니다.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.rpm = requests_per_minute
+        self.tpm = tokens_per_minute
+        self.request_budget = float(requests_per_minute or 0)
+        self.token_budget = float(tokens_per_minute or 0)
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.updated_at
+        self.updated_at = now
+        if self.rpm:
+            self.request_budget = min(
+                self.rpm, self.request_budget + elapsed * self.rpm / 60
+            )
+        if self.tpm:
+            self.token_budget = min(
+                self.tpm, self.token_budget + elapsed * self.tpm / 60
+            )
+
+    def _wait_time(self, tokens):
+        wait = 0.0
+        if self.rpm and self.request_budget < 1:
+            wait = max(wait, (1 - self.request_budget) * 60 / self.rpm)
+        if self.tpm and self.token_budget < tokens:
+            wait = max(wait, (tokens - self.token_budget) * 60 / self.tpm)
+        return wait
+
+    async def acquire(self, tokens=0):
+        """
+        요청 1개와 tokens만큼의 예산이 생길 때까지 기다린 뒤 차감합니다.
+        """
+        if self.tpm:
+            # 한 요청이 TPM 전체보다 크면 영원히 못 보내므로 bucket 크기로 자름
+            tokens = min(tokens, self.tpm)
+        async with self.lock:
+            while True:
+                self._refill()
+                wait = self._wait_time(tokens)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            if self.rpm:
+                self.request_budget -= 1
+            if self.tpm:
+                self.token_budget -= tokens
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0, retry_after=None):
+    """
+    full-jitter exponential backoff: uniform(0, min(cap, base * 2**attempt)).
+    서버가 Retry-After를 주면 그보다 짧게 기다리지 않습니다.
+    """
+    delay = random.uniform(0, min(cap, base * 2**attempt))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+def retry_after_seconds(exc):
+    """
+    openai 예외의 응답 헤더에서 Retry-After(초)를 꺼냅니다. 없으면 None.
+    """
+    response = getattr(exc, "response", None)
+    if response is None:
+        return None
+    value = response.headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
@@ -0,0 +1,237 @@
+import os
+import threading
+from contextlib import contextmanager
+
+import httpx2
+import openai
+from neo4j import GraphDatabase
+
+
+class _CountingTransport(httpx2.BaseTransport):
+    """
+    요청 앞뒤로 Resources의 in-flight 카운터를 올리고 내리는 transport wrapper.
+    event hook과 달리 timeout / 연결 오류로 끝난 요청도 finally에서 빠집니다.
+    """
+
+    def __init__(self, transport, resources):
+        self.transport = transport
+        self.resources = resources
+
+    def handle_request(self, request):
+        self.resources._request_started()
+        try:
+            return self.transport.handle_request(request)
+        finally:
+            self.resources._request_finished()
+
+    def close(self):
+        self.transport.close()
+
+
+class _AsyncCountingTransport(httpx2.AsyncBaseTransport):
+    """
+    _CountingTransport의 httpx2.AsyncClient 버전
+    """
+
+    def __init__(self, transport, resources):
+        self.transport = transport
+        self.resources = resources
+
+    async def handle_async_request(self, request):
+        self.resources._request_started()
+        try:
+            return await self.transport.handle_async_request(request)
+        finally:
+            self.resources._request_finished()
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class Resources:
+    """
+    프로세스 전체에서 같이 쓰는 OpenAI client / Neo4j driver.
+
+    청크마다 openai.OpenAI / GraphDatabase.driver를 새로 만들면 TLS handshake, Bolt 연결,
+    routing discovery를 매번 다시 하므로, 하나씩만 만들어 worker들에 넘깁니다.
+    - OpenAI: keep-alive 연결 pool을 가진 httpx2.Client 하나 (max_connections / max_keepalive)
+    - Neo4j: max_connection_pool_size를 worker 수에 맞춘 driver 하나
+    둘 다 thread-safe라 ThreadPoolExecutor worker에서 그대로 같이 씁니다.
+    """
+
+    def __init__(
+        self,
+        api_key=None,
+        max_connections=100,
+        max_keepalive=100,
+        keepalive_expiry=60.0,
+        timeout=120.0,
+        neo4j_pool_size=50,
+        neo4j_acquire_timeout=60.0,
+    ):
+        self.api_key = api_key
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.timeout = timeout
+        self.neo4j_pool_size = neo4j_pool_size
+        self.neo4j_acquire_timeout = neo4j_acquire_timeout
+        self.lock = threading.Lock()
+        self._http_client = None
+        self._http_transport = None
+        self._openai_client = None
+        self._driver = None
+        # pool 사용량 (peak은 동시에 진행 중이던 최대 개수)
+        self.http_requests = 0
+        self.http_in_flight = 0
+        self.http_peak_in_flight = 0
+        self.neo4j_sessions = 0
+        self.neo4j_in_use = 0
+        self.neo4j_peak_in_use = 0
+
+    def _limits(self, max_connections=None):
+        max_connections = max_connections or self.max_connections
+        return httpx2.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=min(self.max_keepalive, max_connections),
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    def _request_started(self):
+        with self.lock:
+            self.http_requests += 1
+            self.http_in_flight += 1
+            self.http_peak_in_flight = max(self.http_peak_in_flight, self.http_in_flight)
+
+    def _request_finished(self):
+        with self.lock:
+            self.http_in_flight -= 1
+
+    @property
+    def openai_client(self):
+        with self.lock:
+            if self._openai_client is None:
+                self._http_transport = httpx2.HTTPTransport(limits=self._limits())
+                self._http_client = httpx2.Client(
+                    transport=_CountingTransport(self._http_transport, self),
+                    timeout=self.timeout,
+                )
+                self._openai_client = openai.OpenAI(
+                    api_key=self.api_key, http_client=self._http_client
+                )
+            return self._openai_client
+
+    def make_async_openai_client(self, max_connections=None, **kwargs):
+        """
+        AsyncExtractionRunner용 AsyncOpenAI. httpx2.AsyncClient는 만든 이벤트 루프에 묶이므로
+        공유하지 않고 같은 keep-alive 설정으로 새로 만듭니다 (runner.close()가 닫음).
+        max_connections는 runner의 max_in_flight에 맞춥니다. 요청 수 / in-flight는 공유 client와 같은 카운터에 셉니다.
+        429 재시도는 runner가 하므로 SDK 재시도는 끕니다 (max_retries=0).
+        """
+        kwargs.setdefault("max_retries", 0)
+        return openai.AsyncOpenAI(
+            api_key=self.api_key,
+            http_client=httpx2.AsyncClient(
+                transport=_AsyncCountingTransport(
+                    httpx2.AsyncHTTPTransport(limits=self._limits(max_connections)), self
+                ),
+                timeout=self.timeout,
+            ),
+            **kwargs,
+        )
+
+    @property
+    def driver(self):
+        with self.lock:
+            if self._driver is None:
+                self._driver = GraphDatabase.driver(
+                    os.getenv("NEO4J_URI"),
+                    auth=(os.getenv("NEO4J_USERNAME"), os.getenv("NEO4J_PASSWORD")),
+                    max_connection_pool_size=self.neo4j_pool_size,
+                    connection_acquisition_timeout=self.neo4j_acquire_timeout,
+                    keep_alive=True,
+                )
+            return self._driver
+
+    @contextmanager
+    def session(self):
+        """
+        공유 driver의 pool에서 연결을 빌려 쓰는 session (NEO4J_DATABASE)
+        """
+        driver = self.driver
+        with self.lock:
+            self.neo4j_sessions += 1
+            self.neo4j_in_use += 1
+            self.neo4j_peak_in_use = max(self.neo4j_peak_in_use, self.neo4j_in_use)
+        try:
+            with driver.session(database=os.getenv("NEO4J_DATABASE")) as session:
+                yield session
+        finally:
+            with self.lock:
+                self.neo4j_in_use -= 1
+
+    def _http_pool_connections(self):
+        # httpx2는 pool 상태를 공개 API로 주지 않아 transport 내부(httpcore2 ConnectionPool)를 읽음
+        pool = getattr(self._http_transport, "_pool", None)
+        connections = list(getattr(pool, "connections", []))
+        idle = sum(1 for c in connections if c.is_idle())
+        return len(connections), idle
+
+    def _neo4j_pool_connections(self):
+        pool = getattr(self._driver, "_pool", None)
+        connections = [c for conns in getattr(pool, "connections", {}).values() for c in conns]
+        in_use = sum(1 for c in connections if getattr(c, "in_use", False))
+        return len(connections), in_use
+
+    def pool_stats(self):
+        stats = {
+            "http_requests": self.http_requests,
+            "http_in_flight": self.http_in_flight,
+            "http_peak_in_flight": self.http_peak_in_flight,
+            "http_max_connections": self.max_connections,
+            "neo4j_sessions": self.neo4j_sessions,
+            "neo4j_in_use": self.neo4j_in_use,
+            "neo4j_peak_in_use": self.neo4j_peak_in_use,
+            "neo4j_pool_size": self.neo4j_pool_size,
+        }
+        if self._http_client is not None:
+            stats["http_open"], stats["http_idle"] = self._http_pool_connections()
+            # 요청 수 / 열린 연결 수: 1보다 크면 keep-alive로 연결을 재사용한 것
+            stats["http_reuse"] = self.http_requests / max(stats["http_open"], 1)
+        if self._driver is not None:
+            stats["neo4j_open"], stats["neo4j_pool_in_use"] = self._neo4j_pool_connections()
+        return stats
+
+    def close(self):
+        with self.lock:
+            if self._openai_client is not None:
+                self._openai_client.close()
+                self._openai_client = None
+                self._http_client = None
+                self._http_transport = None
+            if self._driver is not None:
+                self._driver.close()
+                self._driver = None
+
+
+_resources = None
+_resources_lock = threading.Lock()
+
+
+def get_resources(**kwargs):
+    """
+    프로세스에 하나만 있는 Resources. 처음 호출할 때의 kwargs로 만들어집니다.
+    """
+    global _resources
+    with _resources_lock:
+        if _resources is None:
+            _resources = Resources(**kwargs)
+        return _resources
+
+
+def close_resources():
+    global _resources
+    with _resources_lock:
+        if _resources is not None:
+            _resources.close()
+            _resources = None
@@ -0,0 +1,206 @@
+import os
+import json
+import threading
+import boto3
+from botocore.exceptions import BotoCoreError, ClientError
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_BUCKET = "ossca"
+DEFAULT_KEY = "USTRGraph/ustr_2023_press_releases.csv"
+
+
+def get_s3_client(endpoint_url=None):
+    """
+    S3 client 생성. endpoint_url(또는 S3_ENDPOINT_URL 환경변수)을 주면
+    MinIO 같은 로컬 S3 호환 서버에 붙을 수 있습니다.
+    """
+    return boto3.client(
+        "s3",
+        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+        region_name="ap-northeast-2",
+        endpoint_url=endpoint_url or os.getenv("S3_ENDPOINT_URL"),
+    )
+
+
+class S3Fetcher:
+    """
+    ETag/size로 검증하는 로컬 캐시 + ranged GET 병렬 다운로드 + 이어받기를 지원하는 fetcher.
+
+    - local_path.s3meta.json: 마지막으로 받은 객체의 bucket/key/etag/size
+    - local_path.part / local_path.part.json: 다운로드 중인 파일과 완료된 part 목록
+    """
+
+    def __init__(self, client=None, part_size=8 * 1024 * 1024, max_workers=8):
+        self.client = client or get_s3_client()
+        self.part_size = part_size
+        self.max_workers = max_workers
+
+    @staticmethod
+    def _read_json(path):
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    @staticmethod
+    def _write_json(obj, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(obj, f)
+        os.replace(tmp_path, path)
+
+    def is_cached(self, local_path, etag, size):
+        meta = self._read_json(local_path + ".s3meta.json")
+        return (
+            meta is not None
+            and os.path.exists(local_path)
+            and meta["etag"] == etag
+            and meta["size"] == size
+            and os.path.getsize(local_path) == size
+        )
+
+    def fetch(self, bucket, key, local_path):
+        """
+        객체 하나를 local_path로 받습니다. 캐시가 유효하면 다운로드하지 않습니다.
+
+        Returns:
+            True면 새로 받음, False면 캐시 사용
+        """
+        try:
+            head = self.client.head_object(Bucket=bucket, Key=key)
+        except (BotoCoreError, ClientError) as e:
+            if os.path.exists(local_path):
+                print(f"⚠️ s3://{bucket}/{key} 확인 실패, 로컬 파일 사용: {e}")
+                return False
+            raise
+        etag, size = head["ETag"], head["ContentLength"]
+        if self.is_cached(local_path, etag, size):
+            print(f"Cache hit: s3://{bucket}/{key} -> '{local_path}'")
+            return False
+
+        local_dir = os.path.dirname(local_path)
+        if local_dir:
+            os.makedirs(local_dir, exist_ok=True)
+        self._download_parts(bucket, key, local_path, etag, size)
+        self._write_json(
+            {"bucket": bucket, "key": key, "etag": etag, "size": size},
+            local_path + ".s3meta.json",
+        )
+        print(f"Downloaded s3://{bucket}/{key} ({size} bytes) -> '{local_path}'")
+        return True
+
+    def _download_parts(self, bucket, key, local_path, etag, size):
+        part_path = local_path + ".part"
+        progress_path = part_path + ".json"
+        ranges = [
+            (start, min(start + self.part_size, size) - 1)
+            for start in range(0, size, self.part_size)
+        ]
+
+        progress = self._read_json(progress_path)
+        resumable = (
+            progress is not None
+            and os.path.exists(part_path)
+            and progress["etag"] == etag
+            and progress["size"] == size
+            and progress["part_size"] == self.part_size
+        )
+        if resumable:
+            done = set(progress["done"])
+            print(f"Resuming s3://{bucket}/{key}: {len(done)}/{len(ranges)} parts done")
+        else:
+            done = set()
+            with open(part_path, "wb") as f:
+                f.truncate(size)
+        lock = threading.Lock()
+
+        def fetch_part(part_no):
+            start, end = ranges[part_no]
+            body = self.client.get_object(
+                Bucket=bucket, Key=key, Range=f"bytes={start}-{end}", IfMatch=etag
+            )["Body"].read()
+            with open(part_path, "r+b") as f:
+                f.seek(start)
+                f.write(body)
+            with lock:
+                done.add(part_no)
+                self._write_json(
+                    {
+                        "etag": etag,
+                        "size": size,
+                        "part_size": self.part_size,
+                        "done": sorted(done),
+                    },
+                    progress_path,
+                )
+
+        todo = [i for i in range(len(ranges)) if i not in done]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # list()로 소비해야 part 실패 시 예외가 올라옴
+            list(executor.map(fetch_part, todo))
+
+        os.replace(part_path, local_path)
+        if os.path.exists(progress_path):
+            os.remove(progress_path)
+
+    def fetch_many(self, bucket, keys, dest_dir):
+        """
+        여러 key를 dest_dir 아래 같은 상대 경로로 받습니다.
+
+        Returns:
+            {key: local_path}
+        """
+        paths = {}
+        for key in keys:
+            local_path = os.path.join(dest_dir, key)
+            self.fetch(bucket, key, local_path)
+            paths[key] = local_path
+        return paths
+
+    def list_keys(self, bucket, prefix):
+        paginator = self.client.get_paginator("list_objects_v2")
+        keys = []
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            keys.extend(
+                obj["Key"] for obj in page.get("Contents", []) if not obj["Key"].endswith("/")
+            )
+        return keys
+
+    def fetch_prefix(self, bucket, prefix, dest_dir):
+        """
+        prefix 아래 모든 객체를 dest_dir로 받습니다 (prefix를 뺀 상대 경로 유지).
+
+        Returns:
+            {key: local_path}
+        """
+        paths = {}
+        for key in self.list_keys(bucket, prefix):
+            relative = key[len(prefix):].lstrip("/")
+            # prefix 자체이거나 "/"로 끝나는 key는 S3 콘솔이 만드는 디렉터리 marker
+            if not relative or key.endswith("/"):
+                continue
+            local_path = os.path.join(dest_dir, relative)
+            self.fetch(bucket, key, local_path)
+            paths[key] = local_path
+        return paths
+
+
+if __name__ == "__main__":
+    import argparse
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="S3 prefix/key를 로컬 캐시로 동기화")
+    parser.add_argument("--bucket", default=DEFAULT_BUCKET)
+    parser.add_argument("--prefix", default=None)
+    parser.add_argument("--keys", nargs="*", default=[DEFAULT_KEY])
+    parser.add_argument("--dest", default="./data/s3")
+    parser.add_argument("--endpoint-url", default=None)
+    args = parser.parse_args()
+
+    fetcher = S3Fetcher(get_s3_client(args.endpoint_url))
+    if args.prefix is not None:
+        fetcher.fetch_prefix(args.bucket, args.prefix, args.dest)
+    else:
+        fetcher.fetch_many(args.bucket, args.keys, args.dest)
@@ -0,0 +1,228 @@
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+import faiss
+
+from utils.faiss_utils import (
+    create_faiss_index,
+    default_nlist,
+    load_faiss_index,
+    make_search_params,
+    prepare_queries,
+    save_faiss_index,
+    train_faiss_index,
+)
+
+SHARD_DIR = "./faiss/shards"
+GRANULARITY = {"month": "M", "quarter": "Q"}
+
+
+def shard_keys(dates, granularity="month"):
+    """
+    date 컬럼 -> shard key ("2023-03" / "2023Q1")
+    """
+    if granularity not in GRANULARITY:
+        raise ValueError(f"unknown granularity {granularity!r}, expected one of {list(GRANULARITY)}")
+    return pd.to_datetime(pd.Series(dates)).dt.to_period(GRANULARITY[granularity]).astype(str).to_numpy()
+
+
+def _fingerprint(ids, contents):
+    """
+    shard의 id 집합 + 행별 내용(텍스트 hash 또는 벡터). 같은 global_id로 다시 임베딩된 청크도 잡아냅니다.
+    """
+    digest = hashlib.sha256(np.ascontiguousarray(ids, dtype=np.int64).tobytes())
+    digest.update(np.ascontiguousarray(contents).tobytes())
+    return digest.hexdigest()
+
+
+def _manifest_path(shard_dir):
+    return os.path.join(shard_dir, "shards.json")
+
+
+def load_shard_manifest(shard_dir=SHARD_DIR):
+    path = _manifest_path(shard_dir)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def build_shards(
+    vectors,
+    ids,
+    dates,
+    shard_dir=SHARD_DIR,
+    granularity="month",
+    index_type="flat",
+    metric="l2",
+    rebuild_all=False,
+    hashes=None,
+    **index_kwargs,
+):
+    """
+    벡터를 date 기준 month / quarter shard로 나눠 shard별 인덱스를 만듭니다.
+
+    가장 최근 shard는 항상 다시 만들고, 이전 shard는 파일이 있고 id 집합 + 행별 내용(fingerprint)이
+    그대로면 건드리지 않습니다 (frozen). 과거 날짜 문서가 추가/삭제/수정된 shard만 다시 만듭니다.
+
+    Args:
+        vectors: ids 순서의 벡터 (memmap 가능)
+        ids: global_id
+        dates: ids 순서의 청크 date
+        hashes: ids 순서의 행별 텍스트 hash (EmbeddingCheckpoint의 .hashes.npy).
+            없으면 shard 벡터 자체를 hash 합니다 (벡터를 전부 읽음)
+
+    Returns:
+        shard manifest dict
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+    ids = np.asarray(ids, dtype=np.int64)
+    dates = pd.to_datetime(pd.Series(dates)).to_numpy()
+    keys = shard_keys(dates, granularity)
+    old = load_shard_manifest(shard_dir) or {}
+    old_shards = (
+        old.get("shards", {})
+        if old.get("granularity") == granularity
+        and old.get("index_type") == index_type
+        and old.get("metric") == metric
+        else {}
+    )
+
+    shards = {}
+    unique_keys = sorted(set(keys))
+    for key in unique_keys:
+        rows = np.flatnonzero(keys == key)
+        shard_ids = ids[rows]
+        index_path = os.path.join(shard_dir, f"{key}.index")
+        meta_path = os.path.join(shard_dir, f"{key}.meta.npz")
+        fingerprint = _fingerprint(shard_ids, vectors[rows] if hashes is None else hashes[rows])
+        period = pd.Period(key, freq=GRANULARITY[granularity])
+        entry = {
+            "index": index_path,
+            "meta": meta_path,
+            "start": str(period.start_time.date()),
+            "end": str(period.end_time.date()),
+            "n": int(len(rows)),
+            "fingerprint": fingerprint,
+        }
+        shards[key] = entry
+        previous = old_shards.get(key)
+        frozen = (
+            not rebuild_all
+            and key != unique_keys[-1]
+            and previous is not None
+            and previous["fingerprint"] == fingerprint
+            and os.path.exists(index_path)
+        )
+        if frozen:
+            print(f"[shard {key}] frozen ({len(rows)} vectors)")
+            continue
+
+        shard_vectors = np.ascontiguousarray(vectors[rows], dtype=np.float32)
+        kwargs = {"nlist": default_nlist(len(rows)), **index_kwargs}
+        index = create_faiss_index(shard_vectors.shape[1], index_type, metric=metric, **kwargs)
+        train_faiss_index(index, shard_vectors)
+        index.add_with_ids(shard_vectors, shard_ids)
+        save_faiss_index(index, index_path, index_type=index_type)
+        np.savez(meta_path, ids=shard_ids, dates=dates[rows].astype("datetime64[D]"))
+        print(f"[shard {key}] built ({len(rows)} vectors)")
+
+    for key in set(old_shards) - set(shards):
+        for path in (old_shards[key]["index"], old_shards[key]["meta"]):
+            if os.path.exists(path):
+                os.remove(path)
+
+    manifest = {
+        "granularity": granularity,
+        "index_type": index_type,
+        "metric": metric,
+        "shards": shards,
+    }
+    tmp_path = _manifest_path(shard_dir) + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, _manifest_path(shard_dir))
+    return manifest
+
+
+class ShardRouter:
+    """
+    날짜 범위와 겹치는 shard만 검색하고 top-k를 합칩니다.
+    범위에 일부만 걸치는 shard는 범위 안 날짜의 global_id로 IDSelector를 걸어 정확히 거릅니다.
+    shard 인덱스는 처음 쓸 때 (기본 mmap) 로딩해 캐시합니다.
+    """
+
+    def __init__(self, shard_dir=SHARD_DIR, mmap=True):
+        self.manifest = load_shard_manifest(shard_dir)
+        if self.manifest is None:
+            raise FileNotFoundError(f"no shard manifest in '{shard_dir}', run make_shards.py first")
+        self.shards = self.manifest["shards"]
+        self.descending = self.manifest["metric"] == "cosine"
+        self.mmap = mmap
+        self._indexes = {}
+        self._meta = {}
+
+    def _index(self, key):
+        if key not in self._indexes:
+            self._indexes[key] = load_faiss_index(self.shards[key]["index"], dim=0, mmap=self.mmap)
+        return self._indexes[key]
+
+    def _shard_meta(self, key):
+        if key not in self._meta:
+            with np.load(self.shards[key]["meta"]) as f:
+                self._meta[key] = (f["ids"], f["dates"])
+        return self._meta[key]
+
+    def route(self, start=None, end=None):
+        """
+        [start, end] (포함)와 겹치는 shard key 목록
+        """
+        start = pd.Timestamp(start) if start is not None else pd.Timestamp.min
+        end = pd.Timestamp(end) if end is not None else pd.Timestamp.max
+        return [
+            key
+            for key, shard in sorted(self.shards.items())
+            if pd.Timestamp(shard["start"]) <= end and pd.Timestamp(shard["end"]) >= start
+        ]
+
+    def _selector(self, key, start, end):
+        shard = self.shards[key]
+        if (start is None or pd.Timestamp(start) <= pd.Timestamp(shard["start"])) and (
+            end is None or pd.Timestamp(end) >= pd.Timestamp(shard["end"])
+        ):
+            return None
+        shard_ids, shard_dates = self._shard_meta(key)
+        mask = np.ones(len(shard_ids), dtype=bool)
+        if start is not None:
+            mask &= shard_dates >= np.datetime64(pd.Timestamp(start).date())
+        if end is not None:
+            mask &= shard_dates <= np.datetime64(pd.Timestamp(end).date())
+        selected = np.ascontiguousarray(shard_ids[mask])
+        return faiss.IDSelectorBatch(len(selected), faiss.swig_ptr(selected))
+
+    def search(self, queries, k=10, start=None, end=None):
+        """
+        Returns:
+            (distances, labels) - shape (nq, k), 가까운 순으로 합친 결과 (부족하면 label -1)
+        """
+        keys = self.route(start, end)
+        worst = -np.inf if self.descending else np.inf
+        all_d, all_i = [], []
+        for key in keys:
+            index = self._index(key)
+            query = prepare_queries(index, queries)
+            selector = self._selector(key, start, end)
+            params = make_search_params(index, selector) if selector is not None else None
+            distances, labels = index.search(query, k, params=params)
+            distances[labels < 0] = worst
+            all_d.append(distances)
+            all_i.append(labels)
+        if not all_d:
+            nq = len(np.atleast_2d(queries))
+            return np.full((nq, k), worst, dtype=np.float32), np.full((nq, k), -1, dtype=np.int64)
+        distances = np.concatenate(all_d, axis=1)
+        labels = np.concatenate(all_i, axis=1)
+        order = np.argsort(-distances if self.descending else distances, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(distances, order, axis=1), np.take_along_axis(labels, order, axis=1)